@@ -1,5 +1,5 @@
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -186,6 +186,55 @@ AWS_QUERYSTRING_AUTH = False
 # Dev (localhost)
 USE_X_ACCEL_REDIRECT = False         # prod’da True qilasiz
 X_ACCEL_REDIRECT_PREFIX = "/_protected/"
+# Bob o‘qish grant’i (sahifa URL’lari) necha sekund amal qiladi
+PAGE_GRANT_MAX_AGE = config("PAGE_GRANT_MAX_AGE", default=600, cast=int)
+# Sahifa rasmlarini yetkazish: proxy (page_image orqali) | cdn (nginx secure_link) | presigned (Spaces)
+# cdn/presigned faqat private bucket bilan: AWS_DEFAULT_ACL public yoki AWS_QUERYSTRING_AUTH=False bo‘lsa check xato beradi
+PAGE_DELIVERY = config("PAGE_DELIVERY", default="proxy")
+# cdn/presigned URL muddati (sec; 0 -> PAGE_GRANT_MAX_AGE)
+PAGE_URL_TTL = config("PAGE_URL_TTL", default=0, cast=int)
+# cdn: secure_link sirli kaliti va domeni (bo‘sh -> AWS_S3_CUSTOM_DOMAIN); IP’ga bog‘lash (mobil tarmoqda IP o‘zgarishi mumkin)
+PAGE_CDN_SECRET = config("PAGE_CDN_SECRET", default="")
+PAGE_CDN_DOMAIN = config("PAGE_CDN_DOMAIN", default="")
+PAGE_CDN_BIND_IP = config("PAGE_CDN_BIND_IP", default=False, cast=bool)
+# Manga boblari indeksi (prev/next/first/last) keshda necha sekund (Chapter save/delete’da baribir tozalanadi)
+CHAPTER_INDEX_CACHE_TTL = config("CHAPTER_INDEX_CACHE_TTL", default=3600, cast=int)
+# Foydalanuvchining manga bo‘yicha xaridlari (id to‘plami) keshda necha sekund (xarid bo‘lsa baribir tozalanadi)
+ENTITLEMENT_CACHE_TTL = config("ENTITLEMENT_CACHE_TTL", default=600, cast=int)
+
+# PDF worker: bitta job ichida render+encode processlari (1 = serial, 0 = CPU soni)
+PDF_RENDER_WORKERS = config("PDF_RENDER_WORKERS", default=1, cast=int)
+# PDF worker: Spaces’ga parallel upload threadlari
+PDF_UPLOAD_WORKERS = config("PDF_UPLOAD_WORKERS", default=4, cast=int)
+# PDF worker: LISTEN/NOTIFY bo‘lsa ham navbatni zaxira tekshirish oralig‘i (sec)
+PDF_JOBS_POLL_INTERVAL = config("PDF_JOBS_POLL_INTERVAL", default=60.0, cast=float)
+# PDF job lease: heartbeat shundan eski bo‘lsa worker o‘lgan deb hisoblanadi (sec)
+PDF_JOB_LEASE_SECONDS = config("PDF_JOB_LEASE_SECONDS", default=60.0, cast=float)
+# Sahifa variantlari (px): reader srcset orqali ekranga mosini oladi; asl eni (max_width) doim bor
+PAGE_RENDITION_WIDTHS = config("PAGE_RENDITION_WIDTHS", default="480,720,1080", cast=Csv(int))
+# split_long_pages: bo‘lakning maksimal bo‘yi (px; default pdf_render.CHUNK_HEIGHT); kesim shundan oldingi gutterda
+PDF_SPLIT_CHUNK_HEIGHT = config("PDF_SPLIT_CHUNK_HEIGHT", default=12000, cast=int)
+# Shundan katta (px) bitmap gorizontal bandlarda render qilinadi (0 -> bandlamaslik)
+PDF_RENDER_BAND_PIXELS = config("PDF_RENDER_BAND_PIXELS", default=8_000_000, cast=int)
+# PDF worker: RSS (MB, render processlari bilan) shundan oshsa job sahifa chegarasida
+# navbatga qaytadi va worker qayta ishga tushadi (0 -> cheklovsiz)
+PDF_WORKER_MAX_RSS_MB = config("PDF_WORKER_MAX_RSS_MB", default=0, cast=int)
+# Ishonchsiz PDF: render alohida (child) processda, rlimit’lar bilan — yiqilsa/osilsa faqat job FAILED
+# (opt-in: har job uchun spawn process narxi bor; begona PDF’lar qabul qilinsa yoqing)
+PDF_RENDER_ISOLATED = config("PDF_RENDER_ISOLATED", default=False, cast=bool)
+# ... job devor soati (sec), render process CPU vaqti (sec), xotira (RLIMIT_AS, MB); 0 -> cheklovsiz
+PDF_RENDER_TIMEOUT = config("PDF_RENDER_TIMEOUT", default=3600.0, cast=float)
+PDF_RENDER_CPU_SECONDS = config("PDF_RENDER_CPU_SECONDS", default=3600, cast=int)
+PDF_RENDER_MAX_MEMORY_MB = config("PDF_RENDER_MAX_MEMORY_MB", default=0, cast=int)
+# ... bitta job chiqaradigan jami piksel (oldindan taxmin + ish davomida); 0 -> cheklovsiz
+PDF_RENDER_MAX_PIXELS = config("PDF_RENDER_MAX_PIXELS", default=2_000_000_000, cast=int)
+# Adaptive WEBP quality (opt-in, encode ~40% sekinroq): sahifa uchun quality MIN..(job quality) oralig‘ida tanlanadi
+PDF_WEBP_ADAPTIVE = config("PDF_WEBP_ADAPTIVE", default=False, cast=bool)
+PDF_WEBP_MIN_QUALITY = config("PDF_WEBP_MIN_QUALITY", default=60, cast=int)
+# ... shu PSNR (dB) dan past tushmaydigan eng kichik quality (0 -> tekshirilmaydi; masalan 40)
+PDF_WEBP_TARGET_PSNR = config("PDF_WEBP_TARGET_PSNR", default=0.0, cast=float)
+# ... va megapiksel uchun bayt byudjeti (0 -> cheklovsiz)
+PDF_WEBP_MAX_BYTES_PER_MPX = config("PDF_WEBP_MAX_BYTES_PER_MPX", default=0, cast=int)
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
@@ -1,17 +1,22 @@
 # manga/admin.py
 import re
+from datetime import timedelta
 from django.utils import timezone
 from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
-from django.core.files.storage import default_storage
-from django.db.models import Max, Q
+from django.db.models import Count, Max, Q
 from django.shortcuts import render, redirect
 from django.urls import path, reverse
 from django.utils.html import format_html
 import tempfile
+import zipfile
+from django.core.files import File
 from django.db import transaction
 
-from manga.services.pdf_to_pages import render_pdf_to_pages
+from manga.services.chapter_index import invalidate_chapter_index
+from manga.services.job_notify import notify_pdf_jobs
+from manga.services.image_render import ARCHIVE_EXTENSIONS
+from manga.services.pdf_to_pages import discard_checkpoint_files, render_pdf_to_pages
 
 from .forms import ChapterPDFUploadForm, MultiPageUploadForm, ChapterAdminForm
 from .models import (
@@ -200,7 +205,57 @@ class MangaAdmin(OwnMixin, admin.ModelAdmin):
             kwargs["queryset"] = UserModel.objects.filter(userprofile__is_translator=True)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
-from django.db.models import Q, Max, OuterRef, Subquery
+from django.db.models import FloatField, IntegerField, Q, Max, OuterRef, Subquery
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
+
+
+PDF_TIMING_STAGES = ("download", "plan", "render", "encode", "store", "commit")
+
+
+def _pdf_worker_counters(hours: int = 24) -> str:
+    """
+    PDF worker hisoblagichlari (oxirgi N soatda tugagan job’lar timings’idan) + navbat holati.
+    Worker qutisini o‘lchash uchun: bet/s va vaqt qaysi bosqichga ketayotgani.
+    """
+    since = timezone.now() - timedelta(hours=hours)
+    rows = ChapterPDFJob.objects.filter(
+        status=ChapterPDFJob.STATUS_DONE, finished_at__gte=since
+    ).values_list("timings__wall", "timings__pdf_pages", "timings__outputs", "timings__stages")
+
+    jobs = pages = outputs = 0
+    wall = 0.0
+    stages = dict.fromkeys(PDF_TIMING_STAGES, 0.0)
+    for job_wall, job_pages, job_outputs, job_stages in rows:
+        jobs += 1
+        wall += float(job_wall or 0.0)
+        pages += int(job_pages or 0)
+        outputs += int(job_outputs or 0)
+        for stage, seconds in (job_stages or {}).items():
+            stages[stage] = stages.get(stage, 0.0) + float(seconds or 0.0)
+
+    queue = dict(
+        ChapterPDFJob.objects
+        .filter(status__in=[ChapterPDFJob.STATUS_PENDING, ChapterPDFJob.STATUS_PROCESSING])
+        .values_list("status")
+        .annotate(n=Count("id"))
+    )
+    text = (
+        f"PDF worker ({hours} soat): {jobs} job · {pages} bet → {outputs} WEBP · "
+        f"{wall / 60.0:.1f} daq ish vaqti"
+    )
+    if wall > 0:
+        spent = sum(stages.values()) or 1.0
+        text += f" · {pages / wall:.2f} bet/s · " + " · ".join(
+            f"{stage} {100.0 * seconds / spent:.0f}%" for stage, seconds in stages.items() if seconds
+        )
+    text += (
+        f" | navbat: {queue.get(ChapterPDFJob.STATUS_PENDING, 0)} PENDING, "
+        f"{queue.get(ChapterPDFJob.STATUS_PROCESSING, 0)} PROCESSING"
+    )
+    return text
+
+
 # ===== Chapter =====
 @admin.register(Chapter)
 class ChapterAdmin(OwnMixin, admin.ModelAdmin):
@@ -224,6 +279,7 @@ class ChapterAdmin(OwnMixin, admin.ModelAdmin):
     search_help_text = "Manga nomi / qo‘shimcha nomlari / slug bo‘yicha qidiring."
     list_per_page = 40
     list_editable = ("volume", "price_tanga")
+    actions = ("cancel_pdf_jobs",)
 
     # ================== QUERYSET (permissions + pdf annotate) ==================
     def get_queryset(self, request):
@@ -240,9 +296,24 @@ class ChapterAdmin(OwnMixin, admin.ModelAdmin):
             _pdf_job_status=Subquery(latest_job.values("status")[:1]),
             _pdf_job_progress=Subquery(latest_job.values("progress")[:1]),
             _pdf_job_total=Subquery(latest_job.values("total")[:1]),
+            _pdf_job_saved=Subquery(latest_job.values("bytes_saved")[:1]),
+            # JSON kalitlari matn sifatida olinib cast qilinadi (Postgres/SQLite bir xil ishlasin)
+            _pdf_job_wall=Subquery(
+                latest_job.annotate(v=Cast(KeyTextTransform("wall", "timings"), FloatField())).values("v")[:1]
+            ),
+            _pdf_job_pages=Subquery(
+                latest_job.annotate(v=Cast(KeyTextTransform("pdf_pages", "timings"), IntegerField())).values("v")[:1]
+            ),
+            _pdf_job_stages=Subquery(latest_job.values("timings__stages")[:1]),
         )
         return qs
 
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        if request.user.is_superuser:
+            extra_context["pdf_worker_counters"] = _pdf_worker_counters()
+        return super().changelist_view(request, extra_context=extra_context)
+
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
         if not request.user.is_superuser and "thanks" in form.base_fields:
@@ -294,9 +365,76 @@ class ChapterAdmin(OwnMixin, admin.ModelAdmin):
             "CANCELLED": "⛔ CANCELLED",
         }.get(str(status), str(status))
 
-        return f"{badge} ({prog}/{total})" if total else badge
+        text = f"{badge} ({prog}/{total})" if total else badge
+        saved = getattr(obj, "_pdf_job_saved", None) or 0
+        if saved > 0:
+            text += f" −{saved / (1024 * 1024):.1f} MB"
+
+        # bosqichlar vaqti: ustunda jami + bet/s, tafsiloti tooltip’da
+        wall = float(getattr(obj, "_pdf_job_wall", None) or 0.0)
+        if wall <= 0:
+            return text
+        pages = int(getattr(obj, "_pdf_job_pages", None) or 0)
+        stages = getattr(obj, "_pdf_job_stages", None) or {}
+        title = " · ".join(f"{s} {float(stages.get(s) or 0.0):.1f}s" for s in PDF_TIMING_STAGES)
+        return format_html(
+            '{} · <span title="{}">{}s · {} bet/s</span>',
+            text,
+            title,
+            f"{wall:.0f}",
+            f"{pages / wall:.2f}",
+        )
     pdf_status.short_description = "PDF Status"
 
+    # ================== ACTIONS ==================
+    @admin.action(description="⛔ PDF navbatni bekor qilish (PENDING/PROCESSING)")
+    def cancel_pdf_jobs(self, request, queryset):
+        """
+        PENDING job darhol CANCELLED (checkpoint fayllari + PDF o‘chiriladi).
+        PROCESSING job ham CANCELLED qilinadi — worker buni keyingi sahifa
+        chegarasida sezib to‘xtaydi va yuklagan fayllarini o‘zi o‘chiradi
+        (bob sahifalari o‘zgarmaydi).
+        """
+        now = timezone.now()
+        reason = f"Cancelled by {request.user.get_username()}."
+        to_cleanup = []
+        cancelled = 0
+
+        with transaction.atomic():
+            # lock: shu payt worker PENDING jobni olib ketmasin (u skip_locked bilan o‘tib ketadi)
+            jobs = list(
+                ChapterPDFJob.objects
+                .select_for_update()
+                .filter(
+                    chapter_id__in=queryset.values("pk"),
+                    status__in=[ChapterPDFJob.STATUS_PENDING, ChapterPDFJob.STATUS_PROCESSING],
+                )
+            )
+            for job in jobs:
+                fields = {"status": ChapterPDFJob.STATUS_CANCELLED, "finished_at": now, "error": reason}
+                if job.status == ChapterPDFJob.STATUS_PENDING:
+                    fields["checkpoint"] = {}
+                    to_cleanup.append(job)
+                ChapterPDFJob.objects.filter(pk=job.pk).update(**fields)
+                cancelled += 1
+
+            def _cleanup():
+                for job in to_cleanup:
+                    discard_checkpoint_files(job.checkpoint)
+                    try:
+                        # save=False: eski instance statusni qayta yozib yubormasin
+                        job.pdf.delete(save=False)
+                        ChapterPDFJob.objects.filter(pk=job.pk).update(pdf="")
+                    except Exception:
+                        pass
+
+            transaction.on_commit(_cleanup)
+
+        if cancelled:
+            messages.success(request, f"{cancelled} ta PDF job bekor qilindi ⛔")
+        else:
+            messages.info(request, "Bekor qilinadigan (PENDING/PROCESSING) PDF job topilmadi.")
+
     # Superuserga release_date ham ko‘rsatamiz (xohlasangiz)
     def get_list_display(self, request):
         base = list(self.list_display)
@@ -349,6 +487,7 @@ class ChapterAdmin(OwnMixin, admin.ModelAdmin):
             )
         if new_chapters:
             Chapter.objects.bulk_create(new_chapters)
+            invalidate_chapter_index(manga.id)  # bulk_create post_save bermaydi
 
         self.message_user(
             request,
@@ -408,22 +547,42 @@ class ChapterAdmin(OwnMixin, admin.ModelAdmin):
                     m = re.search(r"(\d+)", filename)
                     return int(m.group(1)) if m else 0
 
-                files = form.cleaned_data["images"]
-                if not isinstance(files, (list, tuple)):
-                    files = [files]
-                files = sorted(files, key=lambda f: extract_number(f.name))
+                if ChapterPDFJob.objects.filter(chapter=chapter, status__in=["PENDING", "PROCESSING"]).exists():
+                    messages.warning(request, "Bu bob uchun yuklash allaqachon navbatda yoki ishlovda.")
+                    return redirect("admin:manga_chapter_changelist")
 
-                existing_max = (
-                    Page.objects.filter(chapter=chapter)
-                    .aggregate(Max("page_number"))["page_number__max"]
-                    or 0
+                files = sorted(form.cleaned_data["images"], key=lambda f: extract_number(f.name))
+                # decode/WEBP/upload — worker’da (parallel, progress bilan); bu yerda faqat
+                # rasmlar tartib bo‘yicha bitta ZIP’ga (siqmasdan) yig‘iladi yoki arxivning o‘zi olinadi
+                with tempfile.TemporaryFile() as tmp:
+                    if len(files) == 1 and files[0].name.rsplit(".", 1)[-1].lower() in ARCHIVE_EXTENSIONS:
+                        source = files[0]
+                    else:
+                        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+                            for idx, f in enumerate(files, start=1):
+                                ext = f.name.rsplit(".", 1)[-1].lower()
+                                with zf.open(f"{idx:05d}.{ext}", "w", force_zip64=True) as dst:
+                                    for chunk in f.chunks():
+                                        dst.write(chunk)
+                        tmp.seek(0)
+                        source = File(tmp, name="pages.zip")
+
+                    job = ChapterPDFJob.objects.create(
+                        chapter=chapter,
+                        pdf=source,
+                        source=ChapterPDFJob.SOURCE_ARCHIVE,
+                        status="PENDING",
+                        progress=0,
+                        total=0,
+                        replace_existing=False,  # yangi sahifalar oxiriga qo‘shiladi
+                        quality=80,
+                        created_by=request.user,
+                    )
+                notify_pdf_jobs(job.pk)
+                messages.success(
+                    request,
+                    f"{len(files)} ta fayl qabul qilindi ✅ Navbatga qo‘yildi (fon rejimida WEBP qilinadi).",
                 )
-                new_pages = [
-                    Page(chapter=chapter, image=f, page_number=existing_max + idx + 1)
-                    for idx, f in enumerate(files)
-                ]
-                Page.objects.bulk_create(new_pages)
-                messages.success(request, f"{len(files)} ta sahifa yuklandi!")
                 return redirect("admin:manga_chapter_changelist")
         else:
             form = MultiPageUploadForm()
@@ -448,6 +607,8 @@ class ChapterAdmin(OwnMixin, admin.ModelAdmin):
 
         if request.method == "POST":
             form = ChapterPDFUploadForm(request.POST, request.FILES)
+            if not request.user.is_superuser:
+                form.fields.pop("priority", None)
             if form.is_valid():
                 f = form.cleaned_data["pdf"]
 
@@ -464,7 +625,7 @@ class ChapterAdmin(OwnMixin, admin.ModelAdmin):
                     messages.warning(request, "Bu bob uchun PDF allaqachon navbatda yoki ishlovda.")
                     return redirect("admin:manga_chapter_changelist")
 
-                ChapterPDFJob.objects.create(
+                job = ChapterPDFJob.objects.create(
                     chapter=chapter,
                     pdf=f,
                     status="PENDING",
@@ -474,13 +635,18 @@ class ChapterAdmin(OwnMixin, admin.ModelAdmin):
                     dpi=form.cleaned_data.get("dpi") or 144,
                     max_width=form.cleaned_data.get("max_width") or 1400,
                     quality=82,
+                    split_long_pages=form.cleaned_data.get("split_long_pages", False),
+                    priority=form.cleaned_data.get("priority") or ChapterPDFJob.PRIORITY_NORMAL,
                     created_by=request.user,
                 )
+                notify_pdf_jobs(job.pk)  # worker darhol uyg‘onadi (commit’dan keyin)
                 messages.success(request, "PDF qabul qilindi ✅ Navbatga qo‘yildi (fon rejimida WEBP qilinadi).")
                 return redirect("admin:manga_chapter_changelist")
 
         else:
             form = ChapterPDFUploadForm()
+            if not request.user.is_superuser:
+                form.fields.pop("priority", None)
 
         return render(request, "admin/upload_pdf.html", {"form": form, "chapter": chapter})
 
@@ -506,7 +672,7 @@ class IsWebPFilter(admin.SimpleListFilter):
 
 @admin.register(Page)
 class PageAdmin(admin.ModelAdmin):
-    list_display = ("chapter", "page_number", "image_size_mb")
+    list_display = ("chapter", "page_number", "image_dimensions", "image_size_mb")
     raw_id_fields = ("chapter",)
     ordering = ("-chapter__id", "-page_number")
     list_filter = (IsWebPFilter,)
@@ -538,23 +704,18 @@ class PageAdmin(admin.ModelAdmin):
             ).distinct()
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
-    @admin.display(description="Image Size (MB)")
+    @admin.display(description="Image Size (MB)", ordering="file_size")
     def image_size_mb(self, obj):
-        f = getattr(obj, "image", None)
-        if not f:
+        # ingest paytida yozilgan ustun — storage’ga (S3 HEAD) murojaat yo‘q
+        if not obj.image:
             return "No file"
+        if not obj.file_size:
+            return "N/A"  # eski qator: manage.py backfill_page_meta
+        return f"{obj.file_size / (1024 * 1024):.2f} MB"
 
-        try:
-            if not default_storage.exists(f.name):
-                return "No file"
-            size_bytes = f.size
-        except Exception:
-            try:
-                size_bytes = default_storage.size(f.name)
-            except Exception:
-                return "N/A"
-
-        return f"{size_bytes / (1024 * 1024):.2f} MB"
+    @admin.display(description="O‘lcham (px)")
+    def image_dimensions(self, obj):
+        return f"{obj.width}×{obj.height}" if obj.width and obj.height else "—"
 
 
 # ===== ChapterPurchase =====
@@ -7,4 +7,9 @@ class MangaConfig(AppConfig):
     verbose_name = "Manga Boshqaruvi"
 
     def ready(self):
-        pass
\ No newline at end of file
+        from django.core import checks
+
+        from . import receivers  # noqa: F401 — chapter index / xaridlar keshi invalidatsiyasi
+        from .services.page_delivery import check_page_delivery
+
+        checks.register(check_page_delivery, checks.Tags.security)
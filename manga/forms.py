@@ -1,6 +1,7 @@
 # manga/forms.py
 from django import forms
-from .models import Chapter
+from .models import Chapter, ChapterPDFJob
+from .services.image_render import ARCHIVE_EXTENSIONS, IMAGE_EXTENSIONS
 
 
 # ===== Multiple fayl input =====
@@ -39,9 +40,27 @@ class MultiPageUploadForm(forms.Form):
         error_messages={
             "required": "Kamida bitta rasm tanlang.",
         },
-        help_text="Bir vaqtning o'zida bir nechta rasm tanlashingiz mumkin.",
+        help_text=(
+            "Bir vaqtning o'zida bir nechta rasm tanlashingiz mumkin — yoki bitta ZIP/CBZ arxiv. "
+            "Sahifalar fon rejimida WEBP qilinadi."
+        ),
     )
 
+    def clean_images(self):
+        files = self.cleaned_data["images"]
+        if not isinstance(files, (list, tuple)):
+            files = [files]
+
+        def ext(f) -> str:
+            return f.name.rsplit(".", 1)[-1].lower() if "." in f.name else ""
+
+        bad = [f.name for f in files if ext(f) not in IMAGE_EXTENSIONS + ARCHIVE_EXTENSIONS]
+        if bad:
+            raise forms.ValidationError(f"Qo‘llab-quvvatlanmaydigan fayl: {', '.join(bad[:5])}")
+        if len(files) > 1 and any(ext(f) in ARCHIVE_EXTENSIONS for f in files):
+            raise forms.ValidationError("ZIP/CBZ arxivni alohida (yolg‘iz o‘zini) yuklang.")
+        return list(files)
+
 
 # ===== Bob yaratish uchun admin forma (bulk) =====
 class ChapterAdminForm(forms.ModelForm):
@@ -107,3 +126,16 @@ class ChapterPDFUploadForm(forms.Form):
         max_value=2200,
         help_text="Rasm maksimal eni (px). 1400 tavsiya.",
     )
+    split_long_pages = forms.BooleanField(
+        required=False,
+        initial=False,
+        help_text="Webtoon: uzun sahifalarni bo‘sh joylardan bir nechta rasmga bo‘lish",
+    )
+    # ✅ faqat superuser uchun (view boshqalarda maydonni olib tashlaydi)
+    priority = forms.TypedChoiceField(
+        required=False,
+        coerce=int,
+        choices=ChapterPDFJob.PRIORITY_CHOICES,
+        initial=ChapterPDFJob.PRIORITY_NORMAL,
+        help_text="Navbat ustuvorligi: yuqori — boshqa yuklovlardan oldin ishlanadi.",
+    )
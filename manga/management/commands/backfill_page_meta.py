@@ -0,0 +1,88 @@
+# python manage.py backfill_page_meta --workers 8
+"""
+Eski Page qatorlari uchun eni/bo‘yi/hajmi/content_hash’ni to‘ldiradi
+(yangi sahifalarda bular ingest paytida yoziladi — page_blobs.page_fields).
+
+Har sahifa fayli bir marta o‘qiladi (storage GET); S3 kechikishi uchun threadlarda.
+Qayta ishga tushirish xavfsiz: faqat hali to‘ldirilmagan qatorlar olinadi (id bo‘yicha keyset).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from PIL import Image
+
+from manga.models import Page
+from manga.services.page_blobs import content_hash, digest_from_name
+
+FIELDS = ("width", "height", "file_size", "content_hash")
+
+
+def _read_meta(storage, name: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Returns: (ustunlar, xatolik matni) — fayl yo‘q / rasm emas bo‘lsa (None, sabab)."""
+    try:
+        with storage.open(name, "rb") as f:
+            data = f.read()
+    except Exception as e:
+        return None, f"read failed: {e}"
+    try:
+        with Image.open(BytesIO(data)) as img:
+            width, height = img.size
+    except Exception as e:
+        return None, f"not an image: {e}"
+    return {
+        "width": int(width),
+        "height": int(height),
+        "file_size": len(data),
+        "content_hash": digest_from_name(name) or content_hash(data),
+    }, ""
+
+
+class Command(BaseCommand):
+    help = "Page.width/height/file_size/content_hash bo‘sh qatorlarni storage’dagi fayldan to‘ldiradi."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Bitta bulk_update’dagi sahifalar")
+        parser.add_argument("--workers", type=int, default=8, help="Storage’dan parallel o‘qish threadlari")
+        parser.add_argument("--limit", type=int, default=0, help="Ko‘pi bilan shuncha sahifa (0 -> hammasi)")
+
+    def handle(self, *args, **opts):
+        batch_size = max(1, int(opts["batch_size"]))
+        limit = max(0, int(opts["limit"]))
+        storage = Page._meta.get_field("image").storage
+
+        todo = (
+            Page.objects
+            .filter(Q(width=0) | Q(height=0) | Q(file_size=0) | Q(content_hash=""))
+            .exclude(image="")
+            .order_by("id")
+        )
+        updated = failed = 0
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=max(1, int(opts["workers"])), thread_name_prefix="page-meta") as pool:
+            while True:
+                size = batch_size if not limit else min(batch_size, limit - updated - failed)
+                if size <= 0:
+                    break
+                batch = list(todo.filter(id__gt=last_id).only("id", "image", *FIELDS)[:size])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                changed = []
+                for page, (meta, error) in zip(batch, pool.map(lambda p: _read_meta(storage, p.image.name), batch)):
+                    if meta is None:
+                        failed += 1
+                        self.stderr.write(f"Page #{page.pk} ({page.image.name}): {error}")
+                        continue
+                    for field, value in meta.items():
+                        setattr(page, field, value)
+                    changed.append(page)
+
+                Page.objects.bulk_update(changed, FIELDS)
+                updated += len(changed)
+                self.stdout.write(f"... {updated} updated, {failed} failed (last id={last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfill done: {updated} pages updated, {failed} failed."))
@@ -0,0 +1,92 @@
+# python manage.py bench_crop_detect path/to/file.pdf --repeat 5
+import tempfile
+import time
+from typing import List, Optional
+
+import pypdfium2 as pdfium
+from django.core.management.base import BaseCommand, CommandError
+
+from manga.services import pdf_render
+from manga.services.pdf_render import _content_bbox_np, _content_bbox_px, _preview_scale, _safe_close
+
+
+def _synthetic_pdf(path: str, pages: int) -> None:
+    """Oq marginli oddiy A4 sahifalar (PIL orqali)."""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for i in range(pages):
+        img = Image.new("RGB", (1240, 1754), "white")
+        draw = ImageDraw.Draw(img)
+        for k in range(30):
+            x = 140 + (k * 97 + i * 31) % 860
+            y = 120 + (k * 53 + i * 17) % 1450
+            draw.rectangle([x, y, x + 120, y + 90], fill=(40 + k * 5, 40, 40))
+        images.append(img)
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=150)
+
+
+class Command(BaseCommand):
+    help = "Margin aniqlash micro-benchmark: PIL (ImageChops/autocontrast/point) vs NumPy (bitmap bufer)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdf", nargs="?", help="PDF fayl (berilmasa sintetik PDF yaratiladi)")
+        parser.add_argument("--pages", type=int, default=20, help="Nechta sahifa o‘lchansin")
+        parser.add_argument("--repeat", type=int, default=5, help="Har sahifada necha marta takrorlansin")
+
+    def handle(self, *args, **opts):
+        if pdf_render.np is None:
+            raise CommandError("NumPy o‘rnatilmagan — taqqoslash uchun `pip install numpy` kerak.")
+
+        pdf_path: Optional[str] = opts["pdf"]
+        tmp = None
+        if not pdf_path:
+            tmp = tempfile.NamedTemporaryFile(suffix=".pdf")
+            _synthetic_pdf(tmp.name, max(1, int(opts["pages"])))
+            pdf_path = tmp.name
+
+        repeat = max(1, int(opts["repeat"]))
+        pil_times: List[float] = []
+        np_times: List[float] = []
+        mismatched = 0
+
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            count = min(len(pdf), max(1, int(opts["pages"])))
+            for i in range(count):
+                page = pdf[i]
+                try:
+                    w_units, _ = page.get_size()
+                    bmp = page.render(scale=_preview_scale(w_units))
+                finally:
+                    _safe_close(page)
+
+                try:
+                    # Eski yo‘l: bitmap -> PIL RGB -> difference/autocontrast/point
+                    t0 = time.perf_counter()
+                    for _ in range(repeat):
+                        bbox_pil = _content_bbox_px(bmp.to_pil().convert("RGB"))
+                    pil_times.append((time.perf_counter() - t0) / repeat)
+
+                    # Yangi yo‘l: bufer ustida luma + max reduksiyalar
+                    t0 = time.perf_counter()
+                    for _ in range(repeat):
+                        bbox_np = _content_bbox_np(bmp.to_numpy())
+                    np_times.append((time.perf_counter() - t0) / repeat)
+                finally:
+                    _safe_close(bmp)
+
+                # step=1 da ikkala detektor aynan bir xil bbox berishi kerak
+                if bbox_pil != bbox_np:
+                    mismatched += 1
+        finally:
+            _safe_close(pdf)
+            if tmp is not None:
+                tmp.close()
+
+        pil_ms = 1000.0 * sum(pil_times) / len(pil_times)
+        np_ms = 1000.0 * sum(np_times) / len(np_times)
+        self.stdout.write(f"pages={len(pil_times)} repeat={repeat}")
+        self.stdout.write(f"PIL   : {pil_ms:8.2f} ms/page")
+        self.stdout.write(f"NumPy : {np_ms:8.2f} ms/page")
+        self.stdout.write(self.style.SUCCESS(f"speedup x{(pil_ms / np_ms) if np_ms else 0:.1f}, mismatched={mismatched}"))
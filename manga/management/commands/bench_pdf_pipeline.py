@@ -0,0 +1,375 @@
+# python manage.py bench_pdf_pipeline --json before.json
+# python manage.py bench_pdf_pipeline --json after.json --baseline before.json
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from importlib import metadata
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageFilter
+
+from manga.models import Chapter, Manga
+from manga.services import pdf_render
+from manga.services.pdf_render import rss_mb
+from manga.services.pdf_to_pages import render_pdf_to_pages
+
+RESULT_VERSION = 1
+STAGES = ("plan", "render", "encode", "store", "commit")
+
+
+# -------------------------
+# Sintetik PDF’lar (seed’li — commit’lar orasida aynan bir xil hujjat)
+# -------------------------
+def _manga_page(rng: random.Random, size=(1240, 1754)) -> Image.Image:
+    """A4 manga (150 dpi, kulrang): oq margin, panel ramkalari, pufakchalar, shtrixlar."""
+    w, h = size
+    img = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(img)
+    y = 110
+    while y < h - 260:
+        row_h = rng.randint(300, 520)
+        x = 90
+        while x < w - 250:
+            pw = rng.randint(260, 640)
+            box = [x, y, min(x + pw, w - 90), min(y + row_h, h - 110)]
+            draw.rectangle(box, outline=0, width=5)
+            for _ in range(rng.randint(20, 60)):
+                x0, y0 = rng.randint(box[0], box[2]), rng.randint(box[1], box[3])
+                x1, y1 = rng.randint(box[0], box[2]), rng.randint(box[1], box[3])
+                draw.line([x0, y0, x1, y1], fill=rng.randint(0, 160), width=rng.randint(1, 4))
+            bx, by = rng.randint(box[0], max(box[0], box[2] - 160)), rng.randint(box[1], max(box[1], box[3] - 90))
+            draw.ellipse([bx, by, bx + 160, by + 90], fill=255, outline=0, width=3)
+            draw.text((bx + 30, by + 38), "synthetic", fill=0)
+            x = box[2] + 30
+        y += row_h + 30
+    return img
+
+
+def _webtoon_page(rng: random.Random, size=(800, 16000)) -> Image.Image:
+    """Ultra-uzun strip: rangli panellar oq gutterlar bilan (split_long_pages uchun)."""
+    w, h = size
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    y = rng.randint(200, 600)
+    while y < h - 400:
+        ph = rng.randint(700, 1600)
+        base = tuple(rng.randint(60, 220) for _ in range(3))
+        draw.rectangle([0, y, w, min(y + ph, h - 200)], fill=base)
+        for _ in range(rng.randint(30, 80)):
+            x0, y0 = rng.randint(0, w), rng.randint(y, y + ph)
+            r = rng.randint(10, 120)
+            draw.ellipse([x0 - r, y0 - r, x0 + r, y0 + r], fill=tuple(rng.randint(0, 255) for _ in range(3)))
+        y += ph + rng.randint(150, 600)
+    return img.filter(ImageFilter.GaussianBlur(1))
+
+
+def _photo_page(rng: random.Random, size=(2480, 3508)) -> Image.Image:
+    """Rasmga boy sahifa (300 dpi): gradient + shovqin — encode uchun eng og‘ir holat."""
+    w, h = size
+    seed = rng.randint(0, 255)
+    bands = [
+        Image.linear_gradient("L").resize(size).point(lambda v, s=seed * k: (v + s) % 256)
+        for k in (1, 2, 3)
+    ]
+    base = Image.merge("RGB", bands)
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    return Image.blend(base, noise, 0.35).filter(ImageFilter.GaussianBlur(1.5))
+
+
+def _raster_pdf(path: str, pages: List[Image.Image], resolution: float) -> None:
+    pages[0].save(path, save_all=True, append_images=pages[1:], resolution=resolution)
+
+
+def _vector_stream(rng: random.Random, w: float, h: float) -> bytes:
+    """Minglab egri chiziq / to‘ldirilgan shakl / matn — rastrsiz, pdfium uchun og‘ir sahifa."""
+    ops = ["1 J 1 j"]
+    for _ in range(900):
+        pts = " ".join(f"{rng.uniform(30, w - 30):.1f} {rng.uniform(30, h - 30):.1f}" for _ in range(4))
+        x, y, x1, y1, x2, y2, x3, y3 = pts.split()
+        ops.append(f"{rng.random():.2f} G {rng.uniform(0.2, 3):.1f} w {x} {y} m {x1} {y1} {x2} {y2} {x3} {y3} c S")
+    for _ in range(250):
+        ops.append(
+            f"{rng.random():.2f} {rng.random():.2f} {rng.random():.2f} rg "
+            f"{rng.uniform(30, w - 90):.1f} {rng.uniform(30, h - 90):.1f} {rng.uniform(5, 60):.1f} {rng.uniform(5, 60):.1f} re f"
+        )
+    ops.append("0 g BT /F1 9 Tf")
+    for i in range(60):
+        ops.append(f"1 0 0 1 {rng.uniform(40, 120):.1f} {h - 40 - i * 12:.1f} Tm (vector benchmark line {i}) Tj")
+    ops.append("ET")
+    return "\n".join(ops).encode("ascii")
+
+
+def _vector_pdf(path: str, rng: random.Random, pages: int, size=(595.0, 842.0)) -> None:
+    """Minimal PDF writer: catalog, pages, Helvetica, har sahifaga Flate content stream."""
+    w, h = size
+    objects: List[bytes] = [b"", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        data = zlib.compress(_vector_stream(rng, w, h))
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(data) + data + b"\nendstream")
+        content_no = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (int(w), int(h), content_no)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % pages
+
+    out = bytearray(b"%PDF-1.7\n")
+    offsets = []
+    for no, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % no + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+# shape -> (default sahifalar, split_long_pages, generator)
+SHAPES = {
+    "a4": (12, False, lambda path, rng, n: _raster_pdf(path, [_manga_page(rng) for _ in range(n)], 150)),
+    "webtoon": (3, True, lambda path, rng, n: _raster_pdf(path, [_webtoon_page(rng) for _ in range(n)], 96)),
+    "image": (6, False, lambda path, rng, n: _raster_pdf(path, [_photo_page(rng) for _ in range(n)], 300)),
+    "vector": (12, False, lambda path, rng, n: _vector_pdf(path, rng, n)),
+}
+
+
+class _RssSampler(threading.Thread):
+    """Run davomida RSS (render processlari bilan) eng yuqori qiymati."""
+
+    def __init__(self, interval: float = 0.02):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0.0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.peak = max(self.peak, rss_mb() or 0.0)
+            self._done.wait(self.interval)
+
+    def stop(self) -> float:
+        self._done.set()
+        self.join()
+        self.peak = max(self.peak, rss_mb() or 0.0)
+        return self.peak
+
+
+def _git_revision() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=str(settings.BASE_DIR),
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+        return out.stdout.strip() if out.returncode == 0 else ""
+    except Exception:
+        return ""
+
+
+def _version(dist: str) -> str:
+    try:
+        return metadata.version(dist)
+    except metadata.PackageNotFoundError:
+        return ""
+
+
+def _pct(new: float, old: float) -> str:
+    return f"{100.0 * (new - old) / old:+.1f}%" if old else "n/a"
+
+
+class Command(BaseCommand):
+    help = (
+        "PDF pipeline benchmark: sintetik PDF’lar (a4, webtoon, image, vector) -> render_pdf_to_pages "
+        "(vaqtinchalik lokal storage, DB o‘zgarishlari rollback). pages/s, bosqich vaqtlari, peak RSS, baytlar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shapes", default=",".join(SHAPES), help=f"Vergul bilan: {', '.join(SHAPES)}")
+        parser.add_argument("--pages", type=int, default=0, help="Har shakl uchun sahifalar (0 -> shaklning default’i)")
+        parser.add_argument("--repeat", type=int, default=3, help="Har shakl necha marta (median olinadi)")
+        parser.add_argument("--seed", type=int, default=1, help="Sintetik hujjatlar seed’i")
+        parser.add_argument(
+            "--render-workers",
+            type=int,
+            default=getattr(settings, "PDF_RENDER_WORKERS", 1),
+            help="render_pdf_to_pages workers (1 = serial, 0 = CPU soni)",
+        )
+        parser.add_argument("--upload-workers", type=int, default=getattr(settings, "PDF_UPLOAD_WORKERS", 4))
+        parser.add_argument("--dpi", type=int, default=144)
+        parser.add_argument("--max-width", type=int, default=1400)
+        parser.add_argument("--quality", type=int, default=82)
+        parser.add_argument("--json", dest="json_path", help="Natijani JSON faylga yozish (commit’lar orasida taqqoslash uchun)")
+        parser.add_argument("--baseline", help="Oldingi --json natijasi: farqlarni ko‘rsatadi")
+
+    def handle(self, *args, **opts):
+        shapes = [s.strip() for s in str(opts["shapes"]).split(",") if s.strip()]
+        unknown = [s for s in shapes if s not in SHAPES]
+        if unknown:
+            raise CommandError(f"Noma’lum shakl: {', '.join(unknown)} (bor: {', '.join(SHAPES)})")
+
+        baseline = None
+        if opts["baseline"]:
+            with open(opts["baseline"]) as f:
+                baseline = json.load(f)
+
+        repeat = max(1, int(opts["repeat"]))
+        params = {
+            "repeat": repeat,
+            "seed": int(opts["seed"]),
+            "render_workers": int(opts["render_workers"]),
+            "upload_workers": max(1, int(opts["upload_workers"])),
+            "dpi": int(opts["dpi"]),
+            "max_width": int(opts["max_width"]),
+            "quality": int(opts["quality"]),
+        }
+
+        results: Dict[str, Any] = {}
+        with tempfile.TemporaryDirectory(prefix="bench-pdf-") as tmp:
+            for shape in shapes:
+                default_pages, split, generate = SHAPES[shape]
+                pages = int(opts["pages"]) or default_pages
+                pdf_path = os.path.join(tmp, f"{shape}.pdf")
+                self.stdout.write(f"[{shape}] generating {pages} pages...")
+                generate(pdf_path, random.Random(f"{params['seed']}:{shape}"), pages)
+
+                runs = [self._run(pdf_path, split=split, params=params) for _ in range(repeat)]
+                results[shape] = self._summarize(shape, pages, split, os.path.getsize(pdf_path), runs)
+                self._print_result(results[shape])
+
+        report = {
+            "version": RESULT_VERSION,
+            "created_at": timezone.now().isoformat(),
+            "git": _git_revision(),
+            "env": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "pypdfium2": _version("pypdfium2"),
+                "pillow": _version("Pillow"),
+                "numpy": _version("numpy") if pdf_render.np is not None else "",
+            },
+            "params": params,
+            "results": results,
+        }
+
+        if opts["json_path"]:
+            with open(opts["json_path"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Saved: {opts['json_path']}")
+
+        if baseline is not None:
+            self._compare(report, baseline)
+
+    def _run(self, pdf_path: str, *, split: bool, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Bitta o‘lchov: toza storage, vaqtinchalik bob; DB o‘zgarishlari rollback qilinadi."""
+        stats: Dict[str, Any] = {}
+        with tempfile.TemporaryDirectory(prefix="bench-media-") as media, transaction.atomic():
+            # bulk_create: save()/signal’lar (katalog keshi) ishlamaydi
+            manga = Manga.objects.bulk_create([
+                Manga(title="bench", slug=f"bench-{uuid.uuid4().hex}", author="bench", description="bench")
+            ])[0]
+            chapter = Chapter.objects.bulk_create([Chapter(manga=manga, chapter_number=1)])[0]
+
+            sampler = _RssSampler()
+            rss_start = rss_mb() or 0.0
+            sampler.start()
+            t0 = time.perf_counter()
+            try:
+                created, _ = render_pdf_to_pages(
+                    chapter,
+                    pdf_path,
+                    dpi=params["dpi"],
+                    max_width=params["max_width"],
+                    quality=params["quality"],
+                    split_long_pages=split,
+                    workers=params["render_workers"],
+                    upload_workers=params["upload_workers"],
+                    stats=stats,
+                    storage=FileSystemStorage(location=media),
+                )
+                wall = time.perf_counter() - t0
+            finally:
+                peak = sampler.stop()
+                transaction.set_rollback(True)
+
+        return {
+            "wall_s": round(wall, 3),
+            "outputs": created,
+            "peak_rss_mb": round(peak, 1),
+            "rss_start_mb": round(rss_start, 1),
+            "bytes_written": int(stats.get("bytes_written", 0)),
+            "bytes_saved": int(stats.get("bytes_saved", 0)),
+            "timings": {s: round(v, 3) for s, v in stats.get("timings", {}).items()},
+        }
+
+    def _summarize(self, shape: str, pages: int, split: bool, pdf_bytes: int, runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        wall = statistics.median(r["wall_s"] for r in runs)
+        return {
+            "shape": shape,
+            "pages": pages,
+            "split_long_pages": split,
+            "pdf_bytes": pdf_bytes,
+            "outputs": runs[0]["outputs"],
+            "wall_s": round(wall, 3),
+            "pages_per_s": round(pages / wall, 3) if wall else 0.0,
+            # bosqichlar: plan/render/encode — processlar yig‘indisi, store — upload threadlari yig‘indisi
+            "timings": {s: round(statistics.median(r["timings"].get(s, 0.0) for r in runs), 3) for s in STAGES},
+            "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+            "bytes_written": runs[0]["bytes_written"],
+            "bytes_saved": runs[0]["bytes_saved"],
+            "runs": runs,
+        }
+
+    def _print_result(self, res: Dict[str, Any]):
+        stages = " ".join(f"{s}={res['timings'][s]:.2f}s" for s in STAGES)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"[{res['shape']}] {res['pages']} pages -> {res['outputs']} outputs: "
+                f"{res['pages_per_s']:.2f} pages/s (wall {res['wall_s']:.2f}s)"
+            )
+        )
+        self.stdout.write(f"    {stages}")
+        self.stdout.write(
+            f"    peak RSS {res['peak_rss_mb']:.0f} MB, written {res['bytes_written'] / 1e6:.2f} MB, "
+            f"saved {res['bytes_saved'] / 1e6:.2f} MB"
+        )
+
+    def _compare(self, report: Dict[str, Any], baseline: Dict[str, Any]):
+        old_results = baseline.get("results", {})
+        self.stdout.write(f"\nvs baseline {baseline.get('git') or '?'} ({baseline.get('created_at', '')}):")
+        if baseline.get("params") != report["params"]:
+            self.stdout.write(self.style.WARNING("    params differ — compare with care"))
+        for shape, new in report["results"].items():
+            old: Optional[Dict[str, Any]] = old_results.get(shape)
+            if not old:
+                self.stdout.write(f"[{shape}] no baseline")
+                continue
+            if old.get("pages") != new["pages"]:
+                self.stdout.write(self.style.WARNING(f"[{shape}] page count differs ({old.get('pages')} vs {new['pages']})"))
+            self.stdout.write(
+                f"[{shape}] pages/s {_pct(new['pages_per_s'], old.get('pages_per_s', 0))}, "
+                f"peak RSS {_pct(new['peak_rss_mb'], old.get('peak_rss_mb', 0))}, "
+                f"bytes {_pct(new['bytes_written'], old.get('bytes_written', 0))}"
+            )
+            old_t = old.get("timings", {})
+            self.stdout.write("    " + " ".join(f"{s} {_pct(new['timings'][s], old_t.get(s, 0))}" for s in STAGES))
@@ -1,21 +1,46 @@
 # python manage.py process_pdf_jobs --sleep 1
+# python manage.py process_pdf_jobs --concurrency 3   (supervisor + 3 ta worker process)
 
 # manga/management/commands/pdf_worker.py
+import multiprocessing
+import multiprocessing.connection
 import os
+import signal
+import socket
 import tempfile
+import threading
 import time
 import traceback
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import timedelta
-from typing import Optional, Tuple, Any
+from typing import Any, Dict, Optional, Tuple
 
+from django.conf import settings
 from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connections, transaction
+from django.db.models import Count, DateTimeField, F, IntegerField, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from manga.models import ChapterPDFJob
-from manga.services.pdf_to_pages import render_pdf_to_pages
+from manga.services.job_notify import JobWakeup, notify_pdf_jobs
+from manga.services.pdf_to_pages import (
+    RenderCancelled,
+    RenderInterrupted,
+    RenderLimitExceeded,
+    discard_checkpoint_files,
+    render_pdf_to_pages,
+)
+from manga.services.pdf_render import rss_mb
+
+# Bekor qilish sahifa chegarasida ko‘pi bilan shuncha sekundda seziladi (heartbeat bilan birga)
+CANCEL_CHECK_SEC = 3.0
+# RSS chegarasidan oshgan worker shu kod bilan chiqadi — supervisor (yoki systemd
+# Restart=always) uni yiqilish emas, qayta ishga tushirish deb biladi
+RSS_RECYCLE_EXIT = 75
+# job.timings["stages"] kalitlari (download — PDF’ni storage’dan olish)
+TIMING_STAGES = ("download", "plan", "render", "encode", "store", "commit")
 
 
 # -------------------------
@@ -30,7 +55,7 @@ def _get_local_pdf_path(job: ChapterPDFJob) -> Tuple[str, bool]:
     try:
         return job.pdf.path, False
     except Exception:
-        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+        fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(job.pdf.name)[1] or ".pdf")
         with os.fdopen(fd, "wb") as out:
             with default_storage.open(job.pdf.name, "rb") as src:
                 for chunk in iter(lambda: src.read(1024 * 1024), b""):
@@ -38,6 +63,65 @@ def _get_local_pdf_path(job: ChapterPDFJob) -> Tuple[str, bool]:
         return tmp_path, True
 
 
+def _worker_id(pid: Optional[int] = None) -> str:
+    """Lease egasi: host:pid (supervisor child’ning id’sini pid orqali biladi)."""
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+
+def _requeue_job(
+    pk: int,
+    reason: str,
+    *,
+    worker_id: Optional[str] = None,
+    timings: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    PROCESSING jobni PENDING’ga qaytaradi (boshqa worker qayta oladi).
+    progress/checkpoint saqlanadi — keyingi ishga tushish davom ettiradi.
+    worker_id berilsa — faqat lease hali shu workerda bo‘lsa.
+    timings berilsa — shu urinishning vaqtlari bilan yangilanadi (keyingisi ustiga qo‘shadi).
+    """
+    qs = ChapterPDFJob.objects.filter(pk=pk, status=ChapterPDFJob.STATUS_PROCESSING)
+    if worker_id is not None:
+        qs = qs.filter(worker_id=worker_id)
+    extra = {"timings": timings} if timings is not None else {}
+    updated = qs.update(
+        status=ChapterPDFJob.STATUS_PENDING,
+        error=reason,
+        started_at=None,
+        finished_at=None,
+        worker_id="",
+        heartbeat_at=None,
+        **extra,
+    )
+    if updated:
+        notify_pdf_jobs(pk)
+    return updated
+
+
+def _job_timings(prev: Any, stats: Dict[str, Any], *, download: float, wall: float) -> Dict[str, Any]:
+    """
+    job.timings + shu urinish (render_pdf_to_pages stats’idagi timings/pages).
+    Resume’da sahifalar index bo‘yicha birlashadi (qayta render qilingani yangisi bilan).
+    """
+    prev = prev if isinstance(prev, dict) else {}
+    stages = {s: float((prev.get("stages") or {}).get(s, 0.0)) for s in TIMING_STAGES}
+    stages["download"] += download
+    for stage, seconds in (stats.get("timings") or {}).items():
+        stages[stage] = stages.get(stage, 0.0) + float(seconds)
+
+    pages = {int(p[0]): list(p) for p in prev.get("pages") or ()}
+    pages.update((int(p[0]), list(p)) for p in stats.get("pages") or ())
+    return {
+        "stages": {stage: round(seconds, 3) for stage, seconds in stages.items()},
+        "wall": round(float(prev.get("wall", 0.0)) + wall, 3),
+        "attempts": int(prev.get("attempts", 0)) + 1,
+        "pdf_pages": len(pages),
+        "outputs": sum(int(p[4]) for p in pages.values()),
+        "pages": [pages[i] for i in sorted(pages)],
+    }
+
+
 @dataclass
 class ProgressThrottler:
     """
@@ -63,6 +147,120 @@ class ProgressThrottler:
         self._last_ts = time.monotonic()
 
 
+class LeaseLost(RenderInterrupted):
+    """Job endi bu workerga tegishli emas (lease eskirib boshqa worker oldi)."""
+
+
+@dataclass
+class JobLease:
+    """
+    PROCESSING job egaligi. beat() progress callback/sahifa chegarasida chaqiriladi,
+    DB’ga esa har min(lease_seconds/4, CANCEL_CHECK_SEC) da bir marta shartli UPDATE boradi:
+    (pk, worker_id, PROCESSING) topilmasa — admin bekor qilgan (RenderCancelled)
+    yoki job boshqa workerga o‘tgan (LeaseLost).
+
+    start() — fon thread heartbeat’i (har lease_seconds/4): bitta uzun sahifa/oraliq
+    future.result()’da kutib qolsa ham lease tugamaydi. Thread exception ko‘tarmaydi —
+    lease yo‘qolganini belgilaydi, asosiy thread keyingi beat()’da bilib oladi.
+    """
+    pk: int
+    worker_id: str
+    lease_seconds: float
+    lost: bool = False
+    cancelled: bool = False
+    _last_beat: float = 0.0
+    _beat_failed: bool = False
+    _stop_event: Optional[threading.Event] = field(default=None, repr=False)
+    _thread: Optional[threading.Thread] = field(default=None, repr=False)
+
+    def owned(self):
+        return ChapterPDFJob.objects.filter(
+            pk=self.pk,
+            worker_id=self.worker_id,
+            status=ChapterPDFJob.STATUS_PROCESSING,
+        )
+
+    def raise_lost(self):
+        if not self.lost:
+            self.lost = True
+            self.cancelled = ChapterPDFJob.objects.filter(
+                pk=self.pk,
+                worker_id=self.worker_id,
+                status=ChapterPDFJob.STATUS_CANCELLED,
+            ).exists()
+        if self.cancelled:
+            raise RenderCancelled("Job cancelled.")
+        raise LeaseLost("Job lease lost.")
+
+    def start(self) -> None:
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._beat_loop, name=f"job-lease-{self.pk}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def _beat_loop(self) -> None:
+        interval = max(0.05, self.lease_seconds / 4.0)
+        try:
+            while not self._stop_event.wait(interval):
+                try:
+                    if not self.owned().update(heartbeat_at=timezone.now()):
+                        self._beat_failed = True
+                        return
+                except Exception:
+                    # DB vaqtincha yo‘q: keyingi urinish (lease tugasa stale requeue hal qiladi)
+                    connections.close_all()
+        finally:
+            connections.close_all()  # shu thread’ning ulanishi
+
+    def beat(self, *, force: bool = False) -> None:
+        if self.lost or self._beat_failed:
+            self.raise_lost()
+        now = time.monotonic()
+        if not force and (now - self._last_beat) < min(self.lease_seconds / 4.0, CANCEL_CHECK_SEC):
+            return
+        self._last_beat = now
+        if not self.owned().update(heartbeat_at=timezone.now()):
+            self.raise_lost()
+
+
+@dataclass
+class CheckpointWriter:
+    """
+    render_pdf_to_pages checkpoint_cb: har sahifada chaqiriladi, DB’ga esa
+    min_interval_sec’da bir marta yoziladi. Bo‘sh holat ({} — commit) darhol yoziladi.
+    Lease berilsa yozuv shartli: job boshqa workerga o‘tgan bo‘lsa LeaseLost,
+    bekor qilingan bo‘lsa RenderCancelled (commit tranzaksiyasi ichida bo‘lsa —
+    sahifalar commit qilinmaydi).
+    """
+    pk: int
+    lease: Optional[JobLease] = None
+    min_interval_sec: float = 2.0
+    state: Optional[dict] = None  # oxirgi ma’lum holat (bekor qilinganda tozalash uchun)
+    _latest: Optional[dict] = None
+    _last_ts: float = 0.0
+
+    def __call__(self, state: dict) -> None:
+        self.state = state
+        self._latest = state
+        if not state or (time.monotonic() - self._last_ts) >= self.min_interval_sec:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._latest is None:
+            return
+        qs = self.lease.owned() if self.lease else ChapterPDFJob.objects.filter(pk=self.pk)
+        updated = qs.update(checkpoint=self._latest)
+        self._latest = None
+        self._last_ts = time.monotonic()
+        if self.lease and not updated:
+            self.lease.raise_lost()
+
+
 # -------------------------
 # Command
 # -------------------------
@@ -71,32 +269,148 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("--once", action="store_true", help="Faqat bitta job ishlatib to‘xtaydi")
-        parser.add_argument("--sleep", type=float, default=2.0, help="Navbat bo‘sh bo‘lsa kutish (sec)")
+        parser.add_argument("--sleep", type=float, default=2.0, help="Navbat bo‘sh bo‘lsa kutish (sec, LISTEN ishlamasa)")
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=getattr(settings, "PDF_JOBS_POLL_INTERVAL", 60.0),
+            help="LISTEN/NOTIFY ishlasa ham navbatni zaxira tekshirish oralig‘i (sec).",
+        )
         parser.add_argument(
             "--requeue-stale-minutes",
             type=int,
             default=0,
-            help="PROCESSING holatida uzoq qolgan job’larni PENDING’ga qaytarish (0 = o‘chirilgan).",
+            help="Heartbeat’i yo‘q (eski workerlar olgan) PROCESSING job’larni N daqiqadan keyin qaytarish (0 = o‘chirilgan).",
+        )
+        parser.add_argument(
+            "--lease-seconds",
+            type=float,
+            default=getattr(settings, "PDF_JOB_LEASE_SECONDS", 60.0),
+            help="Heartbeat shu muddatdan eski bo‘lsa job egasi o‘lgan hisoblanadi va PENDING’ga qaytariladi.",
+        )
+        parser.add_argument(
+            "--render-workers",
+            type=int,
+            default=getattr(settings, "PDF_RENDER_WORKERS", 1),
+            help="Bitta job ichida render+encode uchun processlar soni (1 = serial, 0 = CPU soni).",
+        )
+        parser.add_argument(
+            "--upload-workers",
+            type=int,
+            default=getattr(settings, "PDF_UPLOAD_WORKERS", 4),
+            help="Storage’ga (S3/Spaces) parallel yuklash threadlari soni.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="N > 1 bo‘lsa supervisor rejimi: N ta worker process (yiqilganini qayta ishga tushiradi).",
+        )
+        parser.add_argument(
+            "--shutdown-timeout",
+            type=float,
+            default=60.0,
+            help="SIGTERM’dan keyin workerlar sahifa chegarasida to‘xtashini kutish (sec).",
+        )
+        parser.add_argument(
+            "--max-rss-mb",
+            type=int,
+            default=getattr(settings, "PDF_WORKER_MAX_RSS_MB", 0),
+            help=(
+                "Worker RSS (render processlari bilan, MB) shundan oshsa job sahifa chegarasida "
+                f"PENDING’ga qaytadi va worker {RSS_RECYCLE_EXIT} kod bilan chiqadi (0 = cheklovsiz)."
+            ),
         )
 
     def handle(self, *args, **opts):
         once: bool = bool(opts["once"])
         sleep_s: float = float(opts["sleep"])
         stale_min: int = int(opts["requeue_stale_minutes"])
+        concurrency: int = max(1, int(opts["concurrency"]))
+        self.render_workers: int = int(opts["render_workers"])
+        self.upload_workers: int = max(1, int(opts["upload_workers"]))
+        self.poll_interval: float = max(sleep_s, float(opts["poll_interval"]))
+        self.lease_seconds: float = max(5.0, float(opts["lease_seconds"]))
+        self.max_rss_mb: int = max(0, int(opts["max_rss_mb"] or 0))
+
+        if concurrency > 1:
+            self._supervise(
+                concurrency,
+                once=once,
+                sleep_s=sleep_s,
+                stale_min=stale_min,
+                shutdown_timeout=float(opts["shutdown_timeout"]),
+            )
+            return
 
         self.stdout.write(self.style.SUCCESS("PDF worker started... (CTRL+C to stop)"))
+        self._run_worker(once=once, sleep_s=sleep_s, stale_min=stale_min)
 
-        while True:
+    # -------------------------
+    # Worker loop
+    # -------------------------
+    def _install_stop_handlers(self):
+        """
+        SIGTERM/SIGINT: joriy job sahifa chegarasida to‘xtatiladi va PENDING’ga
+        qaytariladi, keyin worker chiqadi. Ikkinchi CTRL+C — darhol to‘xtatish.
+        """
+        self._stop = False
+        self._recycle = False
+
+        def _on_signal(signum, frame):
+            if self._stop and signum == signal.SIGINT:
+                raise KeyboardInterrupt
+            self._stop = True
+
+        signal.signal(signal.SIGTERM, _on_signal)
+        signal.signal(signal.SIGINT, _on_signal)
+
+    def _run_worker(self, *, once: bool, sleep_s: float, stale_min: int):
+        self._install_stop_handlers()
+        self.worker_id = _worker_id()
+        self._counters = {"since": time.monotonic(), "jobs": 0, "pdf_pages": 0, "outputs": 0, "busy": 0.0, "stages": {}}
+        # LISTEN navbatni birinchi tekshirishdan oldin — oradagi NOTIFY yo‘qolmaydi
+        waiter = JobWakeup() if not once else None
+        if waiter is not None and waiter.listening:
+            self.stdout.write(f"Listening on '{waiter.channel}' (fallback poll {self.poll_interval:g}s)")
+
+        try:
+            self._worker_loop(waiter, once=once, sleep_s=sleep_s, stale_min=stale_min)
+        finally:
+            if waiter is not None:
+                waiter.close()
+
+        if self._recycle:
+            raise SystemExit(RSS_RECYCLE_EXIT)
+
+    def _over_memory_limit(self) -> bool:
+        """RSS max_rss_mb’dan oshdimi; oshsa worker to‘xtaydi va qayta ishga tushiriladi."""
+        limit = getattr(self, "max_rss_mb", 0)
+        if not limit or self._recycle:
+            return self._recycle
+        rss = rss_mb()
+        if rss is None or rss <= limit:
+            return False
+        self.stderr.write(self.style.WARNING(f"Worker RSS {rss:.0f} MB > {limit} MB: recycling."))
+        self._recycle = True
+        self._stop = True
+        return True
+
+    def _worker_loop(self, waiter: Optional[JobWakeup], *, once: bool, sleep_s: float, stale_min: int):
+        while not self._stop and not self._over_memory_limit():
             try:
-                if stale_min > 0:
-                    self._requeue_stale_jobs(minutes=stale_min)
+                # o‘lgan workerlarning job’lari (lease eskirgan) — soniyalar ichida qaytadi
+                self._requeue_stale_jobs(minutes=stale_min)
 
                 job = self._pick_next_job()
                 if not job:
                     if once:
                         self.stdout.write("No pending jobs. Exit.")
                         return
-                    time.sleep(sleep_s)
+                    # NOTIFY kelsa darhol uyg‘onadi; aks holda fallback poll
+                    # (lease muddatidan uzoq uxlamaymiz — eskirgan lease’lar kechikmasin)
+                    timeout = min(self.poll_interval, self.lease_seconds) if waiter.listening else sleep_s
+                    waiter.wait(timeout, should_stop=lambda: self._stop)
                     continue
 
                 self._process_job(job)
@@ -108,55 +422,226 @@ class Command(BaseCommand):
                 self.stdout.write("\nStopped by user.")
                 return
 
+        self.stdout.write("Worker stopped.")
+
+    # -------------------------
+    # Supervisor (--concurrency N)
+    # -------------------------
+    def _supervise(self, concurrency: int, *, once: bool, sleep_s: float, stale_min: int, shutdown_timeout: float):
+        """
+        N ta worker process (fork). Har biri navbatdan o‘zi _pick_next_job
+        (select_for_update(skip_locked=True)) orqali job oladi.
+        - yiqilgan worker qayta ishga tushiriladi (tez-tez yiqilsa — backoff bilan);
+          uning qo‘lidagi job PENDING’ga qaytariladi
+        - SIGTERM/SIGINT: workerlarga SIGTERM, ular joriy jobni PENDING’ga qaytarib
+          chiqadi; shutdown_timeout’dan keyin qolganlari o‘ldiriladi va jobi requeue qilinadi
+        """
+        ctx = multiprocessing.get_context("fork")
+        stopping = False
+
+        def _on_signal(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, _on_signal)
+        signal.signal(signal.SIGINT, _on_signal)
+
+        # slot -> [process, current_job (shared), started_monotonic, crash_streak]
+        slots = {}
+
+        def _start(slot: int, crash_streak: int = 0):
+            current_job = ctx.Value("q", 0)
+            # DB ulanishi fork orqali bo‘lishilmasin
+            connections.close_all()
+            proc = ctx.Process(
+                target=self._child_main,
+                args=(slot, current_job),
+                kwargs={"once": once, "sleep_s": sleep_s, "stale_min": stale_min if slot == 0 else 0},
+                name=f"pdf-worker-{slot}",
+                daemon=False,  # o‘zi render pool (child process) ochishi mumkin
+            )
+            proc.start()
+            slots[slot] = [proc, current_job, time.monotonic(), crash_streak]
+            self.stdout.write(f"Started worker #{slot} (pid={proc.pid})")
+
+        def _reap(slot: int, reason: str):
+            proc, current_job, _, _ = slots[slot]
+            job_pk = int(current_job.value or 0)
+            if job_pk and _requeue_job(job_pk, reason, worker_id=_worker_id(proc.pid)):
+                self.stdout.write(self.style.WARNING(f"Requeued job #{job_pk} of worker #{slot} (pid={proc.pid})"))
+
+        self.stdout.write(self.style.SUCCESS(f"PDF supervisor started: {concurrency} workers (CTRL+C to stop)"))
+        for slot in range(concurrency):
+            _start(slot)
+
+        restart_at = {}  # slot -> monotonic (backoff)
+        while not stopping:
+            sentinels = [entry[0].sentinel for entry in slots.values()]
+            if sentinels:
+                multiprocessing.connection.wait(sentinels, timeout=1.0)
+            else:
+                time.sleep(1.0)
+
+            now = time.monotonic()
+            for slot in list(slots):
+                proc, _, started, crash_streak = slots[slot]
+                if proc.is_alive():
+                    continue
+                code = proc.exitcode
+                _reap(slot, f"Requeued: worker exited (code={code}).")
+                del slots[slot]
+
+                if once and code == 0:
+                    continue  # --once: navbat bo‘sh, qayta ishga tushirmaymiz
+
+                if code == RSS_RECYCLE_EXIT and not stopping:
+                    # xotira chegarasi: yiqilish emas — backoff’siz qayta ishga tushadi
+                    self.stdout.write(self.style.WARNING(f"Worker #{slot} (pid={proc.pid}) recycled (memory limit)"))
+                    _start(slot)
+                    continue
+
+                self.stderr.write(self.style.ERROR(f"Worker #{slot} (pid={proc.pid}) exited with code {code}"))
+                crash_streak = crash_streak + 1 if (now - started) < 30 else 0
+                restart_at[slot] = (now + min(30.0, 2.0 ** crash_streak), crash_streak)
+
+            for slot, (when, crash_streak) in list(restart_at.items()):
+                if now >= when and not stopping:
+                    del restart_at[slot]
+                    _start(slot, crash_streak)
+
+            if once and not slots and not restart_at:
+                self.stdout.write("All workers finished. Exit.")
+                return
+
+        # ---- graceful shutdown ----
+        self.stdout.write("Stopping workers...")
+        for proc, _, _, _ in slots.values():
+            if proc.is_alive():
+                proc.terminate()  # SIGTERM -> sahifa chegarasida to‘xtaydi
+
+        deadline = time.monotonic() + max(0.0, shutdown_timeout)
+        for slot, (proc, _, _, _) in slots.items():
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                self.stderr.write(self.style.ERROR(f"Worker #{slot} (pid={proc.pid}) did not stop in time, killing."))
+                proc.kill()
+                proc.join()
+            _reap(slot, "Requeued: worker shutdown.")
+
+        self.stdout.write("Supervisor stopped.")
+
+    def _child_main(self, slot: int, current_job, *, once: bool, sleep_s: float, stale_min: int):
+        self._current_job = current_job
+        self.stdout.write(f"Worker #{slot} ready (pid={os.getpid()})")
+        self._run_worker(once=once, sleep_s=sleep_s, stale_min=stale_min)
+
     # -------------------------
     # DB ops
     # -------------------------
-    def _requeue_stale_jobs(self, *, minutes: int):
+    def _requeue_stale_jobs(self, *, minutes: int = 0):
         """
-        Server o‘chib qolib job PROCESSING bo‘lib qolsa, qayta PENDING qilish.
+        Worker o‘lib job PROCESSING bo‘lib qolsa, qayta PENDING qilish.
+        Mezon — heartbeat (lease_seconds): ishlayotgan uzun job tegilmaydi,
+        o‘lgan worker’ning jobi esa lease tugashi bilan qaytadi.
+        minutes > 0: heartbeat’i umuman yo‘q (eski versiya olgan) job’lar started_at bo‘yicha.
         """
-        cutoff = timezone.now() - timedelta(minutes=minutes)  # ✅ FIX
+        now = timezone.now()
+        stale = Q(heartbeat_at__lt=now - timedelta(seconds=self.lease_seconds))
+        if minutes > 0:
+            stale |= Q(heartbeat_at__isnull=True, started_at__lt=now - timedelta(minutes=minutes))  # ✅ FIX
 
         updated = (
             ChapterPDFJob.objects
-            .filter(status=ChapterPDFJob.STATUS_PROCESSING, started_at__lt=cutoff)
+            .filter(stale, status=ChapterPDFJob.STATUS_PROCESSING)
             .update(
                 status=ChapterPDFJob.STATUS_PENDING,
-                error="Requeued: stale PROCESSING job.",
-                progress=0,
-                total=0,
+                error="Requeued: stale PROCESSING job (lease expired).",
                 started_at=None,
                 finished_at=None,
+                worker_id="",
+                heartbeat_at=None,
             )
         )
         if updated:
+            notify_pdf_jobs()
             self.stdout.write(self.style.WARNING(f"Requeued stale jobs: {updated}"))
 
     def _pick_next_job(self) -> Optional[ChapterPDFJob]:
         """
         Navbatdan bitta PENDING jobni xavfsiz olib PROCESSING’ga o‘tkazadi.
         skip_locked=True -> bir nechta worker bo‘lsa ham urilmaydi.
+
+        Tartib: priority (kamayish), keyin fair share shu fair_key (jamoa / yuklovchi) bo‘yicha:
+          1) hozir ishlayotgan job’lari kam ulush oldin;
+          2) so‘nggi marta eng oldin navbat olgan (yoki hali olmagan) ulush oldin — round-robin;
+          3) ulush ichida — FIFO (created_at, id).
         """
+        same_key = ChapterPDFJob.objects.filter(fair_key=OuterRef("fair_key")).order_by().values("fair_key")
+        running = (
+            same_key.filter(status=ChapterPDFJob.STATUS_PROCESSING)
+            .annotate(n=Count("id"))
+            .values("n")[:1]
+        )
+        last_served = same_key.annotate(t=Max("started_at")).values("t")[:1]
         with transaction.atomic():
             job = (
                 ChapterPDFJob.objects
                 .select_for_update(skip_locked=True)
                 .filter(status=ChapterPDFJob.STATUS_PENDING)
-                .order_by("created_at", "id")
+                .annotate(
+                    running=Coalesce(Subquery(running, output_field=IntegerField()), 0),
+                    last_served=Subquery(last_served, output_field=DateTimeField()),
+                )
+                .order_by("-priority", "running", F("last_served").asc(nulls_first=True), "created_at", "id")
                 .first()
             )
             if not job:
                 return None
 
+            # progress/total tegilmaydi: checkpoint bo‘lsa render o‘sha joydan davom etadi
             job.status = ChapterPDFJob.STATUS_PROCESSING
             job.started_at = timezone.now()
             job.finished_at = None
             job.error = ""
-            job.progress = 0
-            job.total = 0
-            job.save(update_fields=["status", "started_at", "finished_at", "error", "progress", "total"])
+            job.worker_id = self.worker_id
+            job.heartbeat_at = job.started_at
+            job.save(update_fields=["status", "started_at", "finished_at", "error", "worker_id", "heartbeat_at"])
             return job
 
+    def _count_throughput(self, stats: Dict[str, Any], wall: float) -> None:
+        """Worker hayoti bo‘yicha hisoblagichlar (har job’dan keyin logga) — quti o‘lchamini tanlash uchun."""
+        counters = self._counters
+        pages = stats.get("pages") or ()
+        counters["jobs"] += 1
+        counters["pdf_pages"] += len(pages)
+        counters["outputs"] += sum(int(p[4]) for p in pages)
+        counters["busy"] += wall
+        for stage, seconds in (stats.get("timings") or {}).items():
+            counters["stages"][stage] = counters["stages"].get(stage, 0.0) + float(seconds)
+
+        uptime = max(1e-9, time.monotonic() - counters["since"])
+        busy = max(1e-9, counters["busy"])
+        spent = sum(counters["stages"].values()) or 1.0
+        shares = " ".join(f"{s}={100.0 * v / spent:.0f}%" for s, v in counters["stages"].items() if v)
+        self.stdout.write(
+            f"Worker totals: jobs={counters['jobs']} pages={counters['pdf_pages']} outputs={counters['outputs']} "
+            f"busy={100.0 * busy / uptime:.0f}% {counters['pdf_pages'] / busy:.2f} pages/s {shares}"
+        )
+
+    def _finish_cancelled(self, job: ChapterPDFJob, lease: JobLease):
+        """Bekor qilingan job: checkpoint/lease tozalanadi, PDF o‘chiriladi."""
+        lease_qs = ChapterPDFJob.objects.filter(
+            pk=job.pk,
+            worker_id=lease.worker_id,
+            status=ChapterPDFJob.STATUS_CANCELLED,
+        )
+        lease_qs.update(checkpoint={}, heartbeat_at=None)
+        try:
+            ChapterPDFJob.objects.get(pk=job.pk).pdf.delete(save=True)
+        except Exception:
+            pass
+        self.stdout.write(self.style.WARNING(f"Cancelled job #{job.pk}: uploaded pages rolled back."))
+
     # -------------------------
     # Processing
     # -------------------------
@@ -164,11 +649,28 @@ class Command(BaseCommand):
         local_path = None
         should_delete_temp = False
 
+        current_job = getattr(self, "_current_job", None)
+        if current_job is not None:
+            current_job.value = job.pk  # supervisor bilsin (worker yiqilsa requeue qiladi)
+
+        lease = JobLease(pk=job.pk, worker_id=self.worker_id, lease_seconds=self.lease_seconds)
+        lease.start()
+        checkpointer = CheckpointWriter(pk=job.pk, lease=lease)
+
+        stats: Dict[str, Any] = {}
+        t_job = time.monotonic()
+        download = 0.0
+
+        def _timings() -> Dict[str, Any]:
+            return _job_timings(job.timings, stats, download=download, wall=time.monotonic() - t_job)
+
         try:
             if not job.pdf:
                 raise RuntimeError("Job PDF file is missing (job.pdf is empty).")
 
             local_path, should_delete_temp = _get_local_pdf_path(job)
+            download = time.monotonic() - t_job
+            lease.beat(force=True)  # yuklab olish uzoq cho‘zilgan bo‘lishi mumkin
 
             throttler = ProgressThrottler(min_interval_sec=0.5, min_step=3)
 
@@ -176,10 +678,18 @@ class Command(BaseCommand):
                 done = int(done or 0)
                 total = int(total or 0)
 
+                lease.beat()
                 if throttler.should_flush(done, total):
-                    ChapterPDFJob.objects.filter(pk=job.pk).update(progress=done, total=total)
+                    lease.owned().update(progress=done, total=total)
                     throttler.mark_flushed(done)
 
+            def _should_stop() -> bool:
+                # sahifa chegarasi: shutdown; lease yo‘qolsa/bekor qilinsa beat() exception ko‘taradi
+                if getattr(self, "_stop", False) or self._over_memory_limit():
+                    return True
+                lease.beat()
+                return False
+
             # ✅ render_pdf_to_pages int ham qaytarishi mumkin, (created,total) ham
             result: Any = render_pdf_to_pages(
                 job.chapter,
@@ -188,7 +698,16 @@ class Command(BaseCommand):
                 max_width=job.max_width,
                 replace_existing=job.replace_existing,
                 quality=job.quality,
+                split_long_pages=job.split_long_pages,
                 progress_cb=_progress,
+                workers=self.render_workers,
+                upload_workers=self.upload_workers,
+                should_stop=_should_stop,
+                checkpoint=job.checkpoint,
+                checkpoint_cb=checkpointer,
+                stats=stats,
+                source=job.source,
+                adaptive_quality=getattr(settings, "PDF_WEBP_ADAPTIVE", False),
             )
 
             created = 0
@@ -205,12 +724,16 @@ class Command(BaseCommand):
             total = int(fresh.total or 0)
             prog = int(fresh.progress or 0)
 
-            ChapterPDFJob.objects.filter(pk=job.pk).update(
+            timings = _timings()
+            lease.owned().update(
                 status=ChapterPDFJob.STATUS_DONE,
                 finished_at=timezone.now(),
                 progress=(total if total > 0 else prog),
                 total=(total if total > 0 else prog),
+                bytes_saved=int(stats.get("bytes_saved", 0)),
+                timings=timings,
                 error="",
+                heartbeat_at=None,
             )
 
             # PDFni storage’dan o‘chirish + fieldni tozalash
@@ -220,18 +743,73 @@ class Command(BaseCommand):
             except Exception:
                 pass
 
-            self.stdout.write(self.style.SUCCESS(f"Done job #{job.pk}: created={created}"))
+            stages = " ".join(f"{s}={timings['stages'].get(s, 0.0):.1f}s" for s in TIMING_STAGES)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Done job #{job.pk}: created={created} "
+                    f"written={stats.get('bytes_written', 0)}B saved={stats.get('bytes_saved', 0)}B "
+                    f"wall={timings['wall']:.1f}s {stages}"
+                )
+            )
+
+        except RenderCancelled:
+            # render yuklangan fayllarni o‘chirgan
+            self._finish_cancelled(job, lease)
+
+        except RenderInterrupted as e:
+            if not lease.lost:
+                try:
+                    checkpointer.flush()  # yuklangan sahifalar keyingi worker uchun
+                except (LeaseLost, RenderCancelled):
+                    pass
+            if lease.cancelled:
+                # to‘xtash paytida bekor qilingan: saqlab qo‘yilgan fayllar endi kerak emas
+                discard_checkpoint_files(checkpointer.state)
+                self._finish_cancelled(job, lease)
+            elif lease.lost:
+                # job endi boshqa workerda — unga tegmaymiz
+                self.stderr.write(self.style.WARNING(f"Lost lease of job #{job.pk}, abandoned: {e}"))
+            else:
+                reason = "Requeued: worker memory limit." if self._recycle else "Requeued: worker shutdown."
+                _requeue_job(job.pk, reason, worker_id=self.worker_id, timings=_timings())
+                self.stdout.write(self.style.WARNING(f"Requeued job #{job.pk}: {e}"))
+
+        except RenderLimitExceeded as e:
+            # ishonchsiz PDF cheklovga urildi (render process o‘ldirilgan, fayllar tozalangan):
+            # traceback’siz qisqa xato — worker navbatni ishlatishda davom etadi
+            lease.owned().update(
+                status=ChapterPDFJob.STATUS_FAILED,
+                finished_at=timezone.now(),
+                error=f"Rejected: {e}",
+                checkpoint={},
+                timings=_timings(),
+                heartbeat_at=None,
+            )
+            self.stderr.write(self.style.ERROR(f"Rejected job #{job.pk}: {e}"))
+
+        except KeyboardInterrupt:
+            # majburiy to‘xtatish: job PROCESSING’da osilib qolmasin
+            _requeue_job(job.pk, "Requeued: worker interrupted.", worker_id=self.worker_id)
+            raise
 
         except Exception as e:
             err = "".join(traceback.format_exception(type(e), e, e.__traceback__))
-            ChapterPDFJob.objects.filter(pk=job.pk).update(
+            # render fayllarni (checkpoint’dagilarini ham) o‘chirgan — checkpoint ham tozalanadi
+            lease.owned().update(
                 status=ChapterPDFJob.STATUS_FAILED,
                 finished_at=timezone.now(),
                 error=(err or str(e) or "")[:4000],
+                checkpoint={},
+                timings=_timings(),
+                heartbeat_at=None,
             )
             self.stderr.write(self.style.ERROR(f"Failed job #{job.pk}: {e}"))
 
         finally:
+            lease.stop()
+            self._count_throughput(stats, time.monotonic() - t_job)
+            if current_job is not None:
+                current_job.value = 0
             if should_delete_temp and local_path:
                 try:
                     os.remove(local_path)
@@ -4,10 +4,9 @@ import os
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.core.validators import FileExtensionValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
 from django.utils import timezone
 from django.utils.text import slugify
@@ -16,6 +15,8 @@ from io import BytesIO
 from unidecode import unidecode
 import uuid
 
+from .services.page_blobs import build_renditions, page_fields, release_blobs_on_commit, store_page_image
+
 
 User = get_user_model()
 
@@ -355,6 +356,13 @@ class Page(models.Model):
         help_text="Rasmni JPEG/WebP formatida yuklang.",
         verbose_name="Rasm (JPEG/WEBP)"
     )
+    # sha256(fayl baytlari) — content-addressed blob (bir nechta sahifa bitta faylga ishora qilishi mumkin)
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True, editable=False)
+    # Ingest paytida yoziladi (admin/reader storage’ga HEAD so‘rov yubormasin; reader joyni oldindan ajratadi).
+    # 0 — noma’lum (eski qatorlar: manage.py backfill_page_meta)
+    width = models.PositiveIntegerField(default=0, editable=False, verbose_name="Eni (px)")
+    height = models.PositiveIntegerField(default=0, editable=False, verbose_name="Bo‘yi (px)")
+    file_size = models.PositiveBigIntegerField(default=0, editable=False, verbose_name="Hajmi (bayt)")
 
     class Meta:
         unique_together = ('chapter', 'page_number')
@@ -376,26 +384,70 @@ class Page(models.Model):
             if old and old.image and old.image.name != self.image.name:
                 old_name = old.image.name
 
-        # 3) InMemory upload bo‘lsa — WEBP ga o‘tkazamiz
+        # 3) InMemory upload bo‘lsa — WEBP ga o‘tkazamiz (adaptive quality, 80 gacha;
+        #    content-addressed: bor bo‘lsa yuklanmaydi)
+        record = None
         fobj = getattr(self.image, "file", None)
         if self.image and isinstance(fobj, InMemoryUploadedFile):
             img = Image.open(self.image).convert('RGB')
-            buf = BytesIO()
-            img.save(buf, format='WEBP', quality=80)
-            buf.seek(0)
-            base, _ = os.path.splitext(self.image.name)
-            webp_name = f"{slugify(base)}.webp"
-            self.image.save(webp_name, ContentFile(buf.read()), save=False)
+            record, _ = store_page_image(img, quality=80, storage=self.image.storage)
+            # blob allaqachon storage’da: FileField qayta yuklamasin (image = record nomi)
+            for field, value in page_fields(record).items():
+                setattr(self, field, value)
 
-        # 4) Saqlash
-        super().save(*args, **kwargs)
+        # 4) Saqlash (+ eni variantlari; eskilari post_delete’da release bo‘ladi)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if record is not None:
+                self.renditions.all().delete()
+                PageRendition.objects.bulk_create(build_renditions(self, record))
+
+        # 5) Eski fayl: boshqa sahifa ishora qilmasa (commit’dan keyin) o‘chiriladi
+        if old_name and old_name != (self.image.name or ""):
+            release_blobs_on_commit([old_name], storage=self.image.storage)
+
+
+class PageRendition(models.Model):
+    """
+    Sahifaning eni bo‘yicha varianti (masalan 480/720/1080 + asl eni).
+    Reader srcset orqali ekranga mos eng kichigini oladi (telefon — ~720px).
+    Asl eni varianti Page.image bilan bitta blob (content-addressed).
+    """
+    page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name="renditions", verbose_name="Sahifa")
+    width = models.PositiveIntegerField(verbose_name="Eni (px)")
+    height = models.PositiveIntegerField(verbose_name="Bo‘yi (px)")
+    image = models.ImageField(upload_to="chapters/pages/", verbose_name="Rasm (WEBP)")
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True, editable=False)
+
+    class Meta:
+        unique_together = ("page", "width")
+        ordering = ("width",)
+        verbose_name = "Sahifa varianti"
+        verbose_name_plural = "Sahifa variantlari"
+
+    def __str__(self):
+        return f"{self.page} — {self.width}px"
+
+
+class PendingPageBlob(models.Model):
+    """
+    Hali commit bo‘lmagan ishora: job blobni yuklagan / checkpoint’ga yozgan (yoki
+    storage’dagi tayyor blobni qayta ishlatmoqchi), lekin Page qatorlari hali yo‘q.
+    page_blobs.release_blob bunday blobni o‘chirmaydi — boshqa job’ning discard’i
+    yoki sahifa o‘chirilishi yuklanayotgan bobni buzmasin.
+    Qatorlar commit tranzaksiyasida / discard’da o‘chiriladi (owner — checkpoint’da).
+    """
+    name = models.CharField(max_length=255)
+    owner = models.CharField(max_length=64, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("name", "owner")
+        verbose_name = "Commit kutayotgan blob"
+        verbose_name_plural = "Commit kutayotgan bloblar"
 
-        # 5) Eski faylni storage’dan o‘chirish (local/S3/GCS)
-        if old_name and old_name != (self.image.name or "") and default_storage.exists(old_name):
-            try:
-                default_storage.delete(old_name)
-            except Exception:
-                pass
+    def __str__(self):
+        return f"{self.name} ({self.owner})"
 
 
 # -------------------------
@@ -406,6 +458,7 @@ class ChapterPDFJob(models.Model):
     Chapter uchun PDF yuklash navbati.
     Maqsad: PDF'ni fon rejimida WEBP sahifalarga aylantirish,
     progress/status ko‘rsatish, va ish tugagach PDFni o‘chirish.
+    Rasmlar (ko‘p rasmli upload / ZIP / CBZ) ham shu navbatdan o‘tadi — source=ARCHIVE.
 
     Bu model mavjud kodlaringizni buzmaydi — faqat yangi jadval qo‘shadi.
     """
@@ -424,6 +477,24 @@ class ChapterPDFJob(models.Model):
         (STATUS_CANCELLED, "Cancelled"),
     ]
 
+    SOURCE_PDF = "pdf"
+    SOURCE_ARCHIVE = "archive"
+
+    SOURCE_CHOICES = [
+        (SOURCE_PDF, "PDF"),
+        (SOURCE_ARCHIVE, "Rasmlar (ZIP/CBZ)"),
+    ]
+
+    PRIORITY_LOW = -10
+    PRIORITY_NORMAL = 0
+    PRIORITY_HIGH = 10
+
+    PRIORITY_CHOICES = [
+        (PRIORITY_LOW, "Past"),
+        (PRIORITY_NORMAL, "Oddiy"),
+        (PRIORITY_HIGH, "Yuqori"),
+    ]
+
     chapter = models.ForeignKey(
         "manga.Chapter",
         on_delete=models.CASCADE,
@@ -433,9 +504,15 @@ class ChapterPDFJob(models.Model):
 
     pdf = models.FileField(
         upload_to="pdf_jobs/",
-        validators=[FileExtensionValidator(["pdf"])],
+        validators=[FileExtensionValidator(["pdf", "zip", "cbz"])],
         verbose_name="PDF fayl",
-        help_text="PDF yuklanadi, keyin fon rejimida WEBP sahifalarga aylantiriladi.",
+        help_text="PDF (yoki rasmlar arxivi) yuklanadi, keyin fon rejimida WEBP sahifalarga aylantiriladi.",
+    )
+    source = models.CharField(
+        max_length=8,
+        choices=SOURCE_CHOICES,
+        default=SOURCE_PDF,
+        verbose_name="Manba",
     )
 
     status = models.CharField(
@@ -446,6 +523,15 @@ class ChapterPDFJob(models.Model):
         verbose_name="Holati",
     )
 
+    # Navbat: yuqori priority oldin; bir xil priority ichida fair_key (jamoa / yuklovchi) bo‘yicha
+    # round-robin — bitta tarjimonning 40 ta bobi boshqalarni kutdirib qo‘ymaydi
+    priority = models.SmallIntegerField(
+        choices=PRIORITY_CHOICES,
+        default=PRIORITY_NORMAL,
+        verbose_name="Ustuvorlik",
+    )
+    fair_key = models.CharField(max_length=64, blank=True, default="", verbose_name="Navbat ulushi")
+
     # Progress: 0..total (PDF betlar bo‘yicha)
     progress = models.PositiveIntegerField(default=0, verbose_name="Tayyor bo‘lgan betlar")
     total = models.PositiveIntegerField(default=0, verbose_name="Jami betlar")
@@ -458,10 +544,32 @@ class ChapterPDFJob(models.Model):
     dpi = models.PositiveIntegerField(default=144, verbose_name="DPI")
     max_width = models.PositiveIntegerField(default=1400, verbose_name="Max width (px)")
     quality = models.PositiveIntegerField(default=82, verbose_name="WEBP quality")
+    split_long_pages = models.BooleanField(
+        default=False,
+        verbose_name="Uzun sahifalarni bo‘laklash",
+        help_text="Webtoon strip’lar gutterlardan bir nechta rasmga bo‘linadi (matn kichraymaydi).",
+    )
+
+    # Adaptive quality: `quality` bilan encode qilinganiga nisbatan tejalgan bayt (taxminiy)
+    bytes_saved = models.BigIntegerField(default=0, verbose_name="Tejalgan hajm (bayt)")
+
+    # Bosqichlar vaqti (sec) — worker qutisini o‘lchash uchun; requeue’lar bo‘ylab yig‘iladi:
+    # {"stages": {download, plan, render, encode, store, commit}, "wall", "attempts",
+    #  "pdf_pages", "outputs", "pages": [[index, plan, render, encode, WEBP soni], ...]}
+    timings = models.JSONField(default=dict, blank=True, verbose_name="Bosqichlar vaqti")
 
     # Xatolik bo‘lsa
     error = models.TextField(blank=True, default="", verbose_name="Xatolik")
 
+    # Resume uchun: render plan + allaqachon yuklangan WEBP’lar (pdf_to_pages checkpoint formati).
+    # Worker yiqilsa / requeue bo‘lsa keyingi ishga tushish shu yerdan davom etadi.
+    checkpoint = models.JSONField(default=dict, blank=True, verbose_name="Checkpoint")
+
+    # Lease: PROCESSING job egasi (host:pid) va uning oxirgi "tirikman" signali.
+    # heartbeat_at eskirsa (worker o‘lgan) — job boshqa worker uchun PENDING’ga qaytariladi.
+    worker_id = models.CharField(max_length=128, blank=True, default="", verbose_name="Worker")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Heartbeat")
+
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         null=True,
@@ -482,12 +590,29 @@ class ChapterPDFJob(models.Model):
         indexes = [
             models.Index(fields=["status", "created_at"]),
             models.Index(fields=["chapter", "status"]),
+            models.Index(fields=["fair_key", "status"]),
         ]
 
     def __str__(self):
         ch = self.chapter_id or "?"
         return f"PDFJob #{self.pk} (ch={ch}) {self.status} {self.progress}/{self.total}"
 
+    def save(self, *args, **kwargs):
+        # fair_key yaratilishda bir marta (keyingi update_fields save’lariga tegmaydi)
+        if not self.fair_key and self.chapter_id and kwargs.get("update_fields") is None:
+            self.fair_key = self.fair_key_for(self.chapter, self.created_by_id)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def fair_key_for(chapter, user_id=None) -> str:
+        """Navbat ulushi egasi: manga jamoa nomidan bo‘lsa — jamoa, aks holda yuklovchi (yo‘q bo‘lsa — manga)."""
+        team_id = chapter.manga.team_id
+        if team_id:
+            return f"team:{team_id}"
+        if user_id:
+            return f"user:{user_id}"
+        return f"manga:{chapter.manga_id}"
+
     @property
     def is_active(self) -> bool:
         return self.status in (self.STATUS_PENDING, self.STATUS_PROCESSING)
@@ -529,12 +654,11 @@ from django.db.models.signals import post_delete
 from django.dispatch import receiver
 
 @receiver(post_delete, sender=Page)
+@receiver(post_delete, sender=PageRendition)
 def _delete_page_file_on_remove(sender, instance, **kwargs):
+    # blob bir nechta sahifada bo‘lishi mumkin — oxirgi ishora yo‘qolganda, commit’dan keyin
     if instance.image:
-        try:
-            instance.image.delete(save=False)
-        except Exception:
-            pass
+        release_blobs_on_commit([instance.image.name], storage=instance.image.storage)
 
 
 # -------------------------
@@ -0,0 +1,37 @@
+# manga/receivers.py
+"""
+Faqat kesh kalitlari hozir ishlatilayotgan invalidatsiya receiver’lari (MangaConfig.ready ulaydi):
+
+- chapter_index_{manga_id}: bob qo‘shilsa/o‘zgarsa/o‘chsa (services.chapter_index)
+- purchased_chapters_{user_id}_{manga_id}: xarid qo‘shilsa/o‘chsa (services.entitlements)
+
+manga/signals.py’dagi eski receiver’lar ulanmagan — ularning kalitlari hozirgi kodda o‘qilmaydi.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from manga.models import Chapter, ChapterPurchase
+from manga.services.chapter_index import invalidate_chapter_index
+from manga.services.entitlements import invalidate_purchases
+
+
+@receiver([post_save, post_delete], sender=Chapter)
+def drop_chapter_index(sender, instance: Chapter, **kwargs):
+    invalidate_chapter_index(instance.manga_id)
+
+
+@receiver([post_save, post_delete], sender=ChapterPurchase)
+def drop_purchased_chapters(sender, instance: ChapterPurchase, **kwargs):
+    # xarid tranzaksiya ichida (qulflar ostida) yaratiladi — commit’gacha eski to‘plam qayta
+    # keshlanib qolmasin; bu yerda so‘rov yo‘q: bob keshda bo‘lmasa manga_id commit’dan keyin olinadi
+    field = ChapterPurchase._meta.get_field("chapter")
+    user_id, chapter_id = instance.user_id, instance.chapter_id
+    manga_id = field.get_cached_value(instance).manga_id if field.is_cached(instance) else None
+
+    def _invalidate():
+        mid = manga_id or Chapter.objects.filter(pk=chapter_id).values_list("manga_id", flat=True).first()
+        if mid is not None:  # bob ham o‘chgan — keshdagi id hech narsani ochmaydi
+            invalidate_purchases(user_id, mid)
+
+    transaction.on_commit(_invalidate)
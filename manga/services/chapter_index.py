@@ -0,0 +1,94 @@
+# manga/services/chapter_index.py
+"""
+Manga boblari indeksi (keshda): (volume, chapter_number) bo‘yicha tartiblangan ixcham massiv.
+
+manga_details, chapter_read va purchase_chapter bob ro‘yxatini har safar alohida so‘rov bilan
+olib tartiblamasin: indeks bir marta quriladi, prev/next/first/last — bisect bilan.
+Chapter saqlansa/o‘chirilsa receivers.py indeksni o‘chiradi (bulk_create signal bermaydi —
+u yerda invalidate_chapter_index qo‘lda chaqiriladi).
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+
+class ChapterEntry(NamedTuple):
+    # atribut nomlari Chapter bilan bir xil — template’lar ikkalasi bilan ham ishlaydi
+    volume: int
+    chapter_number: int
+    id: int
+    price_tanga: int
+    release_date: Optional[date]
+    published_at: Optional[datetime]
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.volume, self.chapter_number
+
+
+class ChapterIndex:
+    """O‘sish tartibidagi boblar (volume, chapter_number)."""
+
+    def __init__(self, entries):
+        self.entries: Tuple[ChapterEntry, ...] = tuple(sorted(entries))
+        self._keys: List[Tuple[int, int]] = [e.key for e in self.entries]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def desc(self) -> List[ChapterEntry]:
+        return self.entries[::-1]
+
+    def first(self) -> Optional[ChapterEntry]:
+        return self.entries[0] if self.entries else None
+
+    def last(self) -> Optional[ChapterEntry]:
+        return self.entries[-1] if self.entries else None
+
+    def find(self, volume: int, chapter_number: int) -> Optional[ChapterEntry]:
+        key = (int(volume), int(chapter_number))
+        i = bisect_left(self._keys, key)
+        return self.entries[i] if i < len(self._keys) and self._keys[i] == key else None
+
+    def previous(self, volume: int, chapter_number: int) -> Optional[ChapterEntry]:
+        i = bisect_left(self._keys, (int(volume), int(chapter_number)))
+        return self.entries[i - 1] if i > 0 else None
+
+    def next(self, volume: int, chapter_number: int) -> Optional[ChapterEntry]:
+        i = bisect_right(self._keys, (int(volume), int(chapter_number)))
+        return self.entries[i] if i < len(self._keys) else None
+
+
+def chapter_index_key(manga_id: int) -> str:
+    return f"chapter_index_{manga_id}"
+
+
+def build_chapter_index(manga_id: int) -> ChapterIndex:
+    Chapter = apps.get_model("manga", "Chapter")
+    rows = (
+        Chapter.objects
+        .filter(manga_id=manga_id)
+        .values_list("volume", "chapter_number", "id", "price_tanga", "release_date", "published_at")
+    )
+    return ChapterIndex(ChapterEntry(*row) for row in rows)
+
+
+def chapter_index(manga_id: int) -> ChapterIndex:
+    """Keshdagi indeks; yo‘q bo‘lsa bitta so‘rov bilan quriladi."""
+    key = chapter_index_key(manga_id)
+    index = cache.get(key)
+    if index is None:
+        index = build_chapter_index(manga_id)
+        cache.set(key, index, int(getattr(settings, "CHAPTER_INDEX_CACHE_TTL", 60 * 60)))
+    return index
+
+
+def invalidate_chapter_index(manga_id: int) -> None:
+    cache.delete(chapter_index_key(manga_id))
@@ -0,0 +1,91 @@
+# manga/services/entitlements.py
+"""
+Bob o‘qish huquqi — ro‘yxatlar uchun ommaviy (bulk).
+
+Siyosat (can_read bilan bir xil):
+  - bob bepul -> o‘qiydi;
+  - guest -> faqat bepul boblar;
+  - superuser/staff, manga muallifi, istalgan tarjimon -> hammasi;
+  - aks holda — xarid qilingan boblar.
+
+ChapterAccess bitta (user, manga) uchun imtiyozni bir marta, xaridlarni bitta so‘rov bilan
+oladi; xaridlar keshda ixcham id to‘plami (purchased_chapters_<user>_<manga>).
+ChapterPurchase saqlansa/o‘chirilsa receivers.py commit’dan keyin keshni tozalaydi.
+"""
+from typing import FrozenSet, Iterable, Set
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+
+
+def _is_translator(user) -> bool:
+    """Foydalanuvchi tarjimonmi? (UserProfile.is_translator)"""
+    UserProfile = apps.get_model("accounts", "UserProfile")
+    try:
+        return getattr(user.userprofile, "is_translator", False)
+    except UserProfile.DoesNotExist:
+        return False
+
+
+def purchases_cache_key(user_id: int, manga_id: int) -> str:
+    return f"purchased_chapters_{user_id}_{manga_id}"
+
+
+def purchased_chapter_ids(user_id: int, manga_id: int) -> FrozenSet[int]:
+    """Foydalanuvchi shu mangada sotib olgan boblar (keshdan; yo‘q bo‘lsa bitta so‘rov)."""
+    key = purchases_cache_key(user_id, manga_id)
+    ids = cache.get(key)
+    if ids is None:
+        ChapterPurchase = apps.get_model("manga", "ChapterPurchase")
+        ids = frozenset(
+            ChapterPurchase.objects
+            .filter(user_id=user_id, chapter__manga_id=manga_id)
+            .values_list("chapter_id", flat=True)
+        )
+        cache.set(key, ids, int(getattr(settings, "ENTITLEMENT_CACHE_TTL", 60 * 10)))
+    return ids
+
+
+def invalidate_purchases(user_id: int, manga_id: int) -> None:
+    cache.delete(purchases_cache_key(user_id, manga_id))
+
+
+class ChapterAccess:
+    """
+    Bitta so‘rov ichida (user, manga) uchun huquq hisoblagichi.
+    chapter — Chapter yoki chapter_index yozuvi (faqat id va price_tanga kerak).
+    """
+
+    def __init__(self, user, manga):
+        self.user = user
+        self.manga = manga
+
+    @cached_property
+    def privileged(self) -> bool:
+        user = self.user
+        if not user.is_authenticated:
+            return False
+        return bool(
+            user.is_superuser
+            or user.is_staff
+            or self.manga.created_by_id == user.id
+            or _is_translator(user)
+        )
+
+    @cached_property
+    def purchased(self) -> FrozenSet[int]:
+        if not self.user.is_authenticated:
+            return frozenset()
+        return purchased_chapter_ids(self.user.id, self.manga.id)
+
+    def can_read(self, chapter) -> bool:
+        if chapter.price_tanga == 0:
+            return True
+        if not self.user.is_authenticated:
+            return False
+        return self.privileged or chapter.id in self.purchased
+
+    def readable_ids(self, chapters: Iterable) -> Set[int]:
+        return {ch.id for ch in chapters if self.can_read(ch)}
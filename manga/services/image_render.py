@@ -0,0 +1,226 @@
+# manga/services/image_render.py
+"""
+Rasm arxivi (ZIP/CBZ) sahifalarini decode + WEBP encode (Django’siz qism).
+
+pdf_render bilan bir xil shartnoma: (meta, EncodedImage’lar) — shuning uchun
+pdf_to_pages’ning upload/checkpoint/commit yo‘li rasmlar uchun ham ishlaydi.
+Parallel rejimda spawn processlar shu modulni import qiladi va har biri arxivni o‘zi ochadi.
+"""
+import re
+import signal
+import time
+import zipfile
+from multiprocessing.util import Finalize
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from .pdf_render import (
+    WEBP_MAX_DIM,
+    EncodedImage,
+    RenderOptions,
+    ResourceLimits,
+    _add_time,
+    _blank_rows,
+    _blank_runs,
+    _encode_timed,
+    _gutter_cuts,
+    _safe_close,
+)
+
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "webp", "gif", "bmp")
+# EXIF Orientation tegi; 5–8 — 90°/270° burish (exif_transpose eni va bo‘yini almashtiradi)
+EXIF_ORIENTATION = 0x0112
+EXIF_SWAPS_AXES = frozenset({5, 6, 7, 8})
+ARCHIVE_EXTENSIONS = ("zip", "cbz")
+
+
+class ImageSourceError(ValueError):
+    """Arxiv yoki undagi rasm o‘qilmadi (buzilgan / rasm emas / decompression bomb)."""
+
+
+def _natural_key(name: str):
+    # "2.jpg" < "10.jpg"; papka nomlari ham hisobga olinadi
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name.lower())]
+
+
+def archive_members(zf: zipfile.ZipFile) -> List[str]:
+    """Arxivdagi rasm fayllari (tabiiy tartibda); papkalar, __MACOSX va yashirin fayllar tashlanadi."""
+    names = []
+    for info in zf.infolist():
+        name = info.filename
+        base = name.rsplit("/", 1)[-1]
+        if info.is_dir() or not base or base.startswith(".") or name.startswith("__MACOSX/"):
+            continue
+        if "." in base and base.rsplit(".", 1)[-1].lower() in IMAGE_EXTENSIONS:
+            names.append(name)
+    return sorted(names, key=_natural_key)
+
+
+def image_scale(w_px: int, h_px: int, opts: RenderOptions) -> float:
+    """Rasm kattalashtirilmaydi: eni target_w’dan keng bo‘lsa kichraytiriladi (split’siz — WEBP chegarasi ham)."""
+    scale = min(1.0, float(opts.target_w) / float(max(1, w_px)))
+    if not opts.split_long_pages:
+        scale = min(scale, WEBP_MAX_DIM / float(max(1, w_px)), WEBP_MAX_DIM / float(max(1, h_px)))
+    return scale
+
+
+def _scaled_size(w_px: int, h_px: int, scale: float) -> Tuple[int, int]:
+    return max(1, int(round(w_px * scale))), max(1, int(round(h_px * scale)))
+
+
+def estimate_image_pixels(w_px: int, h_px: int, opts: RenderOptions) -> int:
+    """Yakuniy bitmap(lar) piksel soni — job piksel byudjeti uchun."""
+    w, h = _scaled_size(w_px, h_px, image_scale(w_px, h_px, opts))
+    return w * h
+
+
+def estimate_image_pieces(w_px: int, h_px: int, opts: RenderOptions) -> int:
+    """split_long_pages=False bo‘lsa doim 1; aks holda chunk_height bo‘yicha (gutter kesimi sonni oshirishi mumkin)."""
+    if not opts.split_long_pages:
+        return 1
+    _, h = _scaled_size(w_px, h_px, image_scale(w_px, h_px, opts))
+    return max(1, -(-h // int(opts.chunk_height)))
+
+
+class ImageArchive:
+    """ZIP/CBZ ichidagi rasmlar — PdfDocument o‘rnida (len, o‘lchamlar, i-sahifani render)."""
+
+    def __init__(self, path: str):
+        try:
+            self.zf = zipfile.ZipFile(path)
+        except (zipfile.BadZipFile, OSError) as e:
+            raise ImageSourceError(f"Not a ZIP/CBZ archive: {e}") from e
+        self.members = archive_members(self.zf)
+        if not self.members:
+            self.zf.close()
+            raise ImageSourceError("Archive contains no images.")
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def close(self) -> None:
+        self.zf.close()
+
+    def _open(self, index: int) -> Image.Image:
+        name = self.members[index]
+        try:
+            return Image.open(self.zf.open(name))
+        except (zipfile.BadZipFile, OSError, Image.DecompressionBombError) as e:
+            raise ImageSourceError(f"{name}: {e}") from e
+
+    def size(self, index: int) -> Tuple[int, int]:
+        """Faqat header o‘qiladi (decode qilinmaydi); o‘lcham load() kabi EXIF orientatsiyasidan keyingi."""
+        with self._open(index) as img:
+            w, h = img.size
+            if img.getexif().get(EXIF_ORIENTATION) in EXIF_SWAPS_AXES:
+                return h, w
+            return w, h
+
+    def load(self, index: int) -> Image.Image:
+        """To‘liq decode: EXIF orientatsiyasi qo‘llanadi, RGB."""
+        img = self._open(index)
+        try:
+            img.load()
+            return ImageOps.exif_transpose(img).convert("RGB")
+        except (OSError, Image.DecompressionBombError) as e:
+            raise ImageSourceError(f"{self.members[index]}: {e}") from e
+        finally:
+            img.close()
+
+    def render(self, index: int, opts: RenderOptions) -> Tuple[Dict[str, Any], List[EncodedImage]]:
+        t_start = time.perf_counter()
+        return render_image(self.load(index), opts, t_start=t_start)
+
+
+def render_image(
+    img: Image.Image,
+    opts: RenderOptions,
+    *,
+    t_start: Optional[float] = None,
+) -> Tuple[Dict[str, Any], List[EncodedImage]]:
+    """
+    Bitta rasm: max eniga kichraytirish (+ split_long_pages bo‘lsa gutterlardan bo‘laklash) + encode.
+    meta — pdf_render.render_page bilan bir xil kalitlar (pieces, timings);
+    t_start — decode boshlangan payt (decode ham "render" bosqichiga kiradi).
+    """
+    if t_start is None:
+        t_start = time.perf_counter()
+    enc = {"quality": opts.quality_target, "webp_method": opts.webp_method, "rendition_widths": opts.rendition_widths}
+
+    scale = image_scale(img.width, img.height, opts)
+    if scale < 1.0:
+        img = img.resize(_scaled_size(img.width, img.height, scale), Image.LANCZOS)
+
+    bounds = [0, img.height]
+    if opts.split_long_pages and img.height > opts.chunk_height:
+        cuts = _gutter_cuts(_blank_runs(_blank_rows(img)), 0, img.height, float(opts.chunk_height))
+        bounds = [0] + cuts + [img.height]
+
+    meta: Dict[str, Any] = {
+        "w_px": img.width,
+        "h_px": img.height,
+        "scale": float(scale),
+        "pieces": len(bounds) - 1,
+        "cuts": bounds[1:-1],
+    }
+    _add_time(meta, "render", t_start)  # decode + kichraytirish (PDF’dagi rasterlash o‘rnida)
+
+    outputs = []
+    for top, bottom in zip(bounds, bounds[1:]):
+        piece = img if len(bounds) == 2 else img.crop((0, top, img.width, bottom))
+        outputs.append(_encode_timed(meta, piece, enc))
+    return meta, outputs
+
+
+# -------------------------
+# Parallel worker (alohida process ichida ishlaydi) — pdf_render’dagi bilan bir xil tartib
+# -------------------------
+_WORKER_ARCHIVE: Optional[ImageArchive] = None
+_WORKER_OPEN_ERROR: Optional[Exception] = None
+
+
+def _init_image_worker(archive_path: str, limits: Optional[ResourceLimits] = None) -> None:
+    """ProcessPool initializer: har bir worker arxivni o‘zi bir marta ochadi (limits — ochishdan oldin)."""
+    global _WORKER_ARCHIVE, _WORKER_OPEN_ERROR
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if limits is not None:
+        limits.apply()
+    try:
+        _WORKER_ARCHIVE = ImageArchive(archive_path)
+    except ImageSourceError as e:
+        _WORKER_OPEN_ERROR = e
+        return
+    Finalize(None, _safe_close, args=(_WORKER_ARCHIVE,), exitpriority=10)
+
+
+def _worker_archive() -> ImageArchive:
+    if _WORKER_OPEN_ERROR is not None:
+        raise _WORKER_OPEN_ERROR
+    if _WORKER_ARCHIVE is None:
+        raise RuntimeError("Image worker is not initialized.")
+    return _WORKER_ARCHIVE
+
+
+def probe_archive() -> Tuple[int, List[Tuple[int, int]]]:
+    """Worker ichida: rasmlar soni va o‘lchamlari (px, faqat header’dan)."""
+    archive = _worker_archive()
+    return len(archive), [archive.size(i) for i in range(len(archive))]
+
+
+def render_image_range(start: int, stop: int, opts: RenderOptions) -> List[Tuple[Dict[str, Any], List[EncodedImage]]]:
+    """[start, stop) oralig‘idagi rasmlar: decode + encode (tartib saqlanadi)."""
+    archive = _worker_archive()
+    return [archive.render(i, opts) for i in range(start, stop)]
+
+
+def iter_archive_pages(
+    archive: ImageArchive,
+    opts: RenderOptions,
+    start: int = 0,
+) -> Iterator[Tuple[Dict[str, Any], List[EncodedImage]]]:
+    """Serial rejim (shu processda)."""
+    for i in range(start, len(archive)):
+        yield archive.render(i, opts)
@@ -0,0 +1,125 @@
+# manga/services/job_notify.py
+"""
+PDF job navbati uchun PostgreSQL LISTEN/NOTIFY.
+
+- notify_pdf_jobs(): yangi PENDING job paydo bo‘lganda (commit’dan keyin) NOTIFY yuboradi
+- JobWakeup: worker alohida ulanishda LISTEN qiladi va socket’da bloklanib kutadi
+
+PostgreSQL bo‘lmasa (sqlite/dev) yoki ulanish uzilsa — oddiy sleep polling’ga tushadi.
+"""
+import select
+import time
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+
+PDF_JOBS_CHANNEL = getattr(settings, "PDF_JOBS_CHANNEL", "mangalab_pdf_jobs")
+
+# stop flag’ini tekshirish oralig‘i (DB’ga so‘rov yubormaydi)
+_WAIT_SLICE_SEC = 1.0
+
+
+def notify_pdf_jobs(job_id: Optional[int] = None, *, using: str = "default") -> None:
+    """
+    Workerlarni uyg‘otish. Transaction ichida chaqirilsa — commit’dan keyin yuboriladi
+    (worker hali ko‘rinmaydigan jobni izlab qolmasin).
+    """
+    def _send():
+        conn = connections[using]
+        if conn.vendor != "postgresql":
+            return
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_notify(%s, %s)", [PDF_JOBS_CHANNEL, str(job_id or "")])
+        except Exception:
+            pass  # NOTIFY bo‘lmasa ham worker fallback poll’da topadi
+
+    transaction.on_commit(_send, using=using)
+
+
+class JobWakeup:
+    """
+    Worker tomoni: alohida (autocommit) ulanishda LISTEN.
+
+        waiter = JobWakeup()
+        ...
+        if not job:
+            waiter.wait(60, should_stop=lambda: stop)
+
+    Muhim: LISTEN navbatni tekshirishdan OLDIN qilinadi — oradagi NOTIFY yo‘qolmaydi.
+    """
+
+    def __init__(self, *, using: str = "default", channel: str = PDF_JOBS_CHANNEL):
+        self.using = using
+        self.channel = channel
+        self._conn = None
+        self.listening = False
+        self._connect()
+
+    def _connect(self) -> None:
+        wrapper = connections[self.using]
+        if wrapper.vendor != "postgresql":
+            return
+        try:
+            conn = wrapper.get_new_connection(wrapper.get_connection_params())
+            conn.autocommit = True
+            if not hasattr(conn, "poll"):
+                # psycopg2 API (poll/notifies) yo‘q — polling’da qolamiz
+                conn.close()
+                return
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{self.channel}"')
+            self._conn = conn
+            self.listening = True
+        except Exception:
+            self._conn = None
+            self.listening = False
+
+    def _drain(self) -> bool:
+        self._conn.poll()
+        got = bool(self._conn.notifies)
+        self._conn.notifies.clear()
+        return got
+
+    def wait(self, timeout: float, *, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        NOTIFY kelguncha yoki timeout tugaguncha kutadi.
+        Returns: True -> NOTIFY keldi, False -> timeout/stop.
+        """
+        deadline = time.monotonic() + max(0.0, float(timeout))
+
+        while True:
+            if should_stop and should_stop():
+                return False
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return False
+            slice_s = min(left, _WAIT_SLICE_SEC)
+
+            if self._conn is None:
+                time.sleep(slice_s)
+                continue
+
+            try:
+                if self._conn.notifies:
+                    return self._drain()
+                ready, _, _ = select.select([self._conn], [], [], slice_s)
+                if ready and self._drain():
+                    return True
+            except Exception:
+                # ulanish uzildi -> qayta ulanishga harakat, bo‘lmasa sleep
+                self.close()
+                time.sleep(slice_s)
+                self._connect()
+                if self.listening:
+                    return True  # uzilish paytida NOTIFY yo‘qolgan bo‘lishi mumkin -> navbatni tekshirsin
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        self.listening = False
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
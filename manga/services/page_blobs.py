@@ -0,0 +1,257 @@
+# manga/services/page_blobs.py
+"""
+Sahifa rasmlari uchun content-addressed storage.
+
+- Nom baytlarning sha256’idan: chapters/pages/ab/<sha256>.webp — bir xil rasm
+  (qayta yuklangan bob, har bobdagi bir xil kredit/reklama sahifalari) bir marta saqlanadi.
+- Reference count alohida hisoblagich emas — shu blobga ishora qiluvchi Page va
+  PageRendition qatorlari (content_hash indeksi bo‘yicha). Fayl oxirgi ishora
+  yo‘qolgandagina o‘chiriladi, va faqat commit’dan keyin (replace paytida eski sahifa
+  o‘chib, yangisi xuddi shu blobga ishora qilishi mumkin).
+- Commit bo‘lmagan ishoralar (job yuklagan/checkpoint’dagi yoki qayta ishlatayotgan
+  bloblar) — PendingPageBlob qatorlari: job blobga tegishdan (exists) oldin yozadi,
+  commit tranzaksiyasida o‘chiradi. release_blob ularni ham hisobga oladi.
+
+Bu modul models’ni import qilmaydi (models o‘zi bu yerdan foydalanadi) — Page lazy olinadi.
+"""
+import hashlib
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from .pdf_render import QualityTarget, choose_quality, encode_output, encode_renditions
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _page_model():
+    return apps.get_model("manga", "Page")
+
+
+def _referencing_models():
+    return apps.get_model("manga", "Page"), apps.get_model("manga", "PageRendition")
+
+
+def _pending_model():
+    return apps.get_model("manga", "PendingPageBlob")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_name(digest: str, ext: str = "webp") -> str:
+    """Page.image upload_to bilan: chapters/pages/ab/<digest>.<ext>"""
+    ext = (ext or "webp").lstrip(".").lower()
+    field = _page_model()._meta.get_field("image")
+    return field.generate_filename(None, f"{digest[:2]}/{digest}.{ext}")
+
+
+def digest_from_name(name: str) -> str:
+    """Content-addressed nom bo‘lsa sha256’ni qaytaradi, eski (legacy) nom bo‘lsa ""."""
+    stem = os.path.splitext(os.path.basename(name or ""))[0]
+    return stem if _DIGEST_RE.match(stem) else ""
+
+
+def store_blob(
+    data: bytes,
+    *,
+    ext: str = "webp",
+    digest: Optional[str] = None,
+    storage=None,
+) -> Tuple[str, str, bool]:
+    """
+    Blobni saqlaydi (bor bo‘lsa yuklamaydi).
+    Returns: (name, digest, created) — created=False bo‘lsa upload o‘tkazib yuborildi.
+    Thread-safe (DB’ga murojaat qilmaydi) — upload threadlarida chaqirsa bo‘ladi.
+    """
+    field = _page_model()._meta.get_field("image")
+    storage = storage or field.storage
+    digest = digest or content_hash(data)
+    name = blob_name(digest, ext)
+
+    if storage.exists(name):
+        return name, digest, False
+
+    saved = storage.save(name, ContentFile(data), max_length=field.max_length)
+    if saved != name:
+        # poyga: boshqa process shu payt yozib ulgurgan — storage muqobil nom berdi.
+        # Mazmun bir xil: kanonik nom ishlatiladi, muqobil nusxa o‘chiriladi
+        # (digest’siz nom release_blob’da tekshiruvsiz o‘chirilardi)
+        try:
+            storage.delete(saved)
+        except Exception:
+            pass
+        return name, digest, False
+    return name, digest, True
+
+
+def store_image_set(
+    data: bytes,
+    width: int,
+    height: int,
+    renditions=(),
+    *,
+    ext: str = "webp",
+    digest: Optional[str] = None,
+    storage=None,
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Asosiy rasm + eni variantlari (pdf_render.EncodedImage / encode_renditions natijasi).
+    Returns: (record, created) — record JSON’ga yaroqli (checkpoint’ga ham yoziladi):
+      {"name", "w", "h", "size", "r": [[eni, bo‘yi, name], ...], "new": [name, ...]}
+      (size — asosiy blob baytlari; r — asl enidan tashqari variantlar;
+      new — shu chaqiruv yangi yuklagan bloblar: xatolikda faqat shular o‘chiriladi)
+    created — asosiy blob yangi yuklandimi.
+    """
+    name, _, created = store_blob(data, ext=ext, digest=digest, storage=storage)
+    record = {"name": name, "w": int(width), "h": int(height), "size": len(data), "r": [], "new": []}
+    if created:
+        record["new"].append(name)
+    for w, h, rdata in renditions or ():
+        rname, _, rcreated = store_blob(rdata, ext="webp", storage=storage)
+        record["r"].append([int(w), int(h), rname])
+        if rcreated:
+            record["new"].append(rname)
+    return record, created
+
+
+def quality_target(quality: int) -> QualityTarget:
+    """settings’dagi adaptive WEBP parametrlari bilan (quality — yuqori chegara)."""
+    return QualityTarget(
+        quality=int(quality),
+        min_quality=int(getattr(settings, "PDF_WEBP_MIN_QUALITY", 0) or 0),
+        target_psnr=float(getattr(settings, "PDF_WEBP_TARGET_PSNR", 0.0) or 0.0),
+        max_bytes_per_mpx=int(getattr(settings, "PDF_WEBP_MAX_BYTES_PER_MPX", 0) or 0),
+    )
+
+
+def store_page_image(
+    img,
+    *,
+    original: Optional[bytes] = None,
+    ext: str = "webp",
+    quality: int = 80,
+    webp_method: int = 4,
+    adaptive: bool = False,
+    storage=None,
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Upload yo‘li (admin / Page.save): RGB PIL rasm -> store_image_set.
+    original berilsa — asosiy blob foydalanuvchi fayli o‘zi (qayta encode qilinmaydi),
+    aks holda WEBP (adaptive=True bo‘lsa settings’dagi adaptive quality bilan).
+    Variantlar (PAGE_RENDITION_WIDTHS) shu rasmdan.
+    """
+    widths = getattr(settings, "PAGE_RENDITION_WIDTHS", ())
+    target = quality_target(quality) if adaptive else QualityTarget(quality=int(quality))
+    if original is None:
+        enc = encode_output(img, quality=target, webp_method=webp_method, rendition_widths=widths)
+        return store_image_set(enc.data, enc.width, enc.height, enc.renditions, storage=storage)
+
+    q, _ = choose_quality(img, target, webp_method=webp_method)
+    rends = encode_renditions(img, widths, quality=q, webp_method=webp_method)
+    return store_image_set(original, img.width, img.height, rends, ext=ext, storage=storage)
+
+
+def page_fields(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Page ustunlari record’dan (ingest paytida): reader/admin storage’ga murojaat qilmasin.
+    Eski checkpoint record’larida size yo‘q — 0 (backfill_page_meta to‘ldiradi).
+    """
+    return {
+        "image": record["name"],
+        "content_hash": digest_from_name(record["name"]),
+        "width": int(record.get("w") or 0),
+        "height": int(record.get("h") or 0),
+        "file_size": int(record.get("size") or 0),
+    }
+
+
+def record_names(record: Dict[str, Any]) -> List[str]:
+    """store_image_set record’idagi barcha blob nomlari."""
+    return [record["name"]] + [r[2] for r in record.get("r", ())]
+
+
+def created_names(record: Dict[str, Any]) -> List[str]:
+    """Record yaratgan bloblar (eski checkpoint’larda "new" yo‘q — hech biri: yetim fayl > buzilgan sahifa)."""
+    return list(record.get("new", ()))
+
+
+def image_set_names(data: bytes, renditions=(), *, digest: Optional[str] = None, ext: str = "webp") -> List[str]:
+    """store_image_set yozadigan nomlar — yuklashdan oldin (pending ishora uchun)."""
+    names = [blob_name(digest or content_hash(data), ext)]
+    names.extend(blob_name(content_hash(rdata), "webp") for _, _, rdata in renditions or ())
+    return names
+
+
+def hold_blobs(names: Iterable[str], owner: str) -> None:
+    """Commit bo‘lmagan ishora: release_blob bu nomlarni owner qo‘yib yubormaguncha o‘chirmaydi."""
+    rows = [_pending_model()(name=n, owner=owner) for n in set(names) if n]
+    if rows:
+        _pending_model().objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def drop_holds(owner: str) -> None:
+    if owner:
+        _pending_model().objects.filter(owner=owner).delete()
+
+
+def build_renditions(page, record: Dict[str, Any]) -> list:
+    """
+    Page uchun PageRendition obyektlari (saqlanmagan — bulk_create uchun):
+    asl eni (Page.image bilan bitta blob) + kichik variantlar.
+    """
+    PageRendition = apps.get_model("manga", "PageRendition")
+    items = [(record["w"], record["h"], record["name"])] + [tuple(r) for r in record.get("r", ())]
+    return [
+        PageRendition(page=page, width=w, height=h, image=name, content_hash=digest_from_name(name))
+        for w, h, name in items
+        if w and h
+    ]
+
+
+def is_referenced(name: str) -> bool:
+    """Commit bo‘lgan (Page/PageRendition) yoki hali commit bo‘lmagan (PendingPageBlob) ishora bormi."""
+    digest = digest_from_name(name)
+    lookup = {"content_hash": digest, "image": name} if digest else {"image": name}
+    if any(model.objects.filter(**lookup).exists() for model in _referencing_models()):
+        return True
+    return _pending_model().objects.filter(name=name).exists()
+
+
+def release_blob(name: str, *, storage=None) -> bool:
+    """
+    Hech bir Page/PageRendition ishora qilmasa faylni o‘chiradi. Returns: o‘chirildimi.
+    Legacy (content-addressed bo‘lmagan) nomlar har doim bitta sahifaga tegishli —
+    ular uchun DB tekshiruvi qilinmaydi. Job’lar blobni exists()’dan oldin hold qiladi,
+    shuning uchun o‘chirilgandan keyin kelgan job blobni yo‘q deb ko‘rib qayta yuklaydi
+    (faqat tekshiruv bilan delete orasidagi millisekundlik oyna qoplanmaydi).
+    """
+    if not name:
+        return False
+    storage = storage or _page_model()._meta.get_field("image").storage
+    if digest_from_name(name) and is_referenced(name):
+        return False
+    try:
+        storage.delete(name)
+        return True
+    except Exception:
+        return False
+
+
+def release_blobs_on_commit(names: Iterable[str], *, storage=None) -> None:
+    """Tranzaksiya commit bo‘lgach (ishoralar yakunlangach) release_blob."""
+    names = [n for n in names if n]
+    if not names:
+        return
+
+    def _release():
+        for name in names:
+            release_blob(name, storage=storage)
+
+    transaction.on_commit(_release)
@@ -0,0 +1,148 @@
+# manga/services/page_delivery.py
+"""
+Sahifa rasmlarini o‘quvchiga yetkazish rejimi (settings.PAGE_DELIVERY):
+
+- "proxy" (default): URL — manga:page_image (read grant bilan); baytlar Django orqali
+  (FileResponse) yoki nginx X-Accel-Redirect orqali.
+- "cdn": chapter_read to‘g‘ridan-to‘g‘ri PAGE_CDN_DOMAIN’ga qisqa muddatli imzolangan URL beradi
+  (nginx secure_link formati). CDN tomonda:
+      secure_link $arg_md5,$arg_expires;
+      secure_link_md5 "$secure_link_expires$uri$remote_addr <PAGE_CDN_SECRET>";   # BIND_IP=True
+      secure_link_md5 "$secure_link_expires$uri <PAGE_CDN_SECRET>";               # BIND_IP=False
+      proxy_cache_key $uri;   # imzo har xil bo‘lsa ham kesh bitta
+- "presigned": Spaces/S3 presigned GET URL (storage.url(..., expire=...); querystring_auth=True
+  va imzosiz custom domain bo‘lmasligi kerak, aks holda URL imzosiz chiqadi).
+
+cdn/presigned rejimlarda rasm baytlari Python processlardan o‘tmaydi. Himoya faqat
+bucket obyektlari private bo‘lsa ma’noli: AWS_DEFAULT_ACL public bo‘lsa yoki
+AWS_QUERYSTRING_AUTH=False (storage imzosiz URL beradi — obyektlar public deb hisoblanadi)
+bo‘lsa, delivery_mode proxy’ga qaytadi, check_page_delivery esa startup’da xato beradi.
+Huquq tekshiruvi chapter_read’da (can_read) — URL’lar faqat o‘qish huquqi borlarga beriladi.
+"""
+import base64
+import hashlib
+import time
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import checks
+
+DELIVERY_PROXY = "proxy"
+DELIVERY_CDN = "cdn"
+DELIVERY_PRESIGNED = "presigned"
+
+# Muddat shu qadamga yaxlitlanadi: qayta ochilgan sahifada URL o‘zgarmaydi (brauzer keshi ishlaydi)
+EXPIRES_STEP = 60
+
+# Bu ACL’lar bilan obyekt bucket URL’i orqali hammaga ochiq — imzoli URL hech narsani himoya qilmaydi
+PUBLIC_ACLS = frozenset({"public-read", "public-read-write", "authenticated-read"})
+
+
+def _configured_mode() -> str:
+    return str(getattr(settings, "PAGE_DELIVERY", DELIVERY_PROXY) or DELIVERY_PROXY).lower()
+
+
+def public_objects_reason(storage=None) -> str:
+    """Bucket obyektlari public bo‘lsa — sababi (bo‘sh satr: private)."""
+    acl = getattr(storage, "default_acl", None) if storage is not None else None
+    if acl is None:
+        acl = getattr(settings, "AWS_DEFAULT_ACL", None)
+    params = getattr(storage, "object_parameters", None) or getattr(settings, "AWS_S3_OBJECT_PARAMETERS", {}) or {}
+    acl = params.get("ACL", acl)
+    if acl and str(acl).lower() in PUBLIC_ACLS:
+        return f"obyekt ACL’i {acl!r}"
+    querystring_auth = getattr(storage, "querystring_auth", None) if storage is not None else None
+    if querystring_auth is None:
+        querystring_auth = getattr(settings, "AWS_QUERYSTRING_AUTH", True)
+    if not querystring_auth:
+        return "AWS_QUERYSTRING_AUTH=False (storage imzosiz URL beradi)"
+    return ""
+
+
+def _presign_ready(storage) -> bool:
+    # custom domain’da storage.url() faqat cloudfront_signer bilan imzolaydi
+    if storage is None or not hasattr(storage, "connection"):
+        return False
+    return not getattr(storage, "custom_domain", None) or getattr(storage, "cloudfront_signer", None) is not None
+
+
+def delivery_mode(storage=None) -> str:
+    """Sozlangan rejim; kerakli sozlama/storage bo‘lmasa yoki obyektlar public bo‘lsa — proxy (xavfsiz default)."""
+    mode = _configured_mode()
+    if mode not in (DELIVERY_CDN, DELIVERY_PRESIGNED) or public_objects_reason(storage):
+        return DELIVERY_PROXY
+    if mode == DELIVERY_CDN and getattr(settings, "PAGE_CDN_SECRET", "") and _cdn_domain():
+        return DELIVERY_CDN
+    if mode == DELIVERY_PRESIGNED and _presign_ready(storage):
+        return DELIVERY_PRESIGNED
+    return DELIVERY_PROXY
+
+
+def check_page_delivery(app_configs=None, **kwargs):
+    """System check: cdn/presigned rejim public bucket bilan — startup’da xato (jim proxy emas)."""
+    mode = _configured_mode()
+    if mode not in (DELIVERY_CDN, DELIVERY_PRESIGNED):
+        return []
+    reason = public_objects_reason()
+    if not reason:
+        return []
+    return [
+        checks.Error(
+            f"PAGE_DELIVERY={mode!r} sahifalarni himoya qilmaydi: {reason}.",
+            hint='AWS_DEFAULT_ACL="private" va AWS_QUERYSTRING_AUTH=True qiling yoki PAGE_DELIVERY="proxy".',
+            id="manga.E001",
+        )
+    ]
+
+
+def url_ttl() -> int:
+    return int(getattr(settings, "PAGE_URL_TTL", 0) or getattr(settings, "PAGE_GRANT_MAX_AGE", 600))
+
+
+def client_ip(request) -> str:
+    # nginx ortida: X-Real-IP (nginx o‘zi qo‘yadi), aks holda REMOTE_ADDR
+    return request.META.get("HTTP_X_REAL_IP") or request.META.get("REMOTE_ADDR", "")
+
+
+def _cdn_domain() -> str:
+    return getattr(settings, "PAGE_CDN_DOMAIN", "") or getattr(settings, "AWS_S3_CUSTOM_DOMAIN", "")
+
+
+def _expires(ttl: int, now: Optional[float] = None) -> int:
+    now = time.time() if now is None else now
+    return (int(now + ttl) // EXPIRES_STEP + 1) * EXPIRES_STEP
+
+
+def cdn_signed_url(name: str, *, expires: int, ip: str = "") -> str:
+    """nginx secure_link_md5: base64url(md5("<expires><uri><ip> <secret>"))."""
+    uri = "/" + quote(name)
+    raw = f"{expires}{uri}{ip} {settings.PAGE_CDN_SECRET}".encode()
+    token = base64.urlsafe_b64encode(hashlib.md5(raw).digest()).rstrip(b"=").decode()
+    return f"https://{_cdn_domain()}{uri}?md5={token}&expires={expires}"
+
+
+def presigned_url(name: str, *, storage, ttl: int) -> str:
+    """S3/Spaces presigned GET — storage’ning ochiq API’si (location/custom domain’ni o‘zi hisobga oladi)."""
+    return storage.url(name, expire=int(ttl))
+
+
+class DirectUrls:
+    """Bitta chapter_read so‘rovi uchun to‘g‘ridan-to‘g‘ri URL yasovchi (muddat/IP bir marta hisoblanadi)."""
+
+    def __init__(self, mode: str, *, storage, request):
+        self.mode = mode
+        self.storage = storage
+        self.ttl = url_ttl()
+        self.expires = _expires(self.ttl)
+        self.ip = client_ip(request) if getattr(settings, "PAGE_CDN_BIND_IP", False) else ""
+
+    def url(self, name: str) -> str:
+        if self.mode == DELIVERY_CDN:
+            return cdn_signed_url(name, expires=self.expires, ip=self.ip)
+        return presigned_url(name, storage=self.storage, ttl=self.ttl)
+
+    def page(self, page) -> Tuple[str, str]:
+        """(asl rasm URL, srcset) — renditions prefetch qilingan bo‘lishi kerak."""
+        srcset = ", ".join(f"{self.url(r.image.name)} {r.width}w" for r in page.renditions.all())
+        return self.url(page.image.name), srcset
@@ -0,0 +1,1208 @@
+# manga/services/pdf_render.py
+"""
+PDF sahifalarini render qilish + WEBP encode (Django’siz qism).
+
+Bu modul ataylab Django/model import qilmaydi: parallel rejimda
+alohida (spawn) processlar shu modulni import qiladi va har biri
+o‘zining pdfium.PdfDocument’ini ochadi.
+"""
+import ctypes
+import ctypes.util
+import math
+import multiprocessing
+import os
+import signal
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from multiprocessing.util import Finalize
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import pypdfium2 as pdfium
+from PIL import Image, ImageChops, ImageOps, ImageStat
+
+try:
+    import numpy as np
+except ImportError:  # numpy bo‘lmasa PIL varianti ishlaydi
+    np = None
+
+WEBP_MAX_DIM = 16383
+CHUNK_HEIGHT = 12000  # split_long_pages=True bo‘lsa ishlaydi (maksimal bo‘lak bo‘yi, default)
+
+# Gutter-aware split: bo‘lak [GUTTER_MIN_FRACTION*chunk .. chunk] oralig‘idagi bo‘sh qatorlardan kesiladi
+GUTTER_MIN_FRACTION = 0.5
+GUTTER_MIN_ROWS = 3  # preview px: bundan qisqa bo‘sh joy gutter emas (harf orasi va h.k.)
+GUTTER_TOLERANCE = 8  # qator "bir xil rangli" — kanal bo‘yicha max-min shundan oshmasa
+
+# Band render: katta bitmap gorizontal bandlarda chiziladi (peak xotira sahifa bo‘yiga bog‘liq emas)
+BAND_PIXELS = 8_000_000  # bitta band (px) — ~24 MB BGR
+BAND_MIN_ROWS = 64
+BAND_OVERLAP_ROWS = 4  # rastr rasm interpolatsiyasi clip chetida farq qiladi — qo‘shni qatorlar ham chiziladi
+
+MIN_DPI = 144
+MAX_DPI = 450
+
+PREVIEW_MAX_WIDTH_PX = 700  # margin aniqlash uchun preview eni
+DEFAULT_PAGE_SIZE = (595.0, 842.0)  # A4 (PDF unit) — o‘lcham o‘qilmasa
+
+# Adaptive quality: qidiruv butun rasmda emas, teng oraliqdagi qator bandlarida
+QUALITY_SAMPLE_BANDS = 4
+QUALITY_SAMPLE_ROWS = 128
+QUALITY_STEP = 2
+
+
+def _safe_close(obj) -> None:
+    try:
+        obj.close()
+    except Exception:
+        pass
+
+
+def _content_bbox_px(img: Image.Image, *, threshold: int = 18) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Oq fondan farq qiladigan kontent chegarasi (left, top, right, bottom) px.
+    Hammasi oq bo‘lsa — None.
+    """
+    bg = Image.new("RGB", img.size, (255, 255, 255))
+    diff = ImageChops.difference(img, bg).convert("L")
+    diff = ImageOps.autocontrast(diff)
+    diff = diff.point(lambda p: 255 if p > threshold else 0)
+    return diff.getbbox()
+
+
+# PIL "RGB" -> "L" (butun sonli ITU-R 601-2): L = (R*19595 + G*38470 + B*7471 + 0x8000) >> 16
+LUMA_WEIGHTS = (19595, 38470, 7471)
+# Vaznlar yig‘indisi 65536: farq (255 - kanal) luma’si = (LUMA_TOP - kanallar vaznli yig‘indisi) >> 16
+LUMA_TOP = 255 * 65536 + 0x8000
+LUMA_CHUNK_ROWS = 512  # shuncha qatordan hisoblanadi (uint32 oraliq massiv kichik bo‘lsin)
+
+
+def _content_bbox_np(arr, *, threshold: int = 18, step: int = 1, bgr: bool = True) -> Optional[Tuple[int, int, int, int]]:
+    """
+    _content_bbox_px’ning NumPy varianti (step=1 da natija aynan bir xil): pdfium bitmap
+    buferi ustida (to_numpy — nusxasiz view), oraliq PIL rasmlarsiz.
+    bgr — kanal tartibi (pdfium default BGR); step > 1 bo‘lsa har step-chi qator olinadi.
+    Natija (left, top, right, bottom) — to‘liq bitmap px’ida.
+    """
+    col_max, row_max, lo = _bbox_reductions(arr, step=step, bgr=bgr)
+    return _bbox_from_reductions(col_max, row_max, lo, arr.shape[0], threshold=threshold, step=step)
+
+
+def _luma_sum(arr, *, bgr: bool = True):
+    """Kanallarning L vaznli yig‘indisi (uint32); kulrang bitmap — qiymat * 65536."""
+    if arr.ndim == 2:
+        return arr.astype(np.uint32) << 16
+    weights = LUMA_WEIGHTS[::-1] if bgr else LUMA_WEIGHTS
+    total = np.multiply(arr[:, :, 0], np.uint32(weights[0]), dtype=np.uint32)
+    part = np.empty_like(total)
+    for channel in (1, 2):
+        np.multiply(arr[:, :, channel], np.uint32(weights[channel]), out=part, dtype=np.uint32)
+        total += part
+    return total
+
+
+def _diff_luma(total):
+    # ImageChops.difference(oq fon).convert("L") bilan aynan bir xil (vaznli yig‘indidan)
+    return ((LUMA_TOP - np.asarray(total, dtype=np.int64)) >> 16).astype(np.uint8)
+
+
+def _bbox_reductions(arr, *, step: int = 1, bgr: bool = True):
+    """
+    _content_bbox_np’ning reduksiya qismi: (ustun max, qator max, eng kichik qiymat) — farq luma’si bo‘yicha.
+    Bandlar bo‘yicha birlashtirsa bo‘ladi (ustun — maksimum, qator — ulash, eng kichik — minimum).
+    """
+    # Luma yig‘indiga nisbatan kamayuvchi: har piksel uchun luma o‘rniga yig‘indining
+    # min/max reduksiyalari olinadi, luma’ga faqat natijalar o‘giriladi.
+    view = arr[::max(1, int(step))]
+    col_min, row_parts, top = None, [], 0
+    for y0 in range(0, view.shape[0], LUMA_CHUNK_ROWS):
+        total = _luma_sum(view[y0:y0 + LUMA_CHUNK_ROWS], bgr=bgr)
+        c = total.min(axis=0)
+        col_min = c if col_min is None else np.minimum(col_min, c)
+        row_parts.append(total.min(axis=1))
+        top = max(top, int(total.max()))
+    if col_min is None:
+        return np.zeros(arr.shape[1], dtype=np.uint8), np.zeros(0, dtype=np.uint8), 0
+    return _diff_luma(col_min), _diff_luma(np.concatenate(row_parts)), int(_diff_luma(top))
+
+
+def _autocontrast_cut(lo: int, hi: int, threshold: int) -> int:
+    """Eng kichik luma: ImageOps.autocontrast LUT’idan keyin threshold’dan oshadi (256 — hech biri)."""
+    if hi <= lo:
+        scale, offset = 1.0, 0.0
+    else:
+        scale = 255.0 / (hi - lo)
+        offset = -lo * scale
+    for ix in range(256):
+        if min(255, max(0, int(ix * scale + offset))) > threshold:
+            return ix
+    return 256
+
+
+def _bbox_from_reductions(
+    col_max,
+    row_max,
+    lo: int,
+    height: int,
+    *,
+    threshold: int = 18,
+    step: int = 1,
+) -> Optional[Tuple[int, int, int, int]]:
+    step = max(1, int(step))
+    if not row_max.size:
+        return None
+    # autocontrast LUT monoton: "LUT(L) > threshold" <=> "L >= cut"
+    cut = _autocontrast_cut(lo, int(col_max.max()), threshold)
+    cols = np.flatnonzero(col_max >= cut)
+    if not cols.size:
+        return None
+    rows_idx = np.flatnonzero(row_max >= cut)
+
+    return (
+        int(cols[0]),
+        int(rows_idx[0]) * step,
+        int(cols[-1]) + 1,
+        min(height, (int(rows_idx[-1]) + 1) * step),
+    )
+
+
+def _is_bgr(bmp: "pdfium.PdfBitmap") -> bool:
+    return str(getattr(bmp, "mode", "BGR")).startswith("BGR")
+
+
+def _bitmap_bbox(
+    bmp: "pdfium.PdfBitmap",
+    *,
+    threshold: int = 18,
+    step: int = 1,
+) -> Optional[Tuple[int, int, int, int]]:
+    """Bitmap kontent chegarasi (px). NumPy bo‘lsa — bevosita bufer ustida."""
+    if np is not None:
+        return _content_bbox_np(bmp.to_numpy(), threshold=threshold, step=step, bgr=_is_bgr(bmp))
+
+    img = bmp.to_pil().convert("RGB")
+    if step > 1:
+        img = img.reduce(step)
+    bbox = _content_bbox_px(img, threshold=threshold)
+    if not bbox:
+        return None
+    return (
+        bbox[0] * step,
+        bbox[1] * step,
+        min(bmp.width, bbox[2] * step),
+        min(bmp.height, bbox[3] * step),
+    )
+
+
+class _PageRef:
+    """
+    Sahifa + (ixtiyoriy) uni qayta ochish. pdfium dekodlangan rasmlar keshini sahifa
+    yopilgandagina bo‘shatadi: uzun strip’ni bandlab chizganda har banddan keyin
+    refresh() — kesh (ya’ni xotira) sahifa bo‘yi bilan o‘smaydi.
+    Chaqiruvchining sahifasi chaqiruvchida yopiladi; bu yerda ochilganlari — close()’da.
+    """
+
+    def __init__(self, page: "pdfium.PdfPage", reload: Optional[Callable[[], "pdfium.PdfPage"]] = None):
+        self.page = page
+        self._reload = reload
+        self._own = False
+        self.refreshed = False
+
+    def refresh(self) -> None:
+        if self._reload is None:
+            return
+        old, own = self.page, self._own
+        self.page = self._reload()
+        self._own = True
+        self.refreshed = True
+        if own:
+            _safe_close(old)
+
+    def close(self) -> None:
+        if self._own:
+            _safe_close(self.page)
+            self._own = False
+
+
+_LIBC = None
+
+
+def _trim_heap() -> None:
+    """glibc: bo‘shatilgan katta bloklarni OSga qaytarish (malloc_trim). Boshqa platformada — hech narsa."""
+    global _LIBC
+    if _LIBC is None:
+        try:
+            lib = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+            _LIBC = lib if hasattr(lib, "malloc_trim") else False  # musl/macOS’da yo‘q
+        except OSError:
+            _LIBC = False
+    if _LIBC:
+        _LIBC.malloc_trim(0)
+
+
+def rss_mb() -> Optional[float]:
+    """
+    Joriy process + uning child’lari (render pool) RSS yig‘indisi, MB.
+    /proc bo‘lmasa (Linux emas) None.
+    """
+    page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+    total = 0
+    for pid in [os.getpid()] + [p.pid for p in multiprocessing.active_children()]:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page
+        except (OSError, ValueError, IndexError):
+            if pid == os.getpid():
+                return None
+    return total / (1024 * 1024)
+
+
+def _add_time(meta: Dict[str, Any], stage: str, t0: float) -> None:
+    """meta["timings"][stage] += t0’dan beri o‘tgan vaqt (sec) — bosqichlar statistikasi."""
+    timings = meta.setdefault("timings", {})
+    timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - t0)
+
+
+def _px_units(px: int, scale: float) -> float:
+    """pypdfium2 crop’ni ceil(c * scale) qiladi: shu unit aynan `px` pikselga aylanadi."""
+    return 0.0 if px <= 0 else (float(px) - 0.5) / float(scale)
+
+
+def _band_layout(
+    page: "pdfium.PdfPage",
+    scale: float,
+    crop: Tuple[float, float, float, float],
+    band_pixels: int,
+) -> Tuple[int, int, int, Tuple[int, int, int, int]]:
+    """
+    page.render(scale, crop) bitmap’ining o‘lchami (pypdfium2 formulasi bilan) va band bo‘yi.
+    Returns: (width, height, band_rows, crop_px) — band_rows >= height bo‘lsa bitta render.
+    """
+    src_w = math.ceil(page.get_width() * scale)
+    src_h = math.ceil(page.get_height() * scale)
+    crop_px = tuple(math.ceil(c * scale) for c in crop)
+    width = max(1, src_w - crop_px[0] - crop_px[2])
+    height = max(1, src_h - crop_px[1] - crop_px[3])
+    if band_pixels <= 0:
+        return width, height, height, crop_px
+    return width, height, max(BAND_MIN_ROWS, int(band_pixels) // width), crop_px
+
+
+def _render_bands(
+    ref: _PageRef,
+    scale: float,
+    crop: Tuple[float, float, float, float],
+    band_pixels: int,
+    *,
+    overlap: int = 0,
+):
+    """
+    crop (left, bottom, right, top — unit) hududini gorizontal bandlarga bo‘lib render qiladi.
+    Yields: (y0, y1, bitmap, off) — bitmap’ning off-qatori hududning y0-qatori; bitmap
+    keyingi qadamda yopiladi. Band chegaralari pdfium piksel to‘rida; overlap > 0 bo‘lsa
+    band yuqori/pastdan shuncha qator ortiq chiziladi (chokda rastr interpolatsiyasi bir xil bo‘lsin).
+    Xotira: bitta band (band_pixels) — sahifa bo‘yiga bog‘liq emas (bandlar orasida ref.refresh()).
+    """
+    width, height, rows, crop_px = _band_layout(ref.page, scale, crop, band_pixels)
+    left, _, right, _ = crop
+    if rows < height and not ref.refreshed:
+        ref.refresh()  # chaqiruvchining sahifasi (u yopguncha yashaydi) keshni yig‘may qolsin
+    for y0 in range(0, height, rows):
+        y1 = min(height, y0 + rows)
+        if rows >= height:
+            band_crop, off = crop, 0
+        else:
+            top = max(0, y0 - overlap)
+            bottom = min(height, y1 + overlap)
+            band_crop = (
+                left,
+                _px_units(crop_px[1] + (height - bottom), scale),
+                right,
+                _px_units(crop_px[3] + top, scale),
+            )
+            off = y0 - top
+        bmp = ref.page.render(scale=scale, crop=band_crop)
+        try:
+            yield y0, y1, bmp, off
+        finally:
+            _safe_close(bmp)
+        if rows < height:
+            ref.refresh()
+
+
+def _render_rgb(
+    ref: _PageRef,
+    scale: float,
+    crop: Tuple[float, float, float, float],
+    band_pixels: int = 0,
+) -> Image.Image:
+    """
+    render -> RGB PIL. Katta hudud bandlab chiziladi: to‘liq BGR bitmap + uning nusxalari
+    o‘rniga faqat yakuniy RGB rasm + bitta band xotirada turadi.
+    """
+    width, height, rows, _ = _band_layout(ref.page, scale, crop, band_pixels)
+    if rows >= height:
+        bmp = ref.page.render(scale=scale, crop=crop)
+        try:
+            return bmp.to_pil().convert("RGB")
+        finally:
+            _safe_close(bmp)
+
+    img = Image.new("RGB", (width, height), (255, 255, 255))
+    for y0, y1, bmp, off in _render_bands(ref, scale, crop, band_pixels, overlap=BAND_OVERLAP_ROWS):
+        band = bmp.to_pil().convert("RGB")
+        img.paste(band.crop((0, off, width, off + (y1 - y0))), (0, y0))
+    return img
+
+
+def _scan_bands(
+    ref: _PageRef,
+    scale: float,
+    band_pixels: int,
+    *,
+    threshold: int = 18,
+    want_blank: bool = False,
+) -> Tuple[Optional[Tuple[int, int, int, int]], Any, int, int]:
+    """
+    Preview’ni bandlab skan qiladi (faqat NumPy): kontent bbox + (ixtiyoriy) bo‘sh qatorlar.
+    Returns: (bbox, blank_rows | None, width, height)
+    """
+    width, height, _, _ = _band_layout(ref.page, scale, (0.0, 0.0, 0.0, 0.0), band_pixels)
+    col_max, row_parts, blank_parts, lo = None, [], [], 255
+    for _, _, bmp, _ in _render_bands(ref, scale, (0.0, 0.0, 0.0, 0.0), band_pixels):
+        c, r, low = _bbox_reductions(bmp.to_numpy(), bgr=_is_bgr(bmp))
+        col_max = c if col_max is None else np.maximum(col_max, c)
+        row_parts.append(r)
+        lo = min(lo, low)
+        if want_blank:
+            blank_parts.append(_blank_rows(bmp))
+    bbox = _bbox_from_reductions(col_max, np.concatenate(row_parts), lo, height, threshold=threshold)
+    return bbox, (np.concatenate(blank_parts) if want_blank else None), width, height
+
+
+def _blank_rows(bmp: Union["pdfium.PdfBitmap", Image.Image], *, tolerance: int = GUTTER_TOLERANCE):
+    """
+    Har qator uchun: bir xil rangli (gutter bo‘lishi mumkin) mi. Fon oq bo‘lishi shart emas —
+    qora/rangli gutterlar ham. NumPy bo‘lsa bufer ustida vektorli, aks holda PIL bilan qatorma-qator.
+    bmp — pdfium bitmap yoki (rasm arxivlari uchun) RGB PIL rasm.
+    """
+    is_pil = isinstance(bmp, Image.Image)
+    if np is not None:
+        arr = np.asarray(bmp) if is_pil else bmp.to_numpy()
+        if arr.ndim == 3:
+            arr = arr[:, :, :3]
+        spread = arr.max(axis=1).astype(np.int16) - arr.min(axis=1)
+        if spread.ndim == 2:
+            spread = spread.max(axis=1)
+        return spread <= tolerance
+
+    img = (bmp if is_pil else bmp.to_pil()).convert("RGB")
+    out = []
+    for y in range(img.height):
+        extrema = img.crop((0, y, img.width, y + 1)).getextrema()
+        out.append(max(hi - lo for lo, hi in extrema) <= tolerance)
+    return out
+
+
+def _blank_runs(blank, *, min_rows: int = GUTTER_MIN_ROWS) -> List[Tuple[int, int]]:
+    """Ketma-ket bo‘sh qatorlar: [(start, end), ...] (end — exclusive), min_rows’dan qisqalari tashlanadi."""
+    if np is not None:
+        flags = np.concatenate(([0], np.asarray(blank, dtype=np.int8), [0]))
+        edges = np.flatnonzero(np.diff(flags))
+        runs = zip(edges[0::2].tolist(), edges[1::2].tolist())
+    else:
+        runs, start = [], None
+        for y, b in enumerate(list(blank) + [False]):
+            if b and start is None:
+                start = y
+            elif not b and start is not None:
+                runs.append((start, y))
+                start = None
+    return [(a, b) for a, b in runs if b - a >= min_rows]
+
+
+def _gutter_cuts(
+    runs: List[Tuple[int, int]],
+    top: int,
+    bottom: int,
+    chunk: float,
+    *,
+    min_fraction: float = GUTTER_MIN_FRACTION,
+) -> List[int]:
+    """
+    [top, bottom) px oralig‘ini bo‘laklash nuqtalari (px). Har kesim oldingisidan
+    [min_fraction*chunk .. chunk] uzoqlikda: shu oynadagi eng pastki gutter o‘rtasi,
+    gutter bo‘lmasa — aynan chunk (eski "ko‘r" kesim). Bo‘lak hech qachon chunk’dan uzun emas.
+    """
+    cuts: List[int] = []
+    start = top
+    chunk = max(1.0, float(chunk))
+    while bottom - start > chunk:
+        lo = start + max(1, int(chunk * min_fraction))
+        hi = start + int(chunk)
+        cut = hi
+        for a, b in reversed(runs):
+            if a >= hi:
+                continue
+            if b <= lo:
+                break
+            cut = max(lo, min(hi, (max(a, lo) + min(b, hi)) // 2))
+            break
+        cuts.append(cut)
+        start = cut
+    return cuts
+
+
+def _vertical_crop_units(
+    bbox: Optional[Tuple[int, int, int, int]],
+    img_height: int,
+    px_scale: float,
+    h_units: float,
+    *,
+    pad_px: int,
+) -> Tuple[float, float]:
+    """bbox (px) -> (crop_top, crop_bottom) PDF unit’da (uzun strip bo‘laklash uchun)."""
+    if not bbox:
+        return 0.0, 0.0
+
+    _, top_px, _, bottom_px = bbox
+    top_px = max(0, top_px - pad_px)
+    bottom_px = min(img_height, bottom_px + pad_px)
+
+    crop_top_units = float(top_px) / float(px_scale)
+    crop_bottom_units = float(img_height - bottom_px) / float(px_scale)
+
+    if h_units - crop_top_units - crop_bottom_units < 1.0:
+        return 0.0, 0.0
+    return crop_top_units, crop_bottom_units
+
+
+def _crop_units_from_bbox(
+    bbox: Optional[Tuple[int, int, int, int]],
+    img_width: int,
+    px_scale: float,
+    w_units: float,
+    *,
+    pad_px: int,
+) -> Tuple[float, float]:
+    """bbox (px) -> (crop_left, crop_right) PDF unit’da. Kontent juda tor bo‘lsa crop yo‘q."""
+    if not bbox:
+        return 0.0, 0.0
+
+    left_px, _, right_px, _ = bbox
+    left_px = max(0, left_px - pad_px)
+    right_px = min(img_width, right_px + pad_px)
+
+    crop_left_units = float(left_px) / float(px_scale)
+    crop_right_units = float(img_width - right_px) / float(px_scale)
+
+    crop_left_units = max(0.0, min(crop_left_units, w_units - 1.0))
+    crop_right_units = max(0.0, min(crop_right_units, w_units - 1.0))
+
+    content_w = w_units - crop_left_units - crop_right_units
+    if content_w <= w_units * 0.35:
+        return 0.0, 0.0
+
+    return crop_left_units, crop_right_units
+
+
+def _preview_scale(w_units: float, preview_max_width_px: int = PREVIEW_MAX_WIDTH_PX) -> float:
+    preview_scale = float(preview_max_width_px) / float(w_units)
+    return max(0.20, min(preview_scale, 2.0))
+
+
+def _detect_content_crop_units(
+    page: "pdfium.PdfPage",
+    w_units: float,
+    h_units: float,
+    *,
+    preview_max_width_px: int = PREVIEW_MAX_WIDTH_PX,
+    threshold: int = 18,
+    pad_px: int = 12,
+) -> Tuple[float, float]:
+    """
+    Sahifaning yon (left/right) oq marginlarini topadi va PDF unit’da qaytaradi.
+    Tez preview render bilan ishlaydi.
+    """
+    if w_units <= 0:
+        return 0.0, 0.0
+
+    preview_scale = _preview_scale(w_units, preview_max_width_px)
+
+    bmp = page.render(scale=preview_scale)
+    try:
+        img = bmp.to_pil().convert("RGB")
+        bbox = _content_bbox_px(img, threshold=threshold)
+        return _crop_units_from_bbox(bbox, img.width, preview_scale, w_units, pad_px=pad_px)
+    finally:
+        _safe_close(bmp)
+
+
+def _pick_scale(
+    *,
+    content_w_units: float,
+    h_units: float,
+    target_w_px: int,
+    min_dpi: int,
+    max_dpi: int,
+    force_single_image: bool,
+) -> float:
+    """
+    Scale tanlash:
+    - width bo‘yicha target_w_px ga chiqadi
+    - min_dpi dan pastga tushmaslikka harakat qiladi
+    - max_dpi dan oshirmaydi
+    - WEBP_MAX_DIM limitdan oshirmaydi
+    - force_single_image=True bo‘lsa: height ham WEBP_MAX_DIM dan oshmasin (1 sahifa = 1 WEBP)
+    """
+    content_w_units = max(1.0, float(content_w_units))
+    h_units = max(1.0, float(h_units))
+
+    scale_by_width = float(target_w_px) / float(content_w_units)
+    scale_by_dpi = float(min_dpi) / 72.0
+    scale = max(scale_by_width, scale_by_dpi)
+
+    scale = min(scale, float(max_dpi) / 72.0)
+    scale = min(scale, float(WEBP_MAX_DIM) / float(content_w_units))
+
+    if force_single_image:
+        scale = min(scale, float(WEBP_MAX_DIM) / float(h_units))
+
+    return max(scale, 0.10)
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    """Bitta chiqish WEBP + shu decode’dan olingan kichik enli variantlari."""
+    data: bytes
+    width: int
+    height: int
+    renditions: Tuple[Tuple[int, int, bytes], ...] = ()  # (eni, bo‘yi, webp) — eni kamayish tartibida
+    quality: int = 0
+    bytes_saved: int = 0  # adaptive quality: maksimal quality’ga nisbatan tejalgan bayt (taxminiy)
+
+
+@dataclass(frozen=True)
+class QualityTarget:
+    """
+    Adaptive WEBP quality (min_quality < quality bo‘lsa yoqiladi):
+    - target_psnr: shu (dB) dan past tushmaydigan eng kichik quality (tekis sahifalar kichrayadi)
+    - max_bytes_per_mpx: megapiksel uchun bayt byudjeti (zich rangli sahifalar)
+    Ikkalasi ham min_quality .. quality oralig‘ida; byudjet psnr’dan ustun emas — quality
+    min_quality’dan pastga tushmaydi.
+    """
+    quality: int
+    min_quality: int = 0
+    target_psnr: float = 0.0
+    max_bytes_per_mpx: int = 0
+
+    @property
+    def adaptive(self) -> bool:
+        return 0 < self.min_quality < self.quality and (self.target_psnr > 0 or self.max_bytes_per_mpx > 0)
+
+
+def _fit_webp(img: Image.Image) -> Image.Image:
+    # safety: limitdan oshsa kichraytirish
+    if img.width > WEBP_MAX_DIM or img.height > WEBP_MAX_DIM:
+        ratio = min(WEBP_MAX_DIM / img.width, WEBP_MAX_DIM / img.height)
+        img = img.resize(
+            (max(1, int(img.width * ratio)), max(1, int(img.height * ratio))),
+            Image.LANCZOS,
+        )
+    return img
+
+
+def _encode_image(img: Image.Image, *, quality: int, webp_method: int) -> bytes:
+    img = _fit_webp(img)
+    buf = BytesIO()
+    img.save(buf, format="WEBP", quality=quality, method=webp_method)
+    return buf.getvalue()
+
+
+def _quality_sample(img: Image.Image) -> Image.Image:
+    """Qidiruv uchun namuna: teng oraliqdagi QUALITY_SAMPLE_BANDS ta band (asl o‘lchamda)."""
+    bands, rows = QUALITY_SAMPLE_BANDS, QUALITY_SAMPLE_ROWS
+    if img.height <= bands * rows:
+        return img
+    sample = Image.new("RGB", (img.width, bands * rows))
+    gap = (img.height - rows) / float(bands - 1)
+    for k in range(bands):
+        top = int(k * gap)
+        sample.paste(img.crop((0, top, img.width, top + rows)), (0, k * rows))
+    return sample
+
+
+def _psnr(a: Image.Image, data: bytes) -> float:
+    decoded = Image.open(BytesIO(data)).convert("RGB")
+    rms = ImageStat.Stat(ImageChops.difference(a, decoded)).rms
+    mse = sum(v * v for v in rms) / float(len(rms))
+    return 99.0 if mse <= 0 else 10.0 * math.log10(255.0 * 255.0 / mse)
+
+
+def choose_quality(
+    img: Image.Image,
+    target: QualityTarget,
+    *,
+    webp_method: int,
+    encoded: Optional[Dict[int, bytes]] = None,
+) -> Tuple[int, float]:
+    """
+    Namunada quality qidiradi. Returns: (quality, ratio) —
+    ratio = namuna hajmi(target.quality) / namuna hajmi(tanlangan) (>= 1, tejash taxmini uchun).
+
+    Reference encode (target.quality) bir marta qilinadi va qidiruvning birinchi qadami ham
+    shu: u talabga javob bermasa qidiruv umuman bo‘lmaydi. encoded berilsa va namuna
+    rasmning o‘zi bo‘lsa (past sahifa) — {quality: bayt} shu yerga yoziladi: chaqiruvchi
+    tanlangan quality’ni qayta encode qilmaydi.
+    """
+    hi = int(target.quality)
+    if not target.adaptive:
+        return hi, 1.0
+
+    sample = _quality_sample(img)
+    mpx = sample.width * sample.height / 1e6
+    cache: Dict[int, bytes] = encoded if (encoded is not None and sample is img) else {}
+
+    def _data(q: int) -> bytes:
+        if q not in cache:
+            cache[q] = _encode_image(sample, quality=q, webp_method=webp_method)
+        return cache[q]
+
+    def _psnr_ok(q: int) -> bool:
+        return _psnr(sample, _data(q)) >= target.target_psnr
+
+    def _over_budget(q: int) -> bool:
+        return len(_data(q)) > target.max_bytes_per_mpx * mpx
+
+    ladder = list(range(int(target.min_quality), hi, QUALITY_STEP)) + [hi]
+
+    def _lowest(ok, upto: int) -> int:
+        # ok(q) quality bo‘yicha monoton deb olinadi: ladder[:upto+1] ichida ok bo‘lgan eng kichik pog‘ona
+        # (ladder[upto] ok deb ma’lum — qayta tekshirilmaydi)
+        lo_i, hi_i = 0, upto
+        while lo_i < hi_i:
+            mid = (lo_i + hi_i) // 2
+            if ok(ladder[mid]):
+                hi_i = mid
+            else:
+                lo_i = mid + 1
+        return lo_i
+
+    top = len(ladder) - 1
+    idx = top
+    # reference (hi) — birinchi qadam: PSNR’ni hi ham bermasa pastga tushishning ma’nosi yo‘q
+    if target.target_psnr > 0 and _psnr_ok(hi):
+        idx = _lowest(_psnr_ok, top)
+    if target.max_bytes_per_mpx > 0 and _over_budget(ladder[idx]):
+        over = _lowest(_over_budget, idx)
+        idx = max(0, over - 1)
+
+    q = ladder[idx]
+    return q, len(_data(hi)) / float(max(1, len(_data(q))))
+
+
+def encode_renditions(
+    img: Image.Image,
+    widths,
+    *,
+    quality: int,
+    webp_method: int,
+) -> Tuple[Tuple[int, int, bytes], ...]:
+    """
+    img’dan kichikroq enli WEBP variantlar (faqat img.width’dan tor enlar).
+    Kaskad: har biri oldingi (kattaroq) variantdan kichraytiriladi — arzonroq.
+    """
+    out = []
+    src = img
+    for w in sorted({int(w) for w in (widths or ()) if 0 < int(w) < img.width}, reverse=True):
+        h = max(1, int(round(img.height * w / float(img.width))))
+        src = src.resize((w, h), Image.LANCZOS)
+        out.append((w, h, _encode_image(src, quality=quality, webp_method=webp_method)))
+    return tuple(out)
+
+
+def encode_output(
+    img: Image.Image,
+    *,
+    quality: Union[int, QualityTarget],
+    webp_method: int,
+    rendition_widths=(),
+) -> EncodedImage:
+    """quality int bo‘lsa — o‘zgarmas; QualityTarget bo‘lsa — choose_quality (variantlar ham shu quality’da)."""
+    img = _fit_webp(img)
+    target = quality if isinstance(quality, QualityTarget) else QualityTarget(quality=int(quality))
+    encoded: Dict[int, bytes] = {}
+    q, ratio = choose_quality(img, target, webp_method=webp_method, encoded=encoded)
+
+    data = encoded.get(q) or _encode_image(img, quality=q, webp_method=webp_method)
+    renditions = encode_renditions(img, rendition_widths, quality=q, webp_method=webp_method)
+    written = len(data) + sum(len(r[2]) for r in renditions)
+    return EncodedImage(
+        data=data,
+        width=img.width,
+        height=img.height,
+        renditions=renditions,
+        quality=q,
+        bytes_saved=int(written * (ratio - 1.0)),
+    )
+
+
+def render_page_outputs(
+    page: Union["pdfium.PdfPage", _PageRef],
+    meta: Dict[str, Any],
+    *,
+    quality: Union[int, QualityTarget],
+    webp_method: int,
+    rendition_widths=(),
+    reload: Optional[Callable[[], "pdfium.PdfPage"]] = None,
+) -> List[EncodedImage]:
+    """
+    Bitta PDF sahifani plan (meta) bo‘yicha render qiladi va tayyor WEBP’larni
+    tartib bilan qaytaradi (pieces=1 bo‘lsa — bitta element).
+    Serial va parallel rejim aynan shu funksiyani ishlatadi (natija bir xil).
+    reload() — sahifani qayta ochish (bandlar orasida pdfium keshini bo‘shatish uchun).
+    """
+    enc = {"quality": quality, "webp_method": webp_method, "rendition_widths": rendition_widths}
+    if isinstance(page, _PageRef):
+        return list(_iter_outputs(page, meta, **enc))
+    ref = _PageRef(page, reload)
+    try:
+        return list(_iter_outputs(ref, meta, **enc))
+    finally:
+        ref.close()
+
+
+def _iter_outputs(
+    ref: _PageRef,
+    meta: Dict[str, Any],
+    *,
+    quality: Union[int, QualityTarget],
+    webp_method: int,
+    rendition_widths=(),
+) -> Iterator[EncodedImage]:
+    """render_page_outputs’ning generator varianti: bo‘laklar bittalab (xotirada bittasi)."""
+    h_units = float(meta["h_units"])
+    crop_l = float(meta["crop_l"])
+    crop_r = float(meta["crop_r"])
+    scale = float(meta["scale"])
+    pieces = int(meta["pieces"])
+
+    enc = {"quality": quality, "webp_method": webp_method, "rendition_widths": rendition_widths}
+
+    band_pixels = int(meta.get("band_pixels", 0))
+
+    if pieces <= 1:
+        # 1 PDF sahifa = 1 WEBP
+        # pdfium crop: (left, bottom, right, top) — bu marginlar (unitda)
+        crop = (crop_l, 0.0, crop_r, 0.0)
+        yield _render_encode(ref, meta, scale, crop, band_pixels, enc)
+        return
+
+    # Chunk mode: tepdan pastga (tepa/past bo‘sh marginlar tashlab yuboriladi)
+    crop_t = float(meta.get("crop_t", 0.0))
+    crop_b = float(meta.get("crop_b", 0.0))
+    chunk_units = float(meta.get("chunk_height", CHUNK_HEIGHT)) / float(scale)
+
+    # Kesimlar (tepadan, unit’da): plan’da gutter kesimlari bo‘lsa — ular, aks holda har chunk’da
+    if meta.get("cuts"):
+        bounds = [crop_t] + [float(c) for c in meta["cuts"]] + [float(h_units) - crop_b]
+    else:
+        bounds = [crop_t]
+        while float(h_units) - crop_b - bounds[-1] > chunk_units:
+            bounds.append(bounds[-1] + chunk_units)
+        bounds.append(float(h_units) - crop_b)
+
+    for top_cut, slice_end in zip(bounds, bounds[1:]):
+        # Qolsin: [top_cut .. slice_end] (tepadan); pastdan kesiladigani h - slice_end
+        bottom_cut = float(h_units) - float(slice_end)
+
+        # ✅ pdfium crop: (left, bottom, right, top)
+        crop = (crop_l, bottom_cut, crop_r, float(top_cut))
+        yield _render_encode(ref, meta, scale, crop, band_pixels, enc)
+        ref.refresh()  # bo‘laklar orasida ham: pdfium rasm keshi strip bo‘yi bilan o‘smasin
+
+
+def _render_encode(
+    ref: _PageRef,
+    meta: Dict[str, Any],
+    scale: float,
+    crop: Tuple[float, float, float, float],
+    band_pixels: int,
+    enc: Dict[str, Any],
+) -> EncodedImage:
+    t0 = time.perf_counter()
+    img = _render_rgb(ref, scale, crop, band_pixels)
+    _add_time(meta, "render", t0)
+    return _encode_timed(meta, img, enc)
+
+
+def _encode_timed(meta: Dict[str, Any], img: Image.Image, enc: Dict[str, Any]) -> EncodedImage:
+    t0 = time.perf_counter()
+    try:
+        return encode_output(img, **enc)
+    finally:
+        _add_time(meta, "encode", t0)
+
+
+# -------------------------
+# Single-pass: plan + render bitta tashrifda
+# -------------------------
+@dataclass(frozen=True)
+class RenderOptions:
+    """render_pdf_to_pages parametrlari (worker processlarga ham shu holda uzatiladi)."""
+    target_w: int
+    min_dpi: int
+    max_dpi: int
+    quality: int
+    webp_method: int
+    split_long_pages: bool = False
+    chunk_height: int = CHUNK_HEIGHT  # split rejimida bo‘lakning maksimal bo‘yi (px)
+    band_pixels: int = BAND_PIXELS  # bundan katta bitmap bandlab render qilinadi (0 -> hech qachon)
+    rendition_widths: Tuple[int, ...] = ()  # har chiqishdan qo‘shimcha kichik enli variantlar
+    # adaptive quality (QualityTarget): min_quality=0 -> har doim `quality`
+    min_quality: int = 0
+    target_psnr: float = 0.0
+    max_bytes_per_mpx: int = 0
+
+    @property
+    def quality_target(self) -> QualityTarget:
+        return QualityTarget(
+            quality=self.quality,
+            min_quality=self.min_quality,
+            target_psnr=self.target_psnr,
+            max_bytes_per_mpx=self.max_bytes_per_mpx,
+        )
+
+
+def _page_scale(content_w_units: float, h_units: float, opts: RenderOptions) -> float:
+    return _pick_scale(
+        content_w_units=content_w_units,
+        h_units=h_units,
+        target_w_px=opts.target_w,
+        min_dpi=opts.min_dpi,
+        max_dpi=opts.max_dpi,
+        force_single_image=(not opts.split_long_pages),
+    )
+
+
+def _page_pieces(h_units: float, scale: float, opts: RenderOptions) -> int:
+    if not opts.split_long_pages:
+        return 1
+    predicted_h_px = float(h_units) * float(scale)
+    return max(1, int(math.ceil(predicted_h_px / float(opts.chunk_height))))
+
+
+def get_page_size(pdf: "pdfium.PdfDocument", index: int) -> Tuple[float, float]:
+    """Sahifani yuklamasdan (parse qilmasdan) o‘lchamini oladi."""
+    try:
+        w_units, h_units = pdf.get_page_size(index)
+    except Exception:
+        return DEFAULT_PAGE_SIZE
+    if w_units <= 0 or h_units <= 0:
+        return DEFAULT_PAGE_SIZE
+    return float(w_units), float(h_units)
+
+
+def estimate_page_pixels(w_units: float, h_units: float, opts: RenderOptions) -> int:
+    """Crop’siz yakuniy bitmap(lar) piksel soni — job piksel byudjeti uchun taxmin."""
+    scale = _page_scale(w_units, h_units, opts)
+    return int(math.ceil(w_units * scale)) * int(math.ceil(h_units * scale))
+
+
+def estimate_page_pieces(w_units: float, h_units: float, opts: RenderOptions) -> int:
+    """
+    Faqat o‘lcham bo‘yicha (crop’siz) nechta WEBP chiqishini taxmin qiladi.
+    split_long_pages=False bo‘lsa aniq (doim 1); aks holda haqiqiy son
+    crop tufayli biroz ko‘p bo‘lishi mumkin — progress total shunda tuzatiladi.
+    """
+    scale = _page_scale(w_units, h_units, opts)
+    return _page_pieces(h_units, scale, opts)
+
+
+def _crop_pixels(img: Image.Image, crop_l: float, crop_r: float, scale: float) -> Image.Image:
+    if crop_l <= 0 and crop_r <= 0:
+        return img
+    left = int(round(crop_l * scale))
+    right = img.width - int(round(crop_r * scale))
+    if right - left < 1:
+        return img
+    return img.crop((left, 0, right, img.height))
+
+
+def render_page(
+    page: "pdfium.PdfPage",
+    opts: RenderOptions,
+    *,
+    threshold: int = 18,
+    pad_px: int = 12,
+    reload: Optional[Callable[[], "pdfium.PdfPage"]] = None,
+    lazy: bool = False,
+) -> Tuple[Dict[str, Any], Sequence[EncodedImage]]:
+    """
+    Bitta sahifani bitta tashrifda: margin aniqlash + plan + render + encode
+    (rendition’lar ham shu decode’dan). Umumiy narsa — sahifa bir marta ochiladi/parse
+    qilinadi; rasterlash esa yo‘lga qarab bir yoki ikki marta:
+
+    - Crop scale’ga ta’sir qilmasa (max_dpi / WEBP_MAX_DIM chegarasi): bitta rasterlash —
+      to‘liq render’ning o‘zidan margin topilib, pikselda kesiladi.
+    - Preview scale yakuniy scale bilan bir xil bo‘lsa: bitta rasterlash — preview
+      o‘zi kesilib encode qilinadi.
+    - Qolgan (odatiy, crop scale’ni o‘zgartiradigan) holatda ikki marta: preview
+      (PREVIEW_MAX_WIDTH_PX) -> plan -> yakuniy scale’da to‘liq render. Yakuniy scale
+      crop’dan keyingina ma’lum, shuning uchun to‘liq bitmap oldindan chizilmaydi.
+
+    Margin aniqlash bitmap buferi ustida (_bitmap_bbox). split_long_pages=True
+    bo‘lsa tepa/past bo‘sh joylar ham plan’ga yoziladi (crop_t/crop_b), bo‘laklar
+    esa preview’dagi bo‘sh gorizontal gutterlardan kesiladi (cuts) — pufakcha/matn o‘rtasidan emas.
+
+    opts.band_pixels’dan katta bitmap’lar (preview ham) gorizontal bandlarda chiziladi;
+    reload() berilsa bandlar orasida sahifa qayta ochiladi (pdfium rasm keshi bo‘shaydi) —
+    peak xotira sahifa bo‘yiga bog‘liq bo‘lmaydi.
+
+    lazy=True: outputs — generator (bo‘laklar iste’mol qilinganda render/encode qilinadi,
+    xotirada bittadan); sahifa generator tugaguncha (yoki yopilguncha) ochiq turishi kerak.
+
+    meta["timings"]: bosqichlar vaqti (sec) — plan (preview/skan/crop), render (to‘liq
+    rasterlash), encode (WEBP + variantlar); lazy rejimda bo‘laklar iste’mol qilingach to‘ladi.
+
+    Returns: (meta, outputs)
+    """
+    ref = _PageRef(page, reload)
+    try:
+        meta, outputs = _render_page(ref, opts, threshold=threshold, pad_px=pad_px)
+        if not lazy:
+            outputs = list(outputs)
+    except BaseException:
+        _release_page_ref(ref)
+        raise
+    if not lazy:
+        _release_page_ref(ref)
+        return meta, outputs
+
+    def _stream() -> Iterator[EncodedImage]:
+        try:
+            yield from outputs
+        finally:
+            _release_page_ref(ref)
+
+    return meta, _stream()
+
+
+def _release_page_ref(ref: _PageRef) -> None:
+    ref.close()
+    if ref.refreshed:
+        _trim_heap()
+
+
+def _render_page(
+    ref: _PageRef,
+    opts: RenderOptions,
+    *,
+    threshold: int,
+    pad_px: int,
+) -> Tuple[Dict[str, Any], Iterator[EncodedImage]]:
+    t_start = time.perf_counter()
+    page = ref.page
+    enc = {"quality": opts.quality_target, "webp_method": opts.webp_method, "rendition_widths": opts.rendition_widths}
+
+    try:
+        w_units, h_units = page.get_size()
+    except Exception:
+        w_units, h_units = DEFAULT_PAGE_SIZE
+    w_units, h_units = float(w_units), float(h_units)
+
+    preview_scale = _preview_scale(w_units)
+    scale_full = _page_scale(w_units, h_units, opts)
+
+    def _meta(
+        crop_l: float,
+        crop_r: float,
+        scale: float,
+        pieces: int,
+        crop_t: float = 0.0,
+        crop_b: float = 0.0,
+        cuts: Optional[List[float]] = None,
+    ):
+        return {
+            "w_units": w_units,
+            "h_units": h_units,
+            "crop_l": float(crop_l),
+            "crop_r": float(crop_r),
+            "crop_t": float(crop_t),
+            "crop_b": float(crop_b),
+            "scale": float(scale),
+            "pieces": int(pieces),
+            "chunk_height": int(opts.chunk_height),
+            "cuts": list(cuts or ()),
+            "band_pixels": int(opts.band_pixels),
+        }
+
+    def _plan(bbox, img_w: int, img_h: int, blank_rows) -> Dict[str, Any]:
+        """preview (scale=preview_scale) natijasidan plan; blank_rows() — faqat kerak bo‘lsa."""
+        crop_l, crop_r = _crop_units_from_bbox(bbox, img_w, preview_scale, w_units, pad_px=pad_px)
+        crop_t, crop_b = 0.0, 0.0
+        if opts.split_long_pages:
+            crop_t, crop_b = _vertical_crop_units(bbox, img_h, preview_scale, h_units, pad_px=pad_px)
+        content_w_units = max(1.0, w_units - crop_l - crop_r)
+
+        scale = _page_scale(content_w_units, h_units, opts)
+        pieces = _page_pieces(h_units - crop_t - crop_b, scale, opts)
+        cuts = None
+        if pieces > 1:
+            # bo‘laklarni gutterlardan kesamiz (preview px -> unit, tepadan)
+            cuts_px = _gutter_cuts(
+                _blank_runs(blank_rows()),
+                int(round(crop_t * preview_scale)),
+                int(round((h_units - crop_b) * preview_scale)),
+                float(opts.chunk_height) * preview_scale / scale,
+            )
+            cuts = [px / preview_scale for px in cuts_px]
+            pieces = len(cuts) + 1
+        return _meta(crop_l, crop_r, scale, pieces, crop_t, crop_b, cuts)
+
+    def _too_big(scale: float) -> bool:
+        # bandlash faqat NumPy bilan (preview skan); PIL yo‘lida eski xatti-harakat
+        if np is None or opts.band_pixels <= 0:
+            return False
+        width, height, rows, _ = _band_layout(page, scale, (0.0, 0.0, 0.0, 0.0), opts.band_pixels)
+        return rows < height
+
+    # 1) Crop scale’ni o‘zgartira olmaydimi? (35% — eng tor ruxsat etilgan kontent)
+    #    To‘liq bitmap band chegarasidan katta bo‘lsa — preview yo‘li (render bandlab).
+    if not opts.split_long_pages and not _too_big(scale_full):
+        scale_narrowest = _page_scale(w_units * 0.35, h_units, opts)
+        if abs(scale_narrowest - scale_full) < 1e-9:
+            t0 = time.perf_counter()
+            bmp = page.render(scale=scale_full)
+            t_render = time.perf_counter() - t0
+            try:
+                # Aniqlashni preview zichligida qilamiz (tezlik + preview bilan bir xil natija)
+                step = max(1, int(scale_full / preview_scale))
+                bbox = _bitmap_bbox(bmp, threshold=threshold, step=step)
+                crop_l, crop_r = _crop_units_from_bbox(bbox, bmp.width, scale_full, w_units, pad_px=pad_px * step)
+                img = bmp.to_pil().convert("RGB")
+            finally:
+                _safe_close(bmp)
+
+            img = _crop_pixels(img, crop_l, crop_r, scale_full)
+            meta = _meta(crop_l, crop_r, scale_full, 1)
+            meta["timings"] = {"render": t_render}
+            _add_time(meta, "plan", t_start + t_render)  # render’dan tashqari hammasi
+            return meta, iter([_encode_timed(meta, img, enc)])
+
+    # 2) Preview -> plan (juda uzun preview ham bandlab skan qilinadi)
+    if _too_big(preview_scale):
+        bbox, blank, img_w, img_h = _scan_bands(
+            ref,
+            preview_scale,
+            opts.band_pixels,
+            threshold=threshold,
+            want_blank=opts.split_long_pages,
+        )
+        meta = _plan(bbox, img_w, img_h, lambda: blank)
+        _add_time(meta, "plan", t_start)
+        return meta, _iter_outputs(ref, meta, **enc)
+
+    bmp = page.render(scale=preview_scale)
+    try:
+        meta = _plan(_bitmap_bbox(bmp, threshold=threshold), bmp.width, bmp.height, lambda: _blank_rows(bmp))
+        _add_time(meta, "plan", t_start)
+
+        # 3) Preview yetarlimi? (yakuniy scale bilan bir xil)
+        if meta["pieces"] <= 1 and abs(meta["scale"] - preview_scale) < 1e-9:
+            img = _crop_pixels(bmp.to_pil().convert("RGB"), meta["crop_l"], meta["crop_r"], meta["scale"])
+            return meta, iter([_encode_timed(meta, img, enc)])
+    finally:
+        _safe_close(bmp)
+
+    return meta, _iter_outputs(ref, meta, **enc)
+
+
+# -------------------------
+# Parallel worker (alohida process ichida ishlaydi)
+# -------------------------
+@dataclass(frozen=True)
+class ResourceLimits:
+    """
+    Render process cheklovlari (ishonchsiz PDF): process ichida setrlimit bilan, 0 -> cheklovsiz.
+    - cpu_seconds: RLIMIT_CPU — oshsa kernel processni SIGXCPU/SIGKILL bilan to‘xtatadi
+    - memory_mb: RLIMIT_AS — malloc/mmap xato qaytaradi (MemoryError yoki process yiqiladi)
+    """
+    cpu_seconds: int = 0
+    memory_mb: int = 0
+
+    def apply(self) -> None:
+        try:
+            import resource
+        except ImportError:  # Windows: cheklovsiz
+            return
+
+        def _set(res: int, soft: int, hard: int) -> None:
+            _, cur_hard = resource.getrlimit(res)
+            if cur_hard != resource.RLIM_INFINITY:
+                soft, hard = min(soft, cur_hard), min(hard, cur_hard)
+            resource.setrlimit(res, (soft, hard))
+
+        _set(resource.RLIMIT_CORE, 0, 0)  # yiqilgan render core dump yozmasin
+        if self.cpu_seconds > 0:
+            # soft -> SIGXCPU, hard (+5s) -> SIGKILL (SIGXCPU ushlansa ham)
+            _set(resource.RLIMIT_CPU, self.cpu_seconds, self.cpu_seconds + 5)
+        if self.memory_mb > 0:
+            limit = int(self.memory_mb) * 1024 * 1024
+            _set(resource.RLIMIT_AS, limit, limit)
+
+
+_WORKER_PDF: Optional["pdfium.PdfDocument"] = None
+_WORKER_OPEN_ERROR: Optional[Exception] = None
+
+
+def _init_render_worker(pdf_path: str, limits: Optional[ResourceLimits] = None) -> None:
+    """ProcessPool initializer: har bir worker PDFni o‘zi bir marta ochadi (limits — ochishdan oldin)."""
+    global _WORKER_PDF, _WORKER_OPEN_ERROR
+    # To‘xtatish signallari ota processga tegishli: u sahifa chegarasida o‘zi
+    # to‘xtaydi va pool’ni yopadi (systemd butun cgroup’ga SIGTERM yuborganda ham).
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if limits is not None:
+        limits.apply()
+    try:
+        _WORKER_PDF = pdfium.PdfDocument(pdf_path)
+    except pdfium.PdfiumError as e:
+        # initializer xatosi pool’ni "broken" qiladi — sababi task orqali qaytsin
+        _WORKER_OPEN_ERROR = e
+        return
+    # worker process chiqayotganda hujjatni yopamiz
+    Finalize(None, _safe_close, args=(_WORKER_PDF,), exitpriority=10)
+
+
+def _worker_pdf() -> "pdfium.PdfDocument":
+    if _WORKER_OPEN_ERROR is not None:
+        raise _WORKER_OPEN_ERROR
+    if _WORKER_PDF is None:
+        raise RuntimeError("Render worker is not initialized.")
+    return _WORKER_PDF
+
+
+def probe_document() -> Tuple[int, List[Tuple[float, float]]]:
+    """Worker ichida: betlar soni va o‘lchamlari (isolated rejimda ota process PDF’ni ochmaydi)."""
+    pdf = _worker_pdf()
+    count = len(pdf)
+    return count, [get_page_size(pdf, i) for i in range(count)]
+
+
+def render_page_range(start: int, stop: int, opts: RenderOptions) -> List[Tuple[Dict[str, Any], List[EncodedImage]]]:
+    """
+    [start, stop) oralig‘idagi sahifalarni render + encode qiladi (single-pass).
+    Natija: har bir sahifa uchun (meta, EncodedImage’lar) — tartib saqlanadi.
+    """
+    pdf = _worker_pdf()
+
+    result: List[Tuple[Dict[str, Any], List[EncodedImage]]] = []
+    for i in range(start, stop):
+        page = pdf[i]
+        try:
+            result.append(render_page(page, opts, reload=lambda i=i: pdf[i]))
+        finally:
+            _safe_close(page)
+    return result
@@ -1,111 +1,409 @@
+import json
 import math
-from io import BytesIO
-from typing import Callable, Optional, Tuple, List, Dict, Any
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Tuple, List, Dict, Any, Iterable, Iterator, Union
 
 import pypdfium2 as pdfium
-from PIL import Image, ImageChops, ImageOps
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Max
 
-from ..models import Page
-
-WEBP_MAX_DIM = 16383
-CHUNK_HEIGHT = 12000  # split_long_pages=True bo‘lsa ishlaydi
-
-MIN_DPI = 144
-MAX_DPI = 450
-
-
-def _safe_close(obj) -> None:
-    try:
-        obj.close()
-    except Exception:
-        pass
+from ..models import Page, PageRendition
+from .image_render import (
+    ImageArchive,
+    ImageSourceError,
+    _init_image_worker,
+    estimate_image_pieces,
+    estimate_image_pixels,
+    iter_archive_pages,
+    probe_archive,
+    render_image_range,
+)
+from .page_blobs import (
+    build_renditions,
+    content_hash,
+    created_names,
+    drop_holds,
+    hold_blobs,
+    image_set_names,
+    page_fields,
+    quality_target,
+    record_names,
+    release_blob,
+    store_image_set,
+)
+from .pdf_render import (
+    BAND_PIXELS,
+    CHUNK_HEIGHT,
+    MAX_DPI,
+    MIN_DPI,
+    WEBP_MAX_DIM,
+    EncodedImage,
+    RenderOptions,
+    ResourceLimits,
+    _init_render_worker,
+    _safe_close,
+    estimate_page_pieces,
+    estimate_page_pixels,
+    get_page_size,
+    probe_document,
+    render_page,
+    render_page_range,
+)
+
+# Parallel rejimda bitta task nechta sahifani oladi (tartib/kechikish balansi)
+RANGE_MAX_PAGES = 8
+
+# checkpoint formati o‘zgarsa oshiriladi (eski checkpoint e’tiborsiz qoldiriladi)
+CHECKPOINT_VERSION = 2
+
+# Manba turi: PDF yoki rasmlar arxivi (ZIP/CBZ — admin’dagi ko‘p rasmli upload ham shunga yig‘iladi)
+SOURCE_PDF = "pdf"
+SOURCE_ARCHIVE = "archive"
+
+
+class RenderInterrupted(Exception):
+    """should_stop() True qaytardi — job sahifa chegarasida to‘xtatildi (fayllar tozalangan)."""
+
+
+class RenderCancelled(Exception):
+    """
+    Job bekor qilindi (callback’lardan ko‘tariladi). RenderInterrupted’dan farqli —
+    yuklangan fayllar (checkpoint’dagilari ham) o‘chiriladi.
+    """
 
 
-def _detect_content_crop_units(
-    page: "pdfium.PdfPage",
-    w_units: float,
-    h_units: float,
-    *,
-    preview_max_width_px: int = 700,
-    threshold: int = 18,
-    pad_px: int = 12,
-) -> Tuple[float, float]:
+class RenderLimitExceeded(Exception):
     """
-    Sahifaning yon (left/right) oq marginlarini topadi va PDF unit’da qaytaradi.
-    Tez preview render bilan ishlaydi.
+    Ishonchsiz PDF cheklovga urildi: vaqt (PDF_RENDER_TIMEOUT), CPU/xotira rlimit,
+    piksel byudjeti — yoki render process yiqildi. Worker o‘zi tirik qoladi, job FAILED.
     """
-    if w_units <= 0:
-        return 0.0, 0.0
 
-    preview_scale = float(preview_max_width_px) / float(w_units)
-    preview_scale = max(0.20, min(preview_scale, 2.0))
 
-    bmp = page.render(scale=preview_scale)
-    try:
-        img = bmp.to_pil().convert("RGB")
+# Upload navbati: bir vaqtda xotirada turadigan tayyor WEBP’lar = threadlar * shu koeffitsient
+UPLOAD_QUEUE_FACTOR = 2
 
-        bg = Image.new("RGB", img.size, (255, 255, 255))
-        diff = ImageChops.difference(img, bg).convert("L")
-        diff = ImageOps.autocontrast(diff)
-        diff = diff.point(lambda p: 255 if p > threshold else 0)
 
-        bbox = diff.getbbox()  # (left, top, right, bottom) px
-        if not bbox:
-            return 0.0, 0.0
+def _resolve_workers(workers: Optional[int], page_count: Optional[int] = None) -> int:
+    """
+    workers=None/1 -> serial
+    workers=0      -> CPU soni
+    workers=N      -> N ta process (sahifalar sonidan oshmaydi)
+    """
+    if workers is None:
+        return 1
+    workers = int(workers)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    if page_count is not None:
+        workers = min(workers, page_count)
+    return max(1, workers)
 
-        left_px, _, right_px, _ = bbox
-        left_px = max(0, left_px - pad_px)
-        right_px = min(img.width, right_px + pad_px)
 
-        crop_left_units = float(left_px) / float(preview_scale)
-        crop_right_units = float(img.width - right_px) / float(preview_scale)
+class _RenderPool:
+    """
+    Render processlari (spawn pool, har birida o‘z PdfDocument’i va rlimit’lar).
+    Muddat o‘tsa yoki process yiqilsa — processlar o‘ldiriladi, RenderLimitExceeded.
+    """
 
-        crop_left_units = max(0.0, min(crop_left_units, w_units - 1.0))
-        crop_right_units = max(0.0, min(crop_right_units, w_units - 1.0))
+    def __init__(
+        self,
+        pdf_path: str,
+        workers: int,
+        *,
+        limits: Optional[ResourceLimits] = None,
+        timeout: float = 0.0,
+        initializer: Callable[..., None] = _init_render_worker,
+    ):
+        self.workers = max(1, int(workers))
+        self.limits = limits
+        self.timeout = float(timeout or 0.0)
+        self.deadline = time.monotonic() + self.timeout if self.timeout > 0 else None
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer,
+            initargs=(pdf_path, limits),
+        )
 
-        content_w = w_units - crop_left_units - crop_right_units
-        if content_w <= w_units * 0.35:
-            return 0.0, 0.0
+    def submit(self, fn, *args):
+        try:
+            return self.executor.submit(fn, *args)
+        except BrokenProcessPool as e:
+            # process oldingi task’dan keyin o‘lgan bo‘lsa, xato submit’da chiqadi
+            raise RenderLimitExceeded(
+                "Render process died (CPU/memory limit or malformed PDF)."
+            ) from e
+
+    def result(self, fut):
+        remaining = None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+        try:
+            return fut.result(timeout=remaining)
+        except FuturesTimeout:
+            self.kill()
+            raise RenderLimitExceeded(f"Render timed out after {self.timeout:g}s.") from None
+        except BrokenProcessPool as e:
+            raise RenderLimitExceeded(
+                "Render process died (CPU/memory limit or malformed PDF)."
+            ) from e
+        except MemoryError as e:
+            mb = self.limits.memory_mb if self.limits else 0
+            raise RenderLimitExceeded(f"Render process ran out of memory (limit {mb} MB).") from e
+        except pdfium.PdfiumError as e:
+            raise RenderLimitExceeded(f"Malformed PDF: {e}") from e
+        except ImageSourceError as e:
+            raise RenderLimitExceeded(f"Malformed image archive: {e}") from e
+
+    def kill(self) -> None:
+        # ProcessPoolExecutor ishlayotgan task’ni to‘xtata olmaydi — processlarning o‘zi o‘ldiriladi
+        for proc in list((getattr(self.executor, "_processes", None) or {}).values()):
+            try:
+                proc.kill()
+            except Exception:
+                pass
 
-        return crop_left_units, crop_right_units
-    finally:
-        _safe_close(bmp)
+    def close(self, *, abort: bool = False) -> None:
+        if abort:
+            self.kill()  # osilib qolgan sahifani kutmaymiz
+        self.executor.shutdown(wait=True, cancel_futures=True)
 
 
-def _pick_scale(
+def _iter_rendered_pages(
+    pdf: Union["pdfium.PdfDocument", ImageArchive, None],
+    page_count: int,
+    opts: RenderOptions,
     *,
-    content_w_units: float,
-    h_units: float,
-    target_w_px: int,
-    min_dpi: int,
-    max_dpi: int,
-    force_single_image: bool,
-) -> float:
+    pool: Optional[_RenderPool],
+    start: int = 0,
+    range_fn: Callable[..., list] = render_page_range,
+) -> Iterator[Tuple[Dict[str, Any], Iterable[EncodedImage]]]:
     """
-    Scale tanlash:
-    - width bo‘yicha target_w_px ga chiqadi
-    - min_dpi dan pastga tushmaslikka harakat qiladi
-    - max_dpi dan oshirmaydi
-    - WEBP_MAX_DIM limitdan oshirmaydi
-    - force_single_image=True bo‘lsa: height ham WEBP_MAX_DIM dan oshmasin (1 sahifa = 1 WEBP)
+    (meta, EncodedImage’lar) sahifa tartibida, start’dan (resume); serial rejimda outputs — generator.
+    pool berilsa sahifa oraliqlari render processlarida (range_fn) ishlanadi.
     """
-    content_w_units = max(1.0, float(content_w_units))
-    h_units = max(1.0, float(h_units))
+    if pool is None and isinstance(pdf, ImageArchive):
+        yield from iter_archive_pages(pdf, opts, start)
+        return
 
-    scale_by_width = float(target_w_px) / float(content_w_units)
-    scale_by_dpi = float(min_dpi) / 72.0
-    scale = max(scale_by_width, scale_by_dpi)
+    if pool is None:
+        for i in range(start, page_count):
+            page = pdf[i]
+            try:
+                # lazy: bo‘laklar upload’ga bittalab oqadi (uzun strip xotirada to‘planmaydi)
+                yield render_page(page, opts, reload=lambda i=i: pdf[i], lazy=True)
+            finally:
+                _safe_close(page)
+        return
 
-    scale = min(scale, float(max_dpi) / 72.0)
-    scale = min(scale, float(WEBP_MAX_DIM) / float(content_w_units))
+    # Oraliq hajmi: har workerga bir nechta task tushsin (oxirida bo‘sh turib qolmasin);
+    # bitta process (isolated serial) — bittadan, natijalar xotirada to‘planmasin
+    workers = pool.workers
+    if workers <= 1:
+        step = 1
+    else:
+        step = max(1, min(RANGE_MAX_PAGES, int(math.ceil((page_count - start) / float(workers * 4)))))
+    ranges = [(a, min(a + step, page_count)) for a in range(start, page_count, step)]
+
+    pending = deque()
+    it = iter(ranges)
+    # Xotira chegarasi: bir vaqtda ko‘pi bilan workers*2 ta oraliq navbatda
+    for a, b in it:
+        pending.append(pool.submit(range_fn, a, b, opts))
+        if len(pending) >= workers * 2:
+            break
+
+    while pending:
+        for item in pool.result(pending.popleft()):
+            yield item
+        nxt = next(it, None)
+        if nxt is not None:
+            pending.append(pool.submit(range_fn, nxt[0], nxt[1], opts))
+
+
+def _render_limits() -> Tuple[bool, ResourceLimits, float, int]:
+    """settings: (isolated, rlimits, devor soati timeout, piksel byudjeti)."""
+    return (
+        bool(getattr(settings, "PDF_RENDER_ISOLATED", False)),
+        ResourceLimits(
+            cpu_seconds=int(getattr(settings, "PDF_RENDER_CPU_SECONDS", 0) or 0),
+            memory_mb=int(getattr(settings, "PDF_RENDER_MAX_MEMORY_MB", 0) or 0),
+        ),
+        float(getattr(settings, "PDF_RENDER_TIMEOUT", 0) or 0),
+        int(getattr(settings, "PDF_RENDER_MAX_PIXELS", 0) or 0),
+    )
+
+
+class _PageUploader:
+    """
+    Tayyor WEBP’larni storage’ga bounded thread pool’da yuklaydi (render/encode bilan parallel).
+    Bloblar content-addressed, commit’gacha owner nomidan hold qilinadi; Page qatorlari bu yerda yaratilmaydi.
+    """
+
+    def __init__(
+        self,
+        storage,
+        *,
+        owner: str,
+        max_workers: int,
+        on_uploaded: Optional[Callable[[int], None]] = None,
+    ):
+        self.storage = storage
+        self.owner = owner
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = self.max_workers * UPLOAD_QUEUE_FACTOR
+        self.on_uploaded = on_uploaded
+        self.uploaded: Dict[int, Dict[str, Any]] = {}  # out_no -> page_blobs record (name, w, h, r)
+        self.skipped = 0  # storage’da allaqachon bor bo‘lgan (yuklanmagan) bloblar
+        self.store_seconds = 0.0  # threadlar bo‘yicha jami (exists + save) vaqti
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Any] = {}  # digest -> future (job ichidagi takrorlar)
+        self._pending = deque()  # (out_no, future)
+        # threadlar job davomida yashaydi — S3Boto3Storage’ning thread-local ulanishi qayta ishlatiladi
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="page-upload")
+
+    def _save(self, digest: str, item: EncodedImage) -> Tuple[Dict[str, Any], bool]:
+        t0 = time.perf_counter()
+        record, created = store_image_set(
+            item.data,
+            item.width,
+            item.height,
+            item.renditions,
+            digest=digest,
+            storage=self.storage,
+        )
+        # statistika checkpoint’ga ham yoziladi (resume’da yo‘qolmasin)
+        record["b"] = len(item.data) + sum(len(r[2]) for r in item.renditions)
+        record["s"] = int(item.bytes_saved)
+        with self._lock:
+            self.store_seconds += time.perf_counter() - t0
+        return record, created
+
+    def submit(self, out_no: int, item: EncodedImage) -> None:
+        # backpressure: navbat to‘lsa eng eskisini kutamiz
+        while len(self._pending) >= self.max_pending:
+            self._reap(block=True)
+
+        digest = content_hash(item.data)
+        fut = self._inflight.get(digest)
+        if fut is None:
+            # hold — storage.exists’dan oldin (aks holda boshqa job shu orada o‘chirib yuborishi mumkin)
+            hold_blobs(image_set_names(item.data, item.renditions, digest=digest), self.owner)
+            fut = self._inflight[digest] = self._executor.submit(self._save, digest, item)
+        self._pending.append((out_no, fut))
+        self._reap(block=False)
+
+    def _reap(self, *, block: bool) -> None:
+        # Tartib bo‘yicha: boshidagi tugaganlarini yig‘amiz (progress monoton bo‘lsin)
+        while self._pending and (block or self._pending[0][1].done()):
+            out_no, fut = self._pending.popleft()
+            record, created = fut.result()
+            self.uploaded[out_no] = record
+            if not created:
+                self.skipped += 1
+            if self.on_uploaded:
+                self.on_uploaded(out_no)
+            block = False
+
+    def drain(self) -> Dict[int, Dict[str, Any]]:
+        while self._pending:
+            self._reap(block=True)
+        return self.uploaded
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def discard(self) -> None:
+        """
+        Xatolikda: navbatni to‘xtatib, shu job yaratgan fayllarni o‘chiradi (yetim fayl qolmasin).
+        Storage’da oldindan bor bo‘lgan (qayta ishlatilgan) bloblarga tegilmaydi.
+        """
+        for _, fut in self._pending:
+            fut.cancel()
+        self.close()
+
+        names = set()
+        for record in self.uploaded.values():
+            names.update(created_names(record))
+        for _, fut in self._pending:
+            if not fut.cancelled() and fut.exception() is None:
+                names.update(created_names(fut.result()[0]))
+        self._pending.clear()
+        self.uploaded.clear()
+        self._inflight.clear()
+
+        # o‘z hold’larimiz olinadi; boshqa sahifa/job ishora qilayotgan bloblar qoladi
+        drop_holds(self.owner)
+        for name in names:
+            release_blob(name, storage=self.storage)
+
+
+def _checkpoint_key(
+    opts: RenderOptions,
+    page_count: int,
+    replace_existing: bool,
+    source: str = SOURCE_PDF,
+) -> Dict[str, Any]:
+    """Checkpoint faqat aynan shu parametrlar bilan davom ettiriladi."""
+    key = asdict(opts)
+    key.update(page_count=int(page_count), replace_existing=bool(replace_existing))
+    if source != SOURCE_PDF:
+        key.update(source=source)  # PDF checkpoint’lari eski formatda qoladi
+    return json.loads(json.dumps(key))  # tuple -> list: DB’dan o‘qilgani bilan solishtirish uchun
+
+
+def _load_checkpoint(checkpoint: Optional[Dict[str, Any]], key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Checkpoint yaroqli bo‘lsa {first_no, plan, uploaded{int: record}} qaytaradi, aks holda None.
+    plan[i] = i-PDF sahifadan chiqqan WEBP soni (faqat to‘liq yuklangan sahifalar).
+    """
+    if not checkpoint or checkpoint.get("v") != CHECKPOINT_VERSION or checkpoint.get("key") != key:
+        return None
+    try:
+        first_no = int(checkpoint["first_no"])
+        plan = [int(n) for n in checkpoint["plan"]]
+        uploaded = {int(no): dict(record) for no, record in checkpoint["uploaded"].items()}
+        for record in uploaded.values():
+            record_names(record)
+    except (KeyError, TypeError, ValueError, AttributeError, IndexError):
+        return None
+
+    expected = set(range(first_no + 1, first_no + sum(plan) + 1))
+    if len(plan) > key["page_count"] or set(uploaded) != expected:
+        return None
+    return {"first_no": first_no, "plan": plan, "uploaded": uploaded, "owner": str(checkpoint.get("owner") or "")}
+
+
+def _checkpoint_names(checkpoint: Optional[Dict[str, Any]]) -> List[str]:
+    """Checkpoint’ni yozgan job yaratgan bloblar."""
+    names = []
+    try:
+        for record in (checkpoint or {}).get("uploaded", {}).values():
+            # v1: out_no -> name (legacy nom — har doim shu job’niki); v2: out_no -> record
+            names.extend([str(record)] if isinstance(record, str) else created_names(record))
+    except (AttributeError, KeyError, TypeError, IndexError):
+        pass
+    return names
 
-    if force_single_image:
-        scale = min(scale, float(WEBP_MAX_DIM) / float(h_units))
 
-    return max(scale, 0.10)
+def discard_checkpoint_files(checkpoint: Optional[Dict[str, Any]], storage=None) -> int:
+    """
+    Checkpoint’dagi (hali commit qilinmagan) WEBP’larni o‘chiradi: faqat o‘sha job yaratganlarini
+    va boshqa sahifa/job ishora qilmasa. Job’ning hold’lari ham olinadi.
+    """
+    storage = storage or Page._meta.get_field("image").storage
+    if isinstance(checkpoint, dict):
+        drop_holds(str(checkpoint.get("owner") or ""))
+    return sum(1 for name in set(_checkpoint_names(checkpoint)) if release_blob(name, storage=storage))
 
 
 def render_pdf_to_pages(
@@ -119,6 +417,18 @@ def render_pdf_to_pages(
     webp_method: int = 4,
     progress_cb: Optional[Callable[[int, int], None]] = None,
     split_long_pages: bool = False,
+    chunk_height: Optional[int] = None,
+    workers: Optional[int] = 1,
+    upload_workers: int = 4,
+    should_stop: Optional[Callable[[], bool]] = None,
+    checkpoint: Optional[Dict[str, Any]] = None,
+    checkpoint_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    rendition_widths: Optional[Tuple[int, ...]] = None,
+    adaptive_quality: bool = False,
+    stats: Optional[Dict[str, Any]] = None,
+    storage=None,
+    isolated: Optional[bool] = None,
+    source: str = SOURCE_PDF,
 ) -> Tuple[int, int]:
     """
     PDF -> WEBP.
@@ -128,187 +438,299 @@ def render_pdf_to_pages(
       ✅ Juda uzun sahifada scale pasayadi, lekin bitta rasm bo‘lib qoladi
 
     split_long_pages=True:
-      Uzun sahifalar CHUNK_HEIGHT bo‘yicha bo‘linadi (tepdan pastga).
-      (Bu rejimda 1 PDF sahifa bir nechta WEBP bo‘lib ketadi.)
+      Uzun sahifalar gutterlardan, chunk_height’dan (None -> PDF_SPLIT_CHUNK_HEIGHT) uzun
+      bo‘lmagan bo‘laklarga bo‘linadi (1 PDF sahifa bir nechta WEBP bo‘lib ketadi).
+
+    workers: 1 — shu processda, N > 1 — N ta render processi, 0 — CPU soni (natija serial bilan bir xil).
+    upload_workers: yuklash threadlari; Page qatorlari oxirida bitta tranzaksiyada yoziladi.
+    should_stop(): sahifa chegarasida; True -> RenderInterrupted (bekor qilinsa callback’lar RenderCancelled).
+    checkpoint / checkpoint_cb(state): resume holati — har to‘liq yuklangan sahifadan keyin, commit’da {}.
+    rendition_widths: None -> settings.PAGE_RENDITION_WIDTHS, () -> variantsiz.
+    adaptive_quality: quality PDF_WEBP_MIN_QUALITY .. quality oralig‘ida tanlanadi (choose_quality).
+    stats: bytes_written, bytes_saved, blobs_skipped, timings, pages — ish davomida to‘ladi.
+    storage: None -> Page.image storage’i.
+    isolated: None -> settings.PDF_RENDER_ISOLATED; True — PDF faqat rlimit’li render process(lar)da ochiladi.
+    source: SOURCE_PDF yoki SOURCE_ARCHIVE (ZIP/CBZ rasmlar, render_archive_to_pages).
 
     progress_cb(done, total):
       done = yaratilgan WEBP soni
-      total = chiqishi kutilayotgan WEBP soni
+      total = chiqishi kutilayotgan WEBP soni (split rejimida ish davomida aniqlashishi mumkin)
     """
-    min_dpi = max(int(dpi or MIN_DPI), MIN_DPI)
-    max_dpi = int(MAX_DPI)
-    target_w = int(max_width or 1400)
-    quality = int(quality or 82)
-    webp_method = int(webp_method if webp_method is not None else 4)
-
-    # page_number start
-    if replace_existing:
-        Page.objects.filter(chapter=chapter).delete()
-        out_no = 0
+    target = quality_target(int(quality or 82))
+    opts = RenderOptions(
+        target_w=int(max_width or 1400),
+        min_dpi=max(int(dpi or MIN_DPI), MIN_DPI),
+        max_dpi=int(MAX_DPI),
+        quality=int(quality or 82),
+        webp_method=int(webp_method if webp_method is not None else 4),
+        split_long_pages=bool(split_long_pages),
+        chunk_height=max(512, min(
+            int(chunk_height or getattr(settings, "PDF_SPLIT_CHUNK_HEIGHT", CHUNK_HEIGHT)),
+            WEBP_MAX_DIM - 64,  # preview px -> final px yaxlitlash uchun zaxira
+        )),
+        band_pixels=int(getattr(settings, "PDF_RENDER_BAND_PIXELS", BAND_PIXELS)),
+        rendition_widths=tuple(
+            sorted(int(w) for w in (
+                getattr(settings, "PAGE_RENDITION_WIDTHS", ()) if rendition_widths is None else rendition_widths
+            ))
+        ),
+        min_quality=target.min_quality if adaptive_quality else 0,
+        target_psnr=target.target_psnr if adaptive_quality else 0.0,
+        max_bytes_per_mpx=target.max_bytes_per_mpx if adaptive_quality else 0,
+    )
+
+    use_pool, limits, timeout, max_pixels = _render_limits()
+    if isolated is not None:
+        use_pool = bool(isolated)
+
+    archive = source == SOURCE_ARCHIVE
+    pool_kw = {"timeout": timeout}
+    if archive:
+        pool_kw["initializer"] = _init_image_worker
+        estimate_pixels, estimate_pieces = estimate_image_pixels, estimate_image_pieces
     else:
-        out_no = (
+        estimate_pixels, estimate_pieces = estimate_page_pixels, estimate_page_pieces
+
+    pdf = None
+    pool = None
+    if use_pool:
+        # ishonchsiz PDF: hatto betlar soni ham render processida o‘qiladi
+        pool = _RenderPool(pdf_path, _resolve_workers(workers), limits=limits, **pool_kw)
+        try:
+            page_count, sizes = pool.result(pool.submit(probe_archive if archive else probe_document))
+        except BaseException:
+            pool.close(abort=True)
+            raise
+    elif archive:
+        try:
+            pdf = ImageArchive(pdf_path)
+            page_count = len(pdf)
+            sizes = [pdf.size(i) for i in range(page_count)]
+        except ImageSourceError as e:
+            _safe_close(pdf)
+            raise RenderLimitExceeded(f"Malformed image archive: {e}") from e
+    else:
+        pdf = pdfium.PdfDocument(pdf_path)
+        page_count = len(pdf)
+        sizes = [get_page_size(pdf, i) for i in range(page_count)]
+
+    storage = storage or Page._meta.get_field("image").storage
+    timings = {"plan": 0.0, "render": 0.0, "encode": 0.0, "store": 0.0, "commit": 0.0}
+    page_timings: List[List[float]] = []
+    if stats is not None:
+        stats.update(timings=timings, pages=page_timings)
+
+    key = _checkpoint_key(opts, page_count, replace_existing, source)
+    resume = _load_checkpoint(checkpoint, key)
+    if checkpoint and resume is None:
+        # boshqa parametrlar / buzilgan checkpoint — uning fayllari yetim qolmasin
+        discard_checkpoint_files(checkpoint, storage)
+
+    # page_number start (eski sahifalar commit paytida o‘chiriladi)
+    if resume:
+        first_no = resume["first_no"]
+    elif replace_existing:
+        first_no = 0
+    else:
+        first_no = (
             Page.objects.filter(chapter=chapter)
             .aggregate(Max("page_number"))["page_number__max"]
             or 0
         )
 
-    pdf = pdfium.PdfDocument(pdf_path)
-    created = 0
+    plan: List[int] = list(resume["plan"]) if resume else []
+    start_page = len(plan)
+    out_no = first_no + sum(plan)
+    progress = {"done": out_no - first_no, "total": 0, "upto": out_no}
+    page_ends = deque()  # (oxirgi out_no, WEBP soni) — hali to‘liq yuklanmagan sahifalar
+
+    def _state() -> Dict[str, Any]:
+        last = first_no + sum(plan)
+        return {
+            "v": CHECKPOINT_VERSION,
+            "key": key,
+            "first_no": first_no,
+            "plan": list(plan),
+            "uploaded": {str(no): record for no, record in uploader.uploaded.items() if no <= last},
+            "owner": uploader.owner,
+        }
+
+    def _advance() -> None:
+        # yuklash tartib bo‘yicha: upto’gacha hammasi tayyor
+        changed = False
+        while page_ends and page_ends[0][0] <= progress["upto"]:
+            plan.append(page_ends.popleft()[1])
+            changed = True
+        if changed and checkpoint_cb:
+            checkpoint_cb(_state())
+
+    def _on_uploaded(_out_no: int) -> None:
+        progress["done"] += 1
+        progress["upto"] = _out_no
+        _advance()
+        if progress_cb:
+            progress_cb(progress["done"], progress["total"])
 
-    plan: List[Dict[str, Any]] = []
-    total_outputs = 0
+    uploader = _PageUploader(
+        storage,
+        # hold egasi checkpoint bilan birga o‘tadi (resume — o‘sha hold’lar davom etadi)
+        owner=(resume and resume["owner"]) or uuid.uuid4().hex,
+        max_workers=upload_workers,
+        on_uploaded=_on_uploaded,
+    )
 
-    try:
-        page_count = len(pdf)
+    if resume:
+        uploader.uploaded.update(resume["uploaded"])
+        # eski checkpoint’da owner bo‘lmasa ham checkpoint’dagi bloblar himoyalansin
+        hold_blobs([n for rec in resume["uploaded"].values() for n in record_names(rec)], uploader.owner)
 
-        # ---------- 1-pass: plan + total estimate ----------
-        for i in range(page_count):
-            page = pdf[i]
-            try:
-                try:
-                    w_units, h_units = page.get_size()
-                except Exception:
-                    w_units, h_units = 595.0, 842.0
-
-                crop_l, crop_r = _detect_content_crop_units(page, w_units, h_units)
-                content_w_units = max(1.0, float(w_units) - float(crop_l) - float(crop_r))
-
-                scale = _pick_scale(
-                    content_w_units=content_w_units,
-                    h_units=h_units,
-                    target_w_px=target_w,
-                    min_dpi=min_dpi,
-                    max_dpi=max_dpi,
-                    force_single_image=(not split_long_pages),
-                )
+    committed = False
 
-                predicted_h_px = float(h_units) * float(scale)
-                pieces = (
-                    max(1, int(math.ceil(predicted_h_px / float(CHUNK_HEIGHT))))
-                    if split_long_pages
-                    else 1
+    try:
+        if max_pixels > 0:
+            planned = sum(estimate_pixels(w, h, opts) for w, h in sizes)
+            if planned > max_pixels:
+                raise RenderLimitExceeded(
+                    f"PDF exceeds the pixel budget: ~{planned // 10**6} MP > {max_pixels // 10**6} MP."
                 )
 
-                plan.append(
-                    {
-                        "w_units": float(w_units),
-                        "h_units": float(h_units),
-                        "crop_l": float(crop_l),
-                        "crop_r": float(crop_r),
-                        "scale": float(scale),
-                        "pieces": int(pieces),
-                    }
-                )
-                total_outputs += int(pieces)
+        if pool is not None:
+            pool.workers = min(pool.workers, max(1, page_count - start_page))
+        else:
+            n = _resolve_workers(workers, page_count - start_page)
+            pool = _RenderPool(pdf_path, n, **pool_kw) if n > 1 else None
 
-            finally:
-                _safe_close(page)
+        # ---------- total: faqat o‘lcham bo‘yicha (sahifalar yuklanmaydi) ----------
+        t0 = time.perf_counter()
+        estimates = [estimate_pieces(*sizes[i], opts) for i in range(start_page, page_count)]
+        progress["total"] = progress["done"] + sum(estimates)
+        timings["plan"] += time.perf_counter() - t0
 
         if progress_cb:
-            progress_cb(0, total_outputs)
-
-        # ---------- 2-pass: render ----------
-        for i, meta in enumerate(plan):
-            page = pdf[i]
-            try:
-                h_units = float(meta["h_units"])
-                crop_l = float(meta["crop_l"])
-                crop_r = float(meta["crop_r"])
-                scale = float(meta["scale"])
-                pieces = int(meta["pieces"])
-
-                if pieces <= 1:
-                    # 1 PDF sahifa = 1 WEBP
-                    # pdfium crop: (left, bottom, right, top) — bu marginlar (unitda)
-                    crop = (crop_l, 0.0, crop_r, 0.0)
-
-                    bmp = page.render(scale=scale, crop=crop)
-                    try:
-                        img = bmp.to_pil().convert("RGB")
-
-                        # safety: limitdan oshsa kichraytirish
-                        if img.width > WEBP_MAX_DIM or img.height > WEBP_MAX_DIM:
-                            ratio = min(WEBP_MAX_DIM / img.width, WEBP_MAX_DIM / img.height)
-                            img = img.resize(
-                                (max(1, int(img.width * ratio)), max(1, int(img.height * ratio))),
-                                Image.LANCZOS,
-                            )
+            progress_cb(progress["done"], progress["total"])
+
+        # ---------- single-pass: har sahifa bir marta (serial yoki parallel) ----------
+        rendered = _iter_rendered_pages(
+            pdf,
+            page_count,
+            opts,
+            pool=pool,
+            start=start_page,
+            range_fn=render_image_range if archive else render_page_range,
+        )
+        pixels = 0
+        try:
+            for i, (meta, outputs) in enumerate(rendered, start=start_page):
+                if should_stop and should_stop():
+                    raise RenderInterrupted(f"Stopped at PDF page {i + 1}/{page_count}.")
 
-                        buf = BytesIO()
-                        img.save(buf, format="WEBP", quality=quality, method=webp_method)
-                        buf.seek(0)
+                # taxmin noto‘g‘ri chiqsa (crop tufayli bo‘laklar soni o‘zgardi) — total’ni tuzatamiz
+                progress["total"] += int(meta["pieces"]) - estimates[i - start_page]
 
-                        out_no += 1
-                        fname = (
-                            f"chapters/{chapter.manga.slug}/v{chapter.volume}/"
-                            f"ch{chapter.chapter_number}/{out_no:03d}.webp"
-                        )
-
-                        page_obj = Page(chapter=chapter, page_number=out_no)
-                        page_obj.image.save(fname, ContentFile(buf.read()), save=True)
-
-                        created += 1
-                        if progress_cb:
-                            progress_cb(created, total_outputs)
-
-                    finally:
-                        _safe_close(bmp)
-
-                else:
-                    # Chunk mode: tepdan pastga
-                    chunk_units = float(CHUNK_HEIGHT) / float(scale)
-                    slice_top = float(h_units)
-
-                    while slice_top > 0:
-                        slice_bottom = max(0.0, slice_top - chunk_units)
-
-                        # Qolsin: [slice_bottom .. slice_top]
-                        top_cut = float(h_units) - float(slice_top)   # tepadan kesiladigan
-                        bottom_cut = float(slice_bottom)              # pastdan kesiladigan
-
-                        # ✅ pdfium crop: (left, bottom, right, top)
-                        crop = (crop_l, bottom_cut, crop_r, top_cut)
-
-                        bmp = page.render(scale=scale, crop=crop)
-                        try:
-                            img = bmp.to_pil().convert("RGB")
-
-                            if img.width > WEBP_MAX_DIM or img.height > WEBP_MAX_DIM:
-                                ratio = min(WEBP_MAX_DIM / img.width, WEBP_MAX_DIM / img.height)
-                                img = img.resize(
-                                    (max(1, int(img.width * ratio)), max(1, int(img.height * ratio))),
-                                    Image.LANCZOS,
-                                )
-
-                            buf = BytesIO()
-                            img.save(buf, format="WEBP", quality=quality, method=webp_method)
-                            buf.seek(0)
-
-                            out_no += 1
-                            fname = (
-                                f"chapters/{chapter.manga.slug}/v{chapter.volume}/"
-                                f"ch{chapter.chapter_number}/{out_no:03d}.webp"
+                # serial rejimda outputs — generator: har bo‘lak render/encode bo‘lishi bilan yuklanadi
+                count = 0
+                try:
+                    for item in outputs:
+                        pixels += item.width * item.height
+                        if max_pixels > 0 and pixels > max_pixels:
+                            raise RenderLimitExceeded(
+                                f"PDF exceeds the pixel budget at page {i + 1}: > {max_pixels // 10**6} MP."
                             )
+                        out_no += 1
+                        count += 1
+                        uploader.submit(out_no, item)
+                finally:
+                    close = getattr(outputs, "close", None)
+                    if close is not None:
+                        close()
+                progress["total"] += count - int(meta["pieces"])
+                page_t = meta.get("timings", {})
+                for stage, seconds in page_t.items():
+                    timings[stage] = timings.get(stage, 0.0) + float(seconds)
+                timings["store"] = uploader.store_seconds
+                page_timings.append(
+                    [i] + [round(float(page_t.get(s, 0.0)), 3) for s in ("plan", "render", "encode")] + [count]
+                )
 
-                            page_obj = Page(chapter=chapter, page_number=out_no)
-                            page_obj.image.save(fname, ContentFile(buf.read()), save=True)
-
-                            created += 1
-                            if progress_cb:
-                                progress_cb(created, total_outputs)
-
-                        finally:
-                            _safe_close(bmp)
-
-                        slice_top = slice_bottom
-
-            finally:
-                _safe_close(page)
-
+                page_ends.append((out_no, count))
+                _advance()
+        finally:
+            rendered.close()
+
+        uploaded = uploader.drain()
+
+        # ---------- commit: bitta tranzaksiyada (eski sahifalar -> yangilari) ----------
+        t0 = time.perf_counter()
+        with transaction.atomic():
+            if replace_existing:
+                Page.objects.filter(chapter=chapter).delete()
+            numbers = range(first_no + 1, out_no + 1)
+            pages = Page.objects.bulk_create(
+                [Page(chapter=chapter, page_number=no, **page_fields(uploaded[no])) for no in numbers],
+                batch_size=500,
+            )
+            PageRendition.objects.bulk_create(
+                [r for page, no in zip(pages, numbers) for r in build_renditions(page, uploaded[no])],
+                batch_size=500,
+            )
+            drop_holds(uploader.owner)  # endi ishora — Page/PageRendition qatorlari
+            if checkpoint_cb:
+                checkpoint_cb({})
+        committed = True  # endi fayllar Page’larga tegishli — keyingi xatolikda o‘chirilmasin
+        timings["commit"] += time.perf_counter() - t0
+        timings["store"] = uploader.store_seconds
+
+        created = len(uploaded)
+        total_outputs = progress["total"]
+        if stats is not None:
+            stats.update(
+                bytes_written=sum(int(rec.get("b", 0)) for rec in uploaded.values()),
+                bytes_saved=sum(int(rec.get("s", 0)) for rec in uploaded.values()),
+                blobs_skipped=uploader.skipped,
+            )
         if progress_cb:
             progress_cb(total_outputs, total_outputs)
 
         return created, total_outputs
 
+    except RenderInterrupted:
+        if committed:
+            raise
+        if not checkpoint_cb:
+            uploader.discard()
+            raise
+        # fayllar saqlanadi: yo‘ldagi yuklashlar tugasin — checkpoint to‘liqroq bo‘lsin
+        try:
+            uploader.drain()
+        except BaseException:
+            uploader.discard()
+            raise
+        timings["store"] = uploader.store_seconds
+        raise
+
+    except BaseException:
+        if committed:
+            raise
+        uploader.discard()
+        if checkpoint_cb:
+            # fayllar o‘chdi — checkpoint ularga ishora qilib qolmasin
+            try:
+                checkpoint_cb({})
+            except Exception:
+                pass
+        raise
+
     finally:
+        uploader.close()
+        if pool is not None:
+            pool.close(abort=not committed)  # xatolik/to‘xtatishda osilgan render kutilmaydi
         _safe_close(pdf)
+
+
+def render_archive_to_pages(chapter, archive_path: str, **kwargs) -> Tuple[int, int]:
+    """
+    ZIP/CBZ (yoki admin’da tanlangan rasmlar yig‘ilgan ZIP) -> WEBP sahifalar.
+    render_pdf_to_pages(source=SOURCE_ARCHIVE) bilan bir xil: parallel decode/encode,
+    upload, progress, checkpoint/resume va bitta tranzaksiyadagi commit.
+    """
+    return render_pdf_to_pages(chapter, archive_path, source=SOURCE_ARCHIVE, **kwargs)
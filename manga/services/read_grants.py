@@ -0,0 +1,184 @@
+# manga/services/read_grants.py
+"""
+Bob o‘qish grant’i: page_image so‘rovlari DB’ga umuman tegmasin.
+
+chapter_read (can_read tekshirilgan joy) bitta imzolangan grant beradi:
+  subject (cookie hmac’i) + chapter_id + page-set versiyasi + muddat (TimestampSigner).
+Barcha sahifa URL’lari shu grant bilan; page_image esa:
+  1) imzo/muddatni tekshiradi;
+  2) subject’ni cookie’dan (session yoki visitor) solishtiradi — request.user/session
+     yuklanmaydi (DB yo‘q);
+  3) storage kalitini keshdagi sahifa xaritasidan oladi (page_id -> asl nom + eni variantlari).
+     Xarita faqat shu bob sahifalaridan — boshqa bobning page_id’si topilmaydi.
+
+Kesh sovuq bo‘lsa (eviction, boshqa gunicorn worker’i + LocMemCache) — yagona DB’ga
+murojaat qiladigan yo‘l: xarita bob uchun bir marta (2 ta so‘rov: sahifalar + variantlar)
+qayta quriladi. Birinchi so‘rov cache.add bilan "fill lock" oladi, shu bobning boshqa
+sahifa so‘rovlari (brauzer bir vaqtda o‘nlab rasm so‘raydi) DB’ga bormay xaritani kutadi;
+quruvchi PAGE_KEYS_FILL_WAIT ichida ulgurmasa — o‘zlari quradi. Xarita grant’ga
+joylanmaydi: URL uzunligi sahifalar soniga bog‘liq bo‘lib qolardi.
+Huquq bekor bo‘lsa (masalan refund) grant muddati tugaguncha amal qiladi.
+
+Brauzer keshi: grant vaqti GRANT_TIME_STEP’ga yaxlitlanadi — bob qayta ochilsa URL’lar
+o‘zgarmaydi. Bitta URL ortidagi rasm o‘zgarmaydi (versiya grant ichida), shuning uchun
+ETag — blob nomidan (page_etag); Last-Modified berilmaydi (grant vaqti rasm vaqti emas),
+issued faqat max-age (remaining) uchun.
+"""
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signing import BadSignature, SignatureExpired, TimestampSigner, b62_decode, b62_encode
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .page_blobs import digest_from_name
+
+GRANT_SALT = "manga.read-grant-v1"
+
+# Subject turi: login bo‘lgan — session cookie, mehmon — visitor cookie (ml_vid)
+SUBJECT_SESSION = "s"
+SUBJECT_VISITOR = "v"
+
+# page_id -> (asl nom, {eni: variant nomi})
+PageKeys = Dict[int, Tuple[str, Dict[int, str]]]
+
+# Sovuq keshda: xaritani boshqa so‘rov qurayotgan bo‘lsa shuncha (sec) kutiladi
+PAGE_KEYS_FILL_WAIT = 2.0
+PAGE_KEYS_FILL_POLL = 0.05
+
+# Grant vaqti shu qadamga yaxlitlanadi (page_delivery.EXPIRES_STEP bilan bir xil g‘oya)
+GRANT_TIME_STEP = 60
+
+
+class _GrantSigner(TimestampSigner):
+    def timestamp(self):
+        return b62_encode(int(time.time()) // GRANT_TIME_STEP * GRANT_TIME_STEP)
+
+
+_signer = _GrantSigner(salt=GRANT_SALT)
+
+
+@dataclass(frozen=True)
+class ReadGrant:
+    chapter_id: int
+    version: str
+    issued: int = 0  # unix vaqt (yaxlitlangan)
+
+    def remaining(self) -> int:
+        """Grant yana necha soniya amal qiladi (brauzer keshi max-age’i)."""
+        return max(0, self.issued + grant_max_age() - int(time.time()))
+
+
+def grant_max_age() -> int:
+    return int(getattr(settings, "PAGE_GRANT_MAX_AGE", 600))
+
+
+def _cookie_name(kind: str) -> str:
+    if kind == SUBJECT_SESSION:
+        return settings.SESSION_COOKIE_NAME
+    return getattr(settings, "MANGALAB_VISITOR_COOKIE", "ml_vid")
+
+
+def _subject_hash(value: str) -> str:
+    # cookie qiymatining o‘zi URL’ga chiqmasin
+    return salted_hmac(GRANT_SALT, value).hexdigest()[:24]
+
+
+def _keys_cache_key(chapter_id: int, version: str) -> str:
+    return f"page_keys_{chapter_id}_{version}"
+
+
+def build_page_keys(pages: Iterable) -> Tuple[PageKeys, str]:
+    """
+    Sahifalar (renditions prefetch bilan) -> (xarita, versiya).
+    Versiya — xarita mazmunidan (sahifa almashtirilsa yangi grant’lar yangi kesh kalitini oladi).
+    """
+    keys: PageKeys = {}
+    digest = hashlib.sha1()
+    for p in pages:
+        widths = {int(r.width): r.image.name for r in p.renditions.all()}
+        keys[int(p.id)] = (p.image.name, widths)
+        digest.update(f"{p.id}:{p.image.name}:{sorted(widths.items())};".encode())
+    return keys, digest.hexdigest()[:12]
+
+
+def cache_page_keys(chapter_id: int, pages: Iterable) -> str:
+    """chapter_read’dan: xaritani keshga qo‘yadi, versiyani qaytaradi."""
+    keys, version = build_page_keys(pages)
+    cache.set(_keys_cache_key(chapter_id, version), keys, grant_max_age() + 60)
+    return version
+
+
+def issue_grant(chapter_id: int, version: str, kind: str, subject: str) -> str:
+    """subject — cookie qiymati (session key yoki visitor id), kind — SUBJECT_*."""
+    return _signer.sign(f"{kind}:{_subject_hash(subject)}:{int(chapter_id)}:{version}")
+
+
+def check_grant(request, token: str) -> Optional[ReadGrant]:
+    """Imzo, muddat va cookie egasi — DB’siz. Yaroqsiz bo‘lsa None."""
+    try:
+        kind, subject, chapter_id, version = _signer.unsign(token, max_age=grant_max_age()).split(":")
+        chapter_id = int(chapter_id)
+        issued = b62_decode(token.rsplit(":", 2)[1])
+    except (BadSignature, SignatureExpired, ValueError):
+        return None
+    cookie = request.COOKIES.get(_cookie_name(kind))
+    if not cookie or not constant_time_compare(subject, _subject_hash(cookie)):
+        return None
+    return ReadGrant(chapter_id=chapter_id, version=version, issued=issued)
+
+
+def page_etag(name: str) -> str:
+    """
+    Strong ETag (qo‘shtirnoq bilan): content-addressed nomda — sha256 o‘zi,
+    legacy nomda — nom hash’i (storage mavjud faylni qayta yozmaydi, nom = mazmun).
+    """
+    return '"%s"' % (digest_from_name(name) or hashlib.sha1(name.encode()).hexdigest())
+
+
+def _load_page_keys(chapter_id: int) -> PageKeys:
+    Page = apps.get_model("manga", "Page")
+    pages = Page.objects.filter(chapter_id=chapter_id).only("id", "image").prefetch_related("renditions")
+    keys, _ = build_page_keys(pages)
+    return keys
+
+
+def _page_keys(grant: ReadGrant) -> PageKeys:
+    """Keshdagi xarita; sovuq bo‘lsa bob uchun bir marta quriladi (qolganlar kutadi)."""
+    cache_key = _keys_cache_key(grant.chapter_id, grant.version)
+    keys = cache.get(cache_key)
+    if keys is not None:
+        return keys
+
+    lock_key = f"{cache_key}_fill"
+    if not cache.add(lock_key, 1, int(PAGE_KEYS_FILL_WAIT) + 5):
+        deadline = time.monotonic() + PAGE_KEYS_FILL_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(PAGE_KEYS_FILL_POLL)
+            keys = cache.get(cache_key)
+            if keys is not None:
+                return keys
+    try:
+        keys = _load_page_keys(grant.chapter_id)
+        cache.set(cache_key, keys, grant_max_age() + 60)
+    finally:
+        cache.delete(lock_key)
+    return keys
+
+
+def resolve_page_key(grant: ReadGrant, page_id: int, width: int = 0) -> Optional[str]:
+    """
+    Grant bobidagi sahifaning storage nomi (width berilsa — o‘sha eni varianti, yo‘q bo‘lsa asl).
+    None — sahifa shu bobda yo‘q.
+    """
+    keys = _page_keys(grant)
+
+    entry = keys.get(int(page_id))
+    if entry is None:
+        return None
+    name, widths = entry
+    return widths.get(int(width), name) if width else name
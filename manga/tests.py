@@ -1,3 +1,990 @@
-from django.test import TestCase
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import types
+import zipfile
+from datetime import timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.admin.sites import site as admin_site
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core import checks
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from manga.admin import ChapterAdmin
+from manga.management.commands.process_pdf_jobs import Command as ProcessPdfJobs
+from manga.management.commands.process_pdf_jobs import RSS_RECYCLE_EXIT, JobLease, _worker_id
+from manga.models import Chapter, ChapterPDFJob, ChapterPurchase, Manga, Page, PendingPageBlob
+from manga.service import can_read
+from manga.services import pdf_render
+from manga.services.chapter_index import chapter_index
+from manga.services.entitlements import ChapterAccess, purchases_cache_key
+from manga.services.image_render import ImageArchive
+from manga.services.job_notify import PDF_JOBS_CHANNEL, JobWakeup, notify_pdf_jobs
+from manga.services.page_blobs import (
+    content_hash,
+    drop_holds,
+    hold_blobs,
+    page_fields,
+    release_blob,
+    store_blob,
+)
+from manga.services.page_delivery import cdn_signed_url, check_page_delivery, delivery_mode
+from manga.services.pdf_to_pages import RenderInterrupted, render_pdf_to_pages
+from manga.services.read_grants import (
+    GRANT_TIME_STEP,
+    SUBJECT_VISITOR,
+    cache_page_keys,
+    check_grant,
+    issue_grant,
+)
+
+# Testlar haqiqiy bucket’ga yozmasin: default storage — vaqtinchalik papka
+MEDIA_ROOT = tempfile.mkdtemp(prefix="manga-tests-")
+TEST_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage", "OPTIONS": {"location": MEDIA_ROOT}},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def make_manga(title="Test manga", **kwargs):
+    kwargs.setdefault("author", "a")
+    kwargs.setdefault("description", "d")
+    if "cover_image" not in kwargs:
+        # Manga.save cover faylini ochadi — storage’da bo‘lishi kerak
+        kwargs["cover_image"] = default_storage.save("covers/test.webp", ContentFile(webp_bytes()))
+    return Manga.objects.create(title=title, **kwargs)
+
+
+def make_job(chapter, **kwargs):
+    kwargs.setdefault("pdf", "pdf_jobs/x.pdf")
+    return ChapterPDFJob.objects.create(chapter=chapter, **kwargs)
+
+
+def make_pdf(pages=3, size=(400, 600)):
+    """Har sahifasi boshqa rangda (bloblar bir-biriga o‘xshamasin) — PDF baytlari."""
+    images = [Image.new("RGB", size, (40 * i % 256, 90, 160)) for i in range(pages)]
+    buf = io.BytesIO()
+    images[0].save(buf, "PDF", save_all=True, append_images=images[1:], resolution=72)
+    return buf.getvalue()
+
+
+def webp_bytes(color=(200, 30, 30), size=(64, 96)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, "WEBP")
+    return buf.getvalue()
+
+
+def jpeg_bytes(size=(300, 100), orientation=None):
+    img = Image.new("RGB", size)
+    exif = img.getexif()
+    if orientation:
+        exif[0x0112] = orientation
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", exif=exif)
+    return buf.getvalue()
+
+
+def job_worker(lease_seconds=60.0, worker_id="w-test"):
+    cmd = ProcessPdfJobs(stdout=io.StringIO(), stderr=io.StringIO())
+    cmd.lease_seconds = lease_seconds
+    cmd.worker_id = worker_id
+    return cmd
+
+
+def media_files():
+    return {os.path.join(root, f) for root, _, files in os.walk(MEDIA_ROOT) for f in files}
+
+
+# =========================== PDF job navbati ===========================
+
+@override_settings(STORAGES=TEST_STORAGES)
+class JobLeaseHeartbeatTests(TransactionTestCase):
+    # fon heartbeat thread’i o‘z ulanishidan yozadi — TestCase tranzaksiyasi uni ko‘rsatmaydi
+
+    def setUp(self):
+        self.chapter = Chapter.objects.create(manga=make_manga(), chapter_number=1)
+        self.job = make_job(
+            self.chapter,
+            status=ChapterPDFJob.STATUS_PROCESSING,
+            worker_id="w1",
+            started_at=timezone.now(),
+            heartbeat_at=timezone.now(),
+        )
+
+    def test_long_page_keeps_lease(self):
+        # bitta uzun sahifa: asosiy thread lease’dan uzoqroq beat() chaqirmaydi
+        lease = JobLease(pk=self.job.pk, worker_id="w1", lease_seconds=0.4)
+        lease.start()
+        try:
+            time.sleep(1.2)
+            job_worker(lease_seconds=0.4, worker_id="w2")._requeue_stale_jobs()
+            self.job.refresh_from_db()
+            self.assertEqual(self.job.status, ChapterPDFJob.STATUS_PROCESSING)
+            self.assertEqual(self.job.worker_id, "w1")
+            lease.beat(force=True)  # hali egasi — exception yo‘q
+        finally:
+            lease.stop()
+
+    def test_stale_job_is_requeued_without_heartbeat(self):
+        ChapterPDFJob.objects.filter(pk=self.job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=5))
+        job_worker(lease_seconds=1.0)._requeue_stale_jobs()
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, ChapterPDFJob.STATUS_PENDING)
+        self.assertEqual(self.job.worker_id, "")
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class FairShareSchedulingTests(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.manga = make_manga()
+        self.worker = job_worker()
+
+    def queue(self, user, priority=0):
+        chapter = Chapter.objects.create(manga=self.manga, chapter_number=Chapter.objects.count() + 1)
+        return make_job(chapter, created_by=user, priority=priority)
+
+    def drain(self):
+        order = []
+        while True:
+            job = self.worker._pick_next_job()
+            if job is None:
+                return order
+            order.append(job)
+            ChapterPDFJob.objects.filter(pk=job.pk).update(status=ChapterPDFJob.STATUS_DONE)
+
+    def test_uploaders_take_turns(self):
+        # alice 3 ta bobni oldinroq navbatga qo‘ydi — bob oxirigacha kutmaydi
+        alice_jobs = [self.queue(self.alice) for _ in range(3)]
+        bob_jobs = [self.queue(self.bob) for _ in range(2)]
+        order = [job.pk for job in self.drain()]
+        expected = [alice_jobs[0], bob_jobs[0], alice_jobs[1], bob_jobs[1], alice_jobs[2]]
+        self.assertEqual(order, [job.pk for job in expected])
+
+    def test_running_share_goes_last_and_priority_first(self):
+        busy = self.queue(self.alice)
+        ChapterPDFJob.objects.filter(pk=busy.pk).update(status=ChapterPDFJob.STATUS_PROCESSING)
+        waiting = self.queue(self.alice)
+        other = self.queue(self.bob)
+        urgent = self.queue(self.alice, priority=10)
+
+        picked = self.worker._pick_next_job()
+        self.assertEqual(picked.pk, urgent.pk)
+        self.assertEqual((picked.status, picked.worker_id), (ChapterPDFJob.STATUS_PROCESSING, "w-test"))
+        # alice’da ikkita job ishlayapti — bob’niki oldin
+        self.assertEqual(self.worker._pick_next_job().pk, other.pk)
+        self.assertEqual(self.worker._pick_next_job().pk, waiting.pk)
+
+
+@override_settings(STORAGES=TEST_STORAGES, PAGE_RENDITION_WIDTHS=[], PDF_RENDER_ISOLATED=False)
+class CancelRunningJobTests(TransactionTestCase):
+    # admin action va worker — alohida tranzaksiyalar, hold’lar commit’siz ko‘rinishi kerak
+
+    def setUp(self):
+        self.chapter = Chapter.objects.create(manga=make_manga(), chapter_number=1)
+        for no in (1, 2):
+            name, _, _ = store_blob(webp_bytes(color=(no * 50, 0, 0)))
+            Page.objects.create(chapter=self.chapter, page_number=no, **page_fields({"name": name}))
+        self.job = make_job(
+            self.chapter,
+            pdf=default_storage.save("pdf_jobs/cancel.pdf", ContentFile(make_pdf(pages=6))),
+            replace_existing=True,
+            status=ChapterPDFJob.STATUS_PROCESSING,
+            worker_id="w-test",
+            started_at=timezone.now(),
+            heartbeat_at=timezone.now(),
+        )
+        self.admin_request = RequestFactory().post("/")
+        self.admin_request.user = get_user_model().objects.create_superuser("admin", "a@example.com", "x")
+        self.admin_request._messages = CookieStorage(self.admin_request)
+
+    def test_cancel_rolls_back_uploads_and_keeps_pages(self):
+        pages_before = list(Page.objects.values_list("pk", "page_number", "image"))
+        files_before = media_files()
+        pdf_name = self.job.pdf.name
+        calls = []
+
+        def cancel_after_two_pages():
+            calls.append(PendingPageBlob.objects.count())
+            if len(calls) == 3:
+                ChapterAdmin(Chapter, admin_site).cancel_pdf_jobs(
+                    self.admin_request, Chapter.objects.filter(pk=self.chapter.pk)
+                )
+            return False
+
+        worker = job_worker(lease_seconds=0.2)  # bekor qilish keyingi sahifa chegarasida seziladi
+        worker.render_workers = 1
+        worker.upload_workers = 2
+        with mock.patch.object(ProcessPdfJobs, "_over_memory_limit", side_effect=cancel_after_two_pages), \
+                mock.patch.object(ProcessPdfJobs, "_count_throughput"):
+            worker._process_job(self.job)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, ChapterPDFJob.STATUS_CANCELLED)
+        self.assertEqual(self.job.error, "Cancelled by admin.")
+        self.assertEqual((self.job.checkpoint, self.job.pdf.name), ({}, ""))
+        self.assertGreater(calls[2], 0)  # bekor qilish paytida yuklangan bloblar bor edi
+        self.assertFalse(PendingPageBlob.objects.exists())
+        self.assertEqual(list(Page.objects.values_list("pk", "page_number", "image")), pages_before)
+        # yangi bloblar va job PDF’i o‘chirilgan, eski sahifalar fayllari joyida
+        self.assertEqual(media_files(), files_before - {default_storage.path(pdf_name)})
+
+
+class FakeChild:
+    """Supervisor uchun soxta worker process: start()da jobni oladi va ssenariydagi kod bilan darhol chiqadi."""
+
+    def __init__(self, pid, current_job, job_pk, exitcode):
+        self.pid = self.sentinel = pid
+        self.exitcode = None
+        self._current_job, self._job_pk, self._exitcode = current_job, job_pk, exitcode
+
+    def start(self):
+        self._current_job.value = self._job_pk
+        self.exitcode = self._exitcode
+
+    def is_alive(self):
+        return self.exitcode is None
+
+
+class FakeForkContext:
+    """multiprocessing.get_context("fork") o‘rniga: child’lar ssenariy bo‘yicha, start vaqtlari yoziladi."""
+
+    def __init__(self, script, clock):
+        self.script = list(script)  # [(qo‘ldagi job pk, exit code), ...]
+        self.clock = clock
+        self.started = []
+
+    def Value(self, typecode, value):
+        return types.SimpleNamespace(value=value)
+
+    def Process(self, target, args, kwargs, name, daemon):
+        job_pk, exitcode = self.script.pop(0)
+        self.started.append(self.clock[0])
+        return FakeChild(1000 + len(self.started), args[1], job_pk, exitcode)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class SupervisorTests(TestCase):
+
+    def test_crash_requeues_job_and_recycle_restarts_without_backoff(self):
+        chapter = Chapter.objects.create(manga=make_manga(), chapter_number=1)
+        # birinchi child (pid=1001) shu jobni ushlab yiqiladi
+        job = make_job(chapter, status=ChapterPDFJob.STATUS_PROCESSING, worker_id=_worker_id(1001))
+        clock = [0.0]
+        ctx = FakeForkContext([(job.pk, -9), (0, RSS_RECYCLE_EXIT), (0, 0)], clock)
+
+        def tick(*args, **kwargs):
+            clock[0] += 1.0  # har sikl (wait yoki backoff paytidagi sleep) — bir "soniya"
+
+        with mock.patch("multiprocessing.get_context", return_value=ctx), \
+                mock.patch("multiprocessing.connection.wait", side_effect=tick), \
+                mock.patch("time.sleep", side_effect=tick), \
+                mock.patch("time.monotonic", side_effect=lambda: clock[0]), \
+                mock.patch("signal.signal"), \
+                mock.patch("manga.management.commands.process_pdf_jobs.connections"):
+            job_worker()._supervise(1, once=True, sleep_s=0, stale_min=0, shutdown_timeout=0)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id), (ChapterPDFJob.STATUS_PENDING, ""))
+        self.assertEqual(job.error, "Requeued: worker exited (code=-9).")
+        # yiqilish: t=1 da sezildi, backoff 2s -> t=3; recycle: t=4 da sezildi va darhol qayta ishga tushdi
+        self.assertEqual(ctx.started, [0.0, 3.0, 4.0])
+
+
+class JobNotifyTests(TestCase):
+
+    def postgres(self):
+        # sqlite’da _send hech narsa qilmaydi — NOTIFY’ni soxta PostgreSQL ulanishida ushlaymiz
+        wrapper = mock.MagicMock(vendor="postgresql")
+        return wrapper, wrapper.cursor.return_value.__enter__.return_value
+
+    def test_notify_is_sent_only_after_commit(self):
+        wrapper, cursor = self.postgres()
+        with mock.patch("manga.services.job_notify.connections", {"default": wrapper}):
+            with self.captureOnCommitCallbacks() as callbacks:
+                notify_pdf_jobs(42)
+                cursor.execute.assert_not_called()  # tranzaksiya ichida — hali yo‘q
+            self.assertEqual(len(callbacks), 1)
+            callbacks[0]()
+        cursor.execute.assert_called_once_with("SELECT pg_notify(%s, %s)", [PDF_JOBS_CHANNEL, "42"])
+
+    def test_rolled_back_job_is_not_notified(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    notify_pdf_jobs(42)
+                    raise RuntimeError("job yaratilmadi")
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+
+    def test_wakeup_falls_back_to_polling_without_postgres(self):
+        waiter = JobWakeup()
+        self.assertFalse(waiter.listening)
+        with mock.patch("time.sleep") as sleep:
+            self.assertFalse(waiter.wait(5, should_stop=lambda: sleep.call_count >= 2))
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1.0, 1.0])  # bo‘laklab uxlaydi
+        waiter.close()
+
+
+# =========================== PDF -> sahifalar ===========================
+
+@override_settings(STORAGES=TEST_STORAGES, PAGE_RENDITION_WIDTHS=[])
+class CheckpointResumeTests(TestCase):
+
+    def setUp(self):
+        self.chapter = Chapter.objects.create(manga=make_manga(), chapter_number=1)
+        self.pdf_path = default_storage.path(default_storage.save("src.pdf", ContentFile(make_pdf(pages=5))))
+
+    def render(self, **kwargs):
+        kwargs.setdefault("isolated", False)
+        return render_pdf_to_pages(self.chapter, self.pdf_path, **kwargs)
+
+    def test_resume_continues_after_last_checkpoint(self):
+        state = {}
+        calls = {"n": 0}
+
+        def stop_after_two():
+            calls["n"] += 1
+            return calls["n"] > 2
+
+        with self.assertRaises(RenderInterrupted):
+            self.render(should_stop=stop_after_two, checkpoint_cb=lambda st: state.update(cp=st))
+        self.assertFalse(Page.objects.filter(chapter=self.chapter).exists())  # commit bo‘lmagan
+        done_before = len(state["cp"]["uploaded"])
+        self.assertEqual(done_before, 2)
+
+        progress, rendered = [], []
+        self.render(
+            checkpoint=state["cp"],
+            progress_cb=lambda done, total: progress.append(done),
+            should_stop=lambda: rendered.append(1) and False,  # har PDF sahifada bir marta
+        )
+        # checkpoint’dagi sahifalar qayta render qilinmaydi: progress shu joydan boshlanadi
+        self.assertEqual(len(rendered), 5 - done_before)
+        self.assertEqual(progress[0], done_before)
+        self.assertEqual(progress[-1], 5)
+
+        resumed = list(Page.objects.filter(chapter=self.chapter).values_list("page_number", "image"))
+        self.assertEqual([n for n, _ in resumed], [1, 2, 3, 4, 5])
+
+        # uzilishsiz render bilan bir xil bloblar
+        Page.objects.filter(chapter=self.chapter).delete()
+        self.render()
+        fresh = list(Page.objects.filter(chapter=self.chapter).values_list("page_number", "image"))
+        self.assertEqual(resumed, fresh)
+
+
+@override_settings(STORAGES=TEST_STORAGES, PAGE_RENDITION_WIDTHS=[], PDF_RENDER_ISOLATED=True)
+class RenderPoolFailureTests(TransactionTestCase):
+    # upload hold’lari va lease worker tranzaksiyasidan tashqarida ko‘rinishi kerak
+
+    def setUp(self):
+        chapter = Chapter.objects.create(manga=make_manga(), chapter_number=1)
+        self.job = make_job(
+            chapter,
+            pdf=default_storage.save("pdf_jobs/crash.pdf", ContentFile(make_pdf(pages=6))),
+            status=ChapterPDFJob.STATUS_PROCESSING,
+            worker_id="w-test",
+            started_at=timezone.now(),
+            heartbeat_at=timezone.now(),
+        )
+        self.worker = job_worker()
+        self.worker.render_workers = 1
+        self.worker.upload_workers = 2
+
+    def test_killed_render_process_fails_job_and_releases_holds(self):
+        before = media_files()
+        held = []
+
+        def kill_after_first_page():
+            # _should_stop ikkinchi sahifada: birinchisi allaqachon hold qilingan va yuklanmoqda
+            held.append(PendingPageBlob.objects.count())
+            if len(held) == 2:
+                for proc in multiprocessing.active_children():
+                    proc.kill()
+                    proc.join()
+            return False
+
+        with mock.patch.object(ProcessPdfJobs, "_over_memory_limit", side_effect=kill_after_first_page), \
+                mock.patch.object(ProcessPdfJobs, "_count_throughput"):
+            self.worker._process_job(self.job)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, ChapterPDFJob.STATUS_FAILED)
+        self.assertIn("Render process died", self.job.error)
+        self.assertEqual(self.job.checkpoint, {})
+        self.assertGreater(held[1], 0)
+        self.assertFalse(PendingPageBlob.objects.exists())
+        self.assertFalse(Page.objects.exists())
+        self.assertEqual(media_files(), before)  # yuklangan bloblar o‘chirilgan
+        self.assertEqual(multiprocessing.active_children(), [])
+
+
+@override_settings(STORAGES=TEST_STORAGES, PAGE_RENDITION_WIDTHS=[])
+class ParallelRenderTests(TestCase):
+
+    def test_workers_do_not_change_output(self):
+        chapter = Chapter.objects.create(manga=make_manga(), chapter_number=1)
+        pdf_path = default_storage.path(default_storage.save("par.pdf", ContentFile(make_pdf(pages=5))))
+        results = []
+        for workers in (1, 2):
+            render_pdf_to_pages(chapter, pdf_path, workers=workers, isolated=False, replace_existing=True)
+            results.append(list(
+                Page.objects.filter(chapter=chapter)
+                .order_by("page_number")
+                .values_list("page_number", "image", "width", "height")
+            ))
+        self.assertEqual(len(results[0]), 5)
+        self.assertEqual(results[0], results[1])
+
+
+# =========================== Margin aniqlash ===========================
+
+@skipIf(pdf_render.np is None, "numpy o‘rnatilmagan")
+class CropDetectTests(SimpleTestCase):
+
+    def fixtures(self):
+        np = pdf_render.np
+        rng = np.random.default_rng(7)
+        page = np.full((120, 90, 3), 255, dtype=np.uint8)
+        page[20:70, 10:60] = (200, 30, 30)
+        faint = np.full((80, 80, 3), 255, dtype=np.uint8)
+        faint[30:50, 5:75] = rng.integers(236, 256, (20, 70, 3), dtype=np.uint8)
+        dot = np.full((40, 40, 3), 255, dtype=np.uint8)
+        dot[13, 27] = (250, 250, 120)
+        yellow = np.full((40, 60, 3), 255, dtype=np.uint8)
+        yellow[5:10, 5:10] = 0
+        yellow[30, 50] = (255, 255, 150)  # sariq: min(kanal) bo‘yicha qora, luma bo‘yicha deyarli oq
+        return {
+            "rangli blok": page,
+            "past kontrast": faint,
+            "shovqin": rng.integers(0, 256, (50, 70, 3), dtype=np.uint8),
+            "tekis rang": np.full((30, 40, 3), (120, 180, 90), dtype=np.uint8),
+            "kulrang": np.repeat(rng.integers(200, 256, (45, 35, 1), dtype=np.uint8), 3, axis=2),
+            "oq": np.full((30, 30, 3), 255, dtype=np.uint8),
+            "bitta nuqta": dot,
+            "sariq nuqta": yellow,
+        }
+
+    def test_numpy_matches_pil(self):
+        np = pdf_render.np
+        for name, rgb in self.fixtures().items():
+            with self.subTest(name):
+                expected = pdf_render._content_bbox_px(Image.fromarray(rgb, "RGB"))
+                bgr = np.ascontiguousarray(rgb[:, :, ::-1])
+                self.assertEqual(pdf_render._content_bbox_np(bgr), expected)
+                self.assertEqual(pdf_render._content_bbox_np(rgb, bgr=False), expected)
+
+    def test_bands_merge_like_single_bitmap(self):
+        np = pdf_render.np
+        rgb = self.fixtures()["rangli blok"]
+        parts = [pdf_render._bbox_reductions(rgb[y:y + 50], bgr=False) for y in range(0, rgb.shape[0], 50)]
+        merged = pdf_render._bbox_from_reductions(
+            np.maximum.reduce([c for c, _, _ in parts]),
+            np.concatenate([r for _, r, _ in parts]),
+            min(lo for _, _, lo in parts),
+            rgb.shape[0],
+        )
+        self.assertEqual(merged, pdf_render._content_bbox_np(rgb, bgr=False))
+
+
+# =========================== Gutter bo‘yicha bo‘laklash ===========================
+
+class GutterSplitTests(SimpleTestCase):
+    CHUNK = 400
+
+    def strip(self, gutters, height=1000):
+        """Har qatorida qora-oq kontent; gutters — [(start, end), ...] oq qatorlar."""
+        img = Image.new("RGB", (40, height), "white")
+        ImageDraw.Draw(img).rectangle((0, 0, 19, height - 1), fill="black")
+        for a, b in gutters:
+            img.paste((255, 255, 255), (0, a, 40, b))
+        return img
+
+    def cuts(self, img):
+        runs = pdf_render._blank_runs(pdf_render._blank_rows(img))
+        return runs, pdf_render._gutter_cuts(runs, 0, img.height, self.CHUNK)
+
+    def test_cuts_in_gutter_middle(self):
+        runs, cuts = self.cuts(self.strip([(300, 320), (650, 670)]))
+        self.assertEqual(runs, [(300, 320), (650, 670)])
+        self.assertEqual(cuts, [310, 660])
+
+    def test_no_gutters_falls_back_to_chunk(self):
+        runs, cuts = self.cuts(self.strip([]))
+        self.assertEqual(runs, [])
+        self.assertEqual(cuts, [400, 800])
+
+    def test_gutter_before_min_fraction_is_ignored(self):
+        lo = int(self.CHUNK * pdf_render.GUTTER_MIN_FRACTION)
+        # gutter oynadan (lo..chunk) bir qator oldin tugaydi — juda qisqa bo‘lak chiqmasin
+        runs, cuts = self.cuts(self.strip([(lo - 20, lo)]))
+        self.assertEqual(runs, [(lo - 20, lo)])
+        self.assertEqual(cuts, [400, 800])
+        # oynaga bitta qator kirsa — kesim oyna boshida
+        _, cuts = self.cuts(self.strip([(lo - 20, lo + 1)]))
+        self.assertEqual(cuts[0], lo)
+
+    def test_short_blank_run_is_not_gutter(self):
+        runs, cuts = self.cuts(self.strip([(300, 300 + pdf_render.GUTTER_MIN_ROWS - 1)]))
+        self.assertEqual(runs, [])
+        self.assertEqual(cuts, [400, 800])
+
+
+# =========================== Adaptive WEBP quality ===========================
+
+class ChooseQualityTests(SimpleTestCase):
+    TARGET = pdf_render.QualityTarget(quality=90, min_quality=60, target_psnr=40.0)
+
+    def choose(self, img, target=TARGET):
+        encoded = {}
+        quality, _ = pdf_render.choose_quality(img, target, webp_method=4, encoded=encoded)
+        self.assertIn(quality, encoded)  # tanlangan quality qayta encode qilinmaydi
+        return quality
+
+    def test_flat_page_gets_lowest_quality(self):
+        self.assertEqual(self.choose(Image.new("RGB", (200, 300), (240, 240, 235))), 60)
+
+    def test_noisy_page_stays_above_floor(self):
+        noisy = Image.effect_noise((200, 300), 100).convert("RGB")
+        self.assertGreater(self.choose(noisy), self.TARGET.min_quality)
+        # byudjetga hech qaysi pog‘ona sig‘masa ham — min_quality’dan past emas
+        budget = pdf_render.QualityTarget(quality=90, min_quality=60, max_bytes_per_mpx=1)
+        self.assertEqual(self.choose(noisy, budget), 60)
+
+    def test_not_adaptive_keeps_quality(self):
+        target = pdf_render.QualityTarget(quality=82, min_quality=82, target_psnr=40.0)
+        quality, ratio = pdf_render.choose_quality(Image.new("RGB", (20, 20)), target, webp_method=4)
+        self.assertEqual((quality, ratio), (82, 1.0))
+
+
+# =========================== Rasm arxivlari (ZIP/CBZ) ===========================
+
+class ImageArchiveTests(TestCase):
+
+    def make_archive(self, members):
+        path = os.path.join(MEDIA_ROOT, f"{self._testMethodName}.cbz")
+        with zipfile.ZipFile(path, "w") as zf:
+            for name, data in members:
+                zf.writestr(name, data)
+        archive = ImageArchive(path)
+        self.addCleanup(archive.close)
+        return archive
+
+    def test_members_in_natural_order(self):
+        page = jpeg_bytes()
+        archive = self.make_archive([
+            ("10.jpg", page),
+            ("2.jpg", page),
+            ("__MACOSX/._1.jpg", b""),
+            (".cover.jpg", page),
+            ("notes.txt", b"x"),
+            ("1.jpg", page),
+        ])
+        self.assertEqual(archive.members, ["1.jpg", "2.jpg", "10.jpg"])
+        self.assertEqual(archive.size(0), (300, 100))
+        self.assertEqual(archive.load(0).size, (300, 100))
+
+    def test_size_follows_exif_orientation(self):
+        orientations = (1, 3, 6, 8)
+        archive = self.make_archive([(f"{o}.jpg", jpeg_bytes(orientation=o)) for o in orientations])
+        for index, orientation in enumerate(orientations):
+            with self.subTest(orientation=orientation):
+                # size() decode qilmaydi, lekin load() bilan bir xil o‘lcham beradi
+                self.assertEqual(archive.size(index), archive.load(index).size)
+        self.assertEqual([archive.size(i) for i in range(4)], [(300, 100), (300, 100), (100, 300), (100, 300)])
+
+
+# =========================== Content-addressed bloblar ===========================
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ReleaseBlobTests(TestCase):
+
+    def setUp(self):
+        self.chapter = Chapter.objects.create(manga=make_manga(), chapter_number=1)
+        self.name, _, created = store_blob(webp_bytes())
+        self.assertTrue(created)
+        self.addCleanup(default_storage.delete, self.name)
+
+    def make_page(self, number, name=None):
+        fields = page_fields({"name": name or self.name})
+        return Page.objects.create(chapter=self.chapter, page_number=number, **fields)
+
+    def test_shared_blob_survives_until_last_reference(self):
+        first, second = self.make_page(1), self.make_page(2)
+        self.assertEqual(store_blob(webp_bytes())[0], self.name)  # bir xil mazmun — bitta blob
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(self.name))
+        self.assertFalse(release_blob(self.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()  # oxirgi ishora — post_delete commit’dan keyin o‘chiradi
+        self.assertFalse(default_storage.exists(self.name))
+
+    def test_pending_hold_blocks_release(self):
+        hold_blobs([self.name], "job-1")
+        self.assertFalse(release_blob(self.name))
+        self.assertTrue(default_storage.exists(self.name))
+
+        drop_holds("job-1")
+        self.assertTrue(release_blob(self.name))
+        self.assertFalse(default_storage.exists(self.name))
+
+    def test_legacy_name_is_released_without_reference_check(self):
+        legacy = default_storage.save("chapters/pages/legacy.webp", ContentFile(webp_bytes()))
+        self.make_page(1, legacy)
+        self.assertTrue(release_blob(legacy))
+        self.assertFalse(default_storage.exists(legacy))
+
+
+# =========================== Sahifa meta backfill ===========================
+
+@override_settings(STORAGES=TEST_STORAGES)
+class BackfillPageMetaTests(TestCase):
+
+    def setUp(self):
+        chapter = Chapter.objects.create(manga=make_manga(), chapter_number=1)
+        # eski qatorlar: fayl bor, eni/bo‘yi/hajmi/hash bo‘sh
+        self.legacy_body = jpeg_bytes(size=(300, 100))
+        legacy_name = default_storage.save("chapters/pages/legacy.jpg", ContentFile(self.legacy_body))
+        self.blob_body = webp_bytes(color=(20, 120, 200))
+        blob_name, self.digest, _ = store_blob(self.blob_body)
+        for name in (legacy_name, blob_name):
+            self.addCleanup(default_storage.delete, name)
+        self.legacy = Page.objects.create(chapter=chapter, page_number=1, image=legacy_name)
+        self.blob = Page.objects.create(chapter=chapter, page_number=2, image=blob_name)
+
+    def backfill(self):
+        out = io.StringIO()
+        call_command("backfill_page_meta", workers=2, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def meta(self, page):
+        page.refresh_from_db()
+        return page.width, page.height, page.file_size, page.content_hash
+
+    def test_fills_missing_meta(self):
+        self.assertEqual(self.meta(self.legacy), (0, 0, 0, ""))
+        self.assertIn("2 pages updated, 0 failed", self.backfill())
+        self.assertEqual(
+            self.meta(self.legacy), (300, 100, len(self.legacy_body), content_hash(self.legacy_body))
+        )
+        # content-addressed nom: hash fayl nomidan
+        self.assertEqual(self.meta(self.blob), (64, 96, len(self.blob_body), self.digest))
+
+    def test_second_run_is_noop(self):
+        self.backfill()
+        before = [self.meta(self.legacy), self.meta(self.blob)]
+        with self.assertNumQueries(1):  # bo‘sh qatorlar so‘rovi — bulk_update yo‘q
+            self.assertIn("0 pages updated, 0 failed", self.backfill())
+        self.assertEqual([self.meta(self.legacy), self.meta(self.blob)], before)
+
+
+# =========================== Sahifa o‘qish grant’i ===========================
+
+@override_settings(PAGE_GRANT_MAX_AGE=600, MANGALAB_VISITOR_COOKIE="ml_vid")
+class ReadGrantTests(TestCase):
+
+    def request(self, visitor="vid-1"):
+        request = RequestFactory().get("/")
+        if visitor:
+            request.COOKIES["ml_vid"] = visitor
+        return request
+
+    def test_valid_grant(self):
+        token = issue_grant(7, "abc123", SUBJECT_VISITOR, "vid-1")
+        grant = check_grant(self.request(), token)
+        self.assertEqual((grant.chapter_id, grant.version), (7, "abc123"))
+        self.assertEqual(grant.issued % GRANT_TIME_STEP, 0)
+        self.assertTrue(0 < grant.remaining() <= 600)
+        # bir qadam ichida qayta berilgan grant — aynan shu URL (brauzer keshi)
+        self.assertEqual(issue_grant(7, "abc123", SUBJECT_VISITOR, "vid-1"), token)
+
+    def test_tampered_grant(self):
+        token = issue_grant(7, "abc123", SUBJECT_VISITOR, "vid-1")
+        forged = token.replace(":7:", ":8:", 1)
+        self.assertNotEqual(forged, token)
+        self.assertIsNone(check_grant(self.request(), forged))
+        self.assertIsNone(check_grant(self.request(), token[:-1] + ("A" if token[-1] != "A" else "B")))
+
+    def test_grant_is_bound_to_cookie(self):
+        token = issue_grant(7, "abc123", SUBJECT_VISITOR, "vid-1")
+        self.assertIsNone(check_grant(self.request("vid-2"), token))
+        self.assertIsNone(check_grant(self.request(None), token))
+
+    def test_expired_grant(self):
+        token = issue_grant(7, "abc123", SUBJECT_VISITOR, "vid-1")
+        later = time.time() + 600 + GRANT_TIME_STEP + 1
+        with mock.patch("time.time", return_value=later):
+            self.assertIsNone(check_grant(self.request(), token))
+
+
+@override_settings(STORAGES=TEST_STORAGES, PAGE_GRANT_MAX_AGE=600, USE_X_ACCEL_REDIRECT=False)
+class PageImageTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        chapter = Chapter.objects.create(manga=make_manga(), chapter_number=1)
+        self.body = webp_bytes(size=(300, 400))
+        name, _, _ = store_blob(self.body)
+        self.page = Page.objects.create(chapter=chapter, page_number=1, **page_fields({"name": name}))
+        version = cache_page_keys(chapter.id, Page.objects.filter(chapter=chapter).prefetch_related("renditions"))
+        self.client.cookies["ml_vid"] = "vid-1"
+        token = issue_grant(chapter.id, version, SUBJECT_VISITOR, "vid-1")
+        self.url = reverse("manga:page_image", args=[self.page.id, token])
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def test_full_response(self):
+        response, content = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, self.body)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], '"%s"' % self.page.content_hash)
+        self.assertNotIn("Last-Modified", response)
+        self.assertTrue(response["Cache-Control"].startswith("private, max-age="))
+
+    def test_not_modified(self):
+        etag = self.get()[0]["ETag"]
+        response, content = self.get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(content, b"")
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.get(If_None_Match='"other"')[0].status_code, 200)
+
+    def test_byte_ranges(self):
+        size = len(self.body)
+        response, content = self.get(Range="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{size}")
+        self.assertEqual(content, self.body[10:20])
+
+        response, content = self.get(Range="bytes=-5")
+        self.assertEqual((response.status_code, content), (206, self.body[-5:]))
+
+        response, content = self.get(Range="bytes=100-")
+        self.assertEqual((response.status_code, content), (206, self.body[100:]))
+
+    def test_unsatisfiable_range(self):
+        size = len(self.body)
+        response, _ = self.get(Range=f"bytes={size}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{size}")
+
+    def test_if_range_mismatch_sends_full_body(self):
+        response, content = self.get(Range="bytes=0-9", If_Range='"stale"')
+        self.assertEqual((response.status_code, content), (200, self.body))
+        etag = response["ETag"]
+        self.assertEqual(self.get(Range="bytes=0-9", If_Range=etag)[0].status_code, 206)
+
+    def test_foreign_cookie_is_forbidden(self):
+        self.client.cookies["ml_vid"] = "vid-2"
+        self.assertEqual(self.get()[0].status_code, 403)
+
+
+@override_settings(STORAGES=TEST_STORAGES, PAGE_RENDITION_WIDTHS=[480, 720, 1080], PAGE_DELIVERY="proxy")
+class PageRenditionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.chapter = Chapter.objects.create(manga=make_manga(), chapter_number=1)
+        upload = SimpleUploadedFile("p1.jpg", jpeg_bytes(size=(1500, 2000)), content_type="image/jpeg")
+        self.page = Page.objects.create(chapter=self.chapter, page_number=1, image=upload)
+
+    def test_saved_page_gets_rendition_per_width(self):
+        widths = list(self.page.renditions.order_by("width").values_list("width", flat=True))
+        self.assertEqual(widths, [480, 720, 1080, 1500])  # + asl eni (Page.image bilan bitta blob)
+        original = self.page.renditions.get(width=1500)
+        self.assertEqual((original.image.name, original.height), (self.page.image.name, 2000))
+
+    def test_chapter_read_lists_renditions_in_srcset(self):
+        url = reverse("manga:chapter_read", args=[self.chapter.manga.slug, 1, 1])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        (item,) = response.context["pages_payload"]
+        self.assertEqual(
+            [entry.split("?w=")[1] for entry in item["srcset"].split(", ")],
+            ["480 480w", "720 720w", "1080 1080w", "1500 1500w"],
+        )
+        self.assertTrue(all(entry.startswith(item["url"]) for entry in item["srcset"].split(", ")))
+        self.assertEqual((item["w"], item["h"]), (1500, 2000))
+        self.assertContains(response, 'imagesrcset="%s"' % item["srcset"])
+
+
+# =========================== Sahifa yetkazish (CDN) ===========================
+
+PRIVATE_BUCKET = {"AWS_DEFAULT_ACL": "private", "AWS_QUERYSTRING_AUTH": True, "AWS_S3_OBJECT_PARAMETERS": {}}
+
+
+@override_settings(PAGE_CDN_SECRET="s3cret", PAGE_CDN_DOMAIN="cdn.example.com", **PRIVATE_BUCKET)
+class PageDeliveryTests(SimpleTestCase):
+
+    def test_cdn_signed_url_matches_nginx_secure_link(self):
+        # echo -n '1700000040/chapters/pages/ab/a%20b.webp203.0.113.7 s3cret' | openssl md5 -binary | base64url
+        self.assertEqual(
+            cdn_signed_url("chapters/pages/ab/a b.webp", expires=1700000040, ip="203.0.113.7"),
+            "https://cdn.example.com/chapters/pages/ab/a%20b.webp?md5=Cmpc5rD6beUVYBNxMkftpQ&expires=1700000040",
+        )
+
+    def test_cdn_mode_needs_secret_and_domain(self):
+        with self.settings(PAGE_DELIVERY="cdn"):
+            self.assertEqual(delivery_mode(), "cdn")
+            with self.settings(PAGE_CDN_SECRET=""):
+                self.assertEqual(delivery_mode(), "proxy")
+            with self.settings(PAGE_CDN_DOMAIN="", AWS_S3_CUSTOM_DOMAIN=""):
+                self.assertEqual(delivery_mode(), "proxy")
+            with self.settings(AWS_DEFAULT_ACL="public-read"):
+                self.assertEqual(delivery_mode(), "proxy")
+        with self.settings(PAGE_DELIVERY="presigned"):
+            self.assertEqual(delivery_mode(default_storage), "proxy")  # lokal storage imzolay olmaydi
+
+    def test_public_bucket_fails_system_check(self):
+        with self.settings(PAGE_DELIVERY="cdn", AWS_DEFAULT_ACL="public-read"):
+            self.assertEqual([e.id for e in check_page_delivery()], ["manga.E001"])
+            self.assertIn("manga.E001", [e.id for e in checks.run_checks(tags=[checks.Tags.security])])
+        with self.settings(PAGE_DELIVERY="presigned", AWS_QUERYSTRING_AUTH=False):
+            self.assertEqual([e.id for e in check_page_delivery()], ["manga.E001"])
+        with self.settings(PAGE_DELIVERY="cdn"):
+            self.assertEqual(check_page_delivery(), [])
+        with self.settings(PAGE_DELIVERY="proxy", AWS_DEFAULT_ACL="public-read"):
+            self.assertEqual(check_page_delivery(), [])
+
+
+# =========================== Boblar indeksi ===========================
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ChapterIndexTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.manga = make_manga()
+        # yaratilish tartibi tartiblangan tartib emas: jild 2 oldin
+        for volume, number in ((2, 1), (1, 2), (1, 1), (2, 3)):
+            Chapter.objects.create(manga=self.manga, volume=volume, chapter_number=number)
+
+    def test_order_and_neighbours(self):
+        index = chapter_index(self.manga.id)
+        self.assertEqual([e.key for e in index], [(1, 1), (1, 2), (2, 1), (2, 3)])
+        self.assertEqual([e.key for e in index.desc()], [(2, 3), (2, 1), (1, 2), (1, 1)])
+        self.assertEqual(index.previous(2, 1).key, (1, 2))
+        self.assertEqual(index.next(1, 2).key, (2, 1))  # jild chegarasidan o‘tadi
+
+    def test_both_ends(self):
+        index = chapter_index(self.manga.id)
+        self.assertEqual(index.first().key, (1, 1))
+        self.assertEqual(index.last().key, (2, 3))
+        self.assertIsNone(index.previous(1, 1))
+        self.assertIsNone(index.next(2, 3))
+        self.assertIsNone(index.find(2, 2))
+        self.assertEqual(index.next(2, 2).key, (2, 3))  # indeksda yo‘q bob ham qo‘shnisini topadi
+
+    def test_cached_and_invalidated_on_chapter_change(self):
+        chapter_index(self.manga.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(chapter_index(self.manga.id)), 4)
+
+        Chapter.objects.create(manga=self.manga, volume=3, chapter_number=1)
+        self.assertEqual(chapter_index(self.manga.id).last().key, (3, 1))
+
+        Chapter.objects.filter(manga=self.manga, volume=1, chapter_number=1).get().delete()
+        self.assertEqual(chapter_index(self.manga.id).first().key, (1, 2))
+
+
+# =========================== O‘qish huquqi ===========================
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ChapterAccessTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.author = User.objects.create_user("author")
+        self.buyer = User.objects.create_user("buyer")
+        self.reader = User.objects.create_user("reader")
+        self.staff = User.objects.create_user("staff", is_staff=True)
+        self.translator = User.objects.create_user("translator")
+        self.translator.userprofile.is_translator = True
+        self.translator.userprofile.save()
+
+        self.manga = make_manga(created_by=self.author)
+        self.free = Chapter.objects.create(manga=self.manga, chapter_number=1)
+        self.paid = Chapter.objects.create(manga=self.manga, chapter_number=2, price_tanga=5)
+        self.bought = Chapter.objects.create(manga=self.manga, chapter_number=3, price_tanga=5)
+        ChapterPurchase.objects.create(user=self.buyer, chapter=self.bought)
+        cache.clear()  # xarid keshi on_commit’da tozalanadi — TestCase’da commit yo‘q
+
+    def test_matches_can_read(self):
+        expected = {
+            "guest": {self.free.id},
+            "reader": {self.free.id},
+            "buyer": {self.free.id, self.bought.id},
+            "staff": {self.free.id, self.paid.id, self.bought.id},
+            "author": {self.free.id, self.paid.id, self.bought.id},
+            "translator": {self.free.id, self.paid.id, self.bought.id},
+        }
+        chapters = [self.free, self.paid, self.bought]
+        for label, readable in expected.items():
+            user = AnonymousUser() if label == "guest" else getattr(self, label)
+            with self.subTest(user=label):
+                access = ChapterAccess(user, self.manga)
+                self.assertEqual(access.readable_ids(chapters), readable)
+                for chapter in chapters:
+                    self.assertEqual(access.can_read(chapter), can_read(user, self.manga, chapter))
+
+    def test_accepts_index_entries(self):
+        entries = list(chapter_index(self.manga.id))
+        access = ChapterAccess(self.buyer, self.manga)
+        self.assertEqual(access.readable_ids(entries), {self.free.id, self.bought.id})
+
+    def test_purchases_loaded_once(self):
+        buyer = get_user_model().objects.get(pk=self.buyer.pk)
+        access = ChapterAccess(buyer, self.manga)
+        with self.assertNumQueries(2):  # profil (tarjimonmi) + xaridlar — boblar sonidan qat’i nazar
+            access.readable_ids([self.free, self.paid, self.bought] * 10)
+        with self.assertNumQueries(0):
+            ChapterAccess(buyer, self.manga).purchased
+
+    def test_new_purchase_clears_cache_on_commit(self):
+        self.assertNotIn(self.paid.id, ChapterAccess(self.buyer, self.manga).purchased)
+        with self.captureOnCommitCallbacks(execute=True):
+            ChapterPurchase.objects.create(user=self.buyer, chapter=self.paid)
+        self.assertIsNone(cache.get(purchases_cache_key(self.buyer.id, self.manga.id)))
+        self.assertTrue(ChapterAccess(self.buyer, self.manga).can_read(self.paid))
+
+    def test_purchase_signal_queries_after_commit(self):
+        key = purchases_cache_key(self.buyer.id, self.manga.id)
+        ChapterAccess(self.buyer, self.manga).purchased
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(1):  # faqat INSERT
+            ChapterPurchase.objects.create(user=self.buyer, chapter_id=self.paid.id)
+        self.assertIsNotNone(cache.get(key))
+        with self.assertNumQueries(1):  # bob keshda yo‘q — manga_id commit’dan keyin
+            callbacks[0]()
+        self.assertIsNone(cache.get(key))
@@ -1,6 +1,9 @@
+import mimetypes
 import random
+import re
 from collections import defaultdict
 from datetime import datetime, date, time, timedelta
+from types import SimpleNamespace
 from uuid import uuid4
 from django.db import transaction
 from django.conf import settings
@@ -8,23 +11,30 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.cache import cache
 from django.core.paginator import Paginator
-from django.core.signing import TimestampSigner, BadSignature, SignatureExpired
 from django.db.models import Q, Count, F, Max, Subquery, OuterRef, Prefetch, Avg
-from django.http import HttpResponse, JsonResponse, FileResponse, HttpResponseForbidden
+from django.http import (
+    HttpResponse, JsonResponse, FileResponse, HttpResponseForbidden, Http404, StreamingHttpResponse
+)
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.utils.http import urlencode
 from django.views.decorators.http import require_POST, require_GET
-from manga.service import _is_translator, can_read
+from manga.service import _is_translator
+from manga.services.chapter_index import chapter_index
+from manga.services.entitlements import ChapterAccess
+from manga.services.page_delivery import DELIVERY_PROXY, DirectUrls, delivery_mode
+from manga.services.read_grants import (
+    SUBJECT_SESSION, SUBJECT_VISITOR, cache_page_keys, check_grant, issue_grant, page_etag, resolve_page_key
+)
 from .models import (
-    ChapterAnonVisit, ChapterPurchase, ChapterVisit, Manga, Chapter, Genre, Page, ReadingProgress, Tag,
+    ChapterAnonVisit, ChapterVisit, Manga, Chapter, Genre, Page, ReadingProgress, Tag,
     make_search_key
 )
 from accounts.models import ReadingStatus, TranslatorRating, UserProfile, READING_STATUSES
 from django.utils.http import url_has_allowed_host_and_scheme
 
-signer = TimestampSigner(salt="page-image-v2")
 
 
 def _is_ajax(request) -> bool:
@@ -125,10 +135,6 @@ def _subject_for(request) -> str:
     return str(request.session.session_key)
 
 
-def make_page_token(request, page_id: int) -> str:
-    return signer.sign(f"{_subject_for(request)}:{page_id}")
-
-
 def get_cached_or_query(cache_key, queryset_func, timeout):
     data = cache.get(cache_key)
     if data is None:
@@ -139,50 +145,118 @@ def get_cached_or_query(cache_key, queryset_func, timeout):
 
 # =========================== Protected page image ===========================
 
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _byte_range(header: str, size: int):
+    """
+    Bitta "bytes=a-b" oralig‘i -> (start, end) (end ham kiradi).
+    None — Range yo‘q/tushunarsiz/bir nechta oraliq (to‘liq 200 beriladi), () — qoniqtirib bo‘lmaydi (416).
+    """
+    m = _RANGE_RE.match((header or "").strip())
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    first, last = m.group(1), m.group(2)
+    if not first:  # "bytes=-500" — oxirgi 500 bayt
+        length = int(last)
+        return (max(0, size - length), size - 1) if length and size else ()
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        return ()
+    return start, end
+
+
+def _iter_file_range(f, start: int, length: int, chunk_size: int = 64 * 1024):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def _page_image_headers(resp, *, etag: str, grant) -> None:
+    # Last-Modified yo‘q: grant vaqti rasm vaqti emas — validator faqat ETag (blob nomidan)
+    resp["ETag"] = etag
+    # URL grant’ga bog‘langan va uning ortidagi rasm o‘zgarmaydi: faqat shu brauzer keshi, grant muddatigacha
+    resp["Cache-Control"] = f"private, max-age={grant.remaining()}, immutable"
+    resp["Vary"] = "Cookie"
+    resp["X-Frame-Options"] = "DENY"
+    resp["Referrer-Policy"] = "no-referrer"
+    resp["X-Content-Type-Options"] = "nosniff"
+    resp["Cross-Origin-Resource-Policy"] = "same-origin"
+
+
 @require_GET
 def page_image(request, page_id: int, token: str):
-    # 1) Token
-    try:
-        payload = signer.unsign(token, max_age=600)  # 10 min
-        subject, pid = payload.split(":")
-        if str(page_id) != pid:
-            raise BadSignature
-    except (SignatureExpired, BadSignature):
+    # DB’ga murojaat yo‘q: ruxsat chapter_read bergan grant’da, storage nomi — keshdagi xaritada
+    # 1) Grant (imzo + muddat + cookie egasi)
+    grant = check_grant(request, token)
+    if grant is None:
         return HttpResponseForbidden("Invalid or expired")
 
-    # 2) Token owner
-    if subject != _subject_for(request):
-        return HttpResponseForbidden("Forbidden")
-
-    # 3) Permission
-    page = get_object_or_404(Page, id=page_id)
-    ch = page.chapter
-    if not can_read(request.user, ch.manga, ch):
-        return HttpResponseForbidden("No access")
+    # 2) Sahifa grant bobidanmi + ?w=<eni> — srcset varianti (yo‘q bo‘lsa asl rasm)
+    try:
+        width = int(request.GET.get("w") or 0)
+    except ValueError:
+        width = 0
+    name = resolve_page_key(grant, page_id, width)
+    if name is None:
+        raise Http404("Page not found")
+
+    # 3) If-None-Match -> 304 (grant tekshirilgandan keyin; storage’ga tegmaydi)
+    etag = page_etag(name)
+    content_type = mimetypes.guess_type(name)[0] or "image/webp"
+    resp = HttpResponse(content_type=content_type)
+    _page_image_headers(resp, etag=etag, grant=grant)
+    conditional = get_conditional_response(request, etag=etag, response=resp)
+    if conditional is not resp:
+        return conditional
 
     # 4) Dev/Prod delivery
     if getattr(settings, "USE_X_ACCEL_REDIRECT", False):
+        # Range / If-Range’ni nginx o‘zi bajaradi
         prefix = getattr(settings, "X_ACCEL_REDIRECT_PREFIX", "/_protected/").rstrip("/")
-        internal_path = f"{prefix}/{page.image.name}"
-        resp = HttpResponse()
-        resp["X-Accel-Redirect"] = internal_path
-        resp["Content-Type"] = "image/webp"
-        resp["Cache-Control"] = "private, max-age=120, stale-while-revalidate=30"
-        resp["X-Frame-Options"] = "DENY"
-        resp["Referrer-Policy"] = "no-referrer"
-        resp["X-Content-Type-Options"] = "nosniff"
-        resp["Cross-Origin-Resource-Policy"] = "same-origin"
+        resp["X-Accel-Redirect"] = f"{prefix}/{name}"
         return resp
-    else:
-        f = page.image.open("rb")
-        resp = FileResponse(f, content_type="image/webp")
-        resp["Cache-Control"] = "no-store"
-        resp["X-Frame-Options"] = "DENY"
-        resp["Referrer-Policy"] = "no-referrer"
-        resp["X-Content-Type-Options"] = "nosniff"
-        resp["Cross-Origin-Resource-Policy"] = "same-origin"
+
+    f = Page._meta.get_field("image").storage.open(name, "rb")
+    size = f.size
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if request.headers.get("Range") and (not if_range or if_range == etag):
+        byte_range = _byte_range(request.headers["Range"], size)
+
+    if byte_range == ():
+        f.close()
+        resp.status_code = 416
+        resp["Content-Range"] = f"bytes */{size}"
         return resp
 
+    if byte_range:
+        start, end = byte_range
+        ranged = StreamingHttpResponse(
+            _iter_file_range(f, start, end - start + 1), status=206, content_type=content_type
+        )
+        for header, value in resp.items():
+            ranged[header] = value
+        ranged["Content-Range"] = f"bytes {start}-{end}/{size}"
+        ranged["Content-Length"] = str(end - start + 1)
+        ranged["Accept-Ranges"] = "bytes"
+        return ranged
+
+    full = FileResponse(f, content_type=content_type)
+    for header, value in resp.items():
+        if header != "Content-Length":
+            full[header] = value
+    full["Accept-Ranges"] = "bytes"
+    return full
+
 
 # =========================== Discover feed utils ===========================
 
@@ -652,7 +726,6 @@ def manga_details(request, manga_slug):
             "tags",
             "telegram_links",
             "translators__user",
-            "chapters",
         ),
         slug=manga_slug,
     )
@@ -711,23 +784,23 @@ def manga_details(request, manga_slug):
         )
 
     # -------------------------
-    # Boblar tartibi (QuerySet)
+    # Boblar tartibi (keshdagi indeksdan)
     # -------------------------
-    if order == "asc":
-        chapters_qs = manga.chapters.order_by("volume", "chapter_number")
-    else:
-        chapters_qs = manga.chapters.order_by("-volume", "-chapter_number")
+    index = chapter_index(manga.id)
+    entries = index.entries if order == "asc" else index.desc()
 
-    # Template’da ishlatish uchun atributlar qo‘shib chiqamiz
+    # Template’da ishlatish uchun atributlar qo‘shib chiqamiz (indeks yozuvlari o‘zgarmas — nusxa)
     chapters = []
-    for ch in chapters_qs:
-        ch.can_read = can_read(request.user, manga, ch)
+    access = ChapterAccess(request.user, manga)  # xaridlar bitta so‘rov bilan (keshdan)
+    for entry in entries:
+        ch = SimpleNamespace(**entry._asdict())
+        ch.can_read = access.can_read(ch)
         ch.is_current = (progress_current_chapter_id == ch.id)
         ch.current_page = progress_current_page if ch.is_current else None
         ch.is_visited = (ch.id in visited_chapter_ids)
         chapters.append(ch)
 
-    first_chapter = manga.chapters.order_by("volume", "chapter_number").first()
+    first_chapter = index.first()
 
     # -------------------------
     # Start / Resume tugmasi
@@ -973,8 +1046,9 @@ def chapter_read(request, manga_slug, volume, chapter_number):
     manga = get_object_or_404(Manga, slug=manga_slug)
     chapter = get_object_or_404(Chapter, manga=manga, volume=volume, chapter_number=chapter_number)
 
-    # --- O‘qishga ruxsat tekshiruvi
-    if not can_read(request.user, manga, chapter):
+    # --- O‘qishga ruxsat tekshiruvi (imtiyoz/xaridlar bir marta — pastda ro‘yxat uchun ham)
+    access = ChapterAccess(request.user, manga)
+    if not access.can_read(chapter):
         if not request.user.is_authenticated:
             messages.warning(request, "Bobni o‘qish uchun tizimga kiring!")
             return redirect("accounts:login")
@@ -986,39 +1060,15 @@ def chapter_read(request, manga_slug, volume, chapter_number):
             chapter_number=chapter.chapter_number,
         )
 
-    # --- boblar ro‘yxati
-    all_chapters = list(
-        Chapter.objects
-        .filter(manga=manga)
-        .only("id", "volume", "chapter_number", "price_tanga")
-        .order_by("-volume", "-chapter_number")
-    )
-
-    previous_chapter = (
-        Chapter.objects
-        .filter(manga=manga)
-        .filter(
-            Q(volume=chapter.volume, chapter_number__lt=chapter.chapter_number) |
-            Q(volume__lt=chapter.volume)
-        )
-        .order_by("-volume", "-chapter_number")
-        .first()
-    )
-
-    next_chapter = (
-        Chapter.objects
-        .filter(manga=manga)
-        .filter(
-            Q(volume=chapter.volume, chapter_number__gt=chapter.chapter_number) |
-            Q(volume__gt=chapter.volume)
-        )
-        .order_by("volume", "chapter_number")
-        .first()
-    )
+    # --- boblar ro‘yxati + prev/next — keshdagi indeksdan (bisect, issiq keshda so‘rovsiz)
+    index = chapter_index(manga.id)
+    all_chapters = index.desc()
+    previous_chapter = index.previous(chapter.volume, chapter.chapter_number)
+    next_chapter = index.next(chapter.volume, chapter.chapter_number)
 
     next_chapter_price = None
     if request.user.is_authenticated and next_chapter:
-        if next_chapter.price_tanga > 0 and not can_read(request.user, manga, next_chapter):
+        if next_chapter.price_tanga > 0 and not access.can_read(next_chapter):
             next_chapter_price = next_chapter.price_tanga
 
     # =========================================================
@@ -1059,34 +1109,39 @@ def chapter_read(request, manga_slug, volume, chapter_number):
             .values_list("chapter_id", flat=True)
         )
 
-    pages = list(chapter.pages.all().order_by("page_number"))
+    pages = list(chapter.pages.all().order_by("page_number").prefetch_related("renditions"))
+    storage = Page._meta.get_field("image").storage
+    mode = delivery_mode(storage)
+    direct = None
+    if mode != DELIVERY_PROXY:
+        # cdn/presigned: qisqa muddatli imzolangan URL’lar — baytlar Django’dan o‘tmaydi
+        direct = DirectUrls(mode, storage=storage, request=request)
+    else:
+        # bitta grant butun bob uchun (can_read yuqorida tekshirildi) — page_image DB’siz tekshiradi
+        if request.user.is_authenticated:
+            grant_subject = (SUBJECT_SESSION, request.session.session_key)
+        else:
+            grant_subject = (SUBJECT_VISITOR, vid)
+        grant = issue_grant(chapter.id, cache_page_keys(chapter.id, pages), *grant_subject)
     pages_payload = []
     for p in pages:
-        tok = make_page_token(request, p.id)
-        secure_url = request.build_absolute_uri(reverse("manga:page_image", args=[p.id, tok]))
-        pages_payload.append({"url": secure_url, "alt": f"Sahifa {p.page_number}"})
-
-    purchased_chapters = []
-    if request.user.is_authenticated:
-        purchased_chapters = list(
-            ChapterPurchase.objects
-            .filter(user=request.user, chapter__manga=manga)
-            .values_list("chapter_id", flat=True)
-        )
-
-    is_privileged = (
-        request.user.is_authenticated and (
-            request.user.is_superuser
-            or request.user.is_staff
-            or manga.created_by_id == request.user.id
-            or _is_translator(request.user)
-        )
-    )
-    if is_privileged:
-        readable_chapter_ids = [c.id for c in all_chapters]
-    else:
-        free_ids = [c.id for c in all_chapters if c.price_tanga == 0]
-        readable_chapter_ids = sorted(set(free_ids) | set(purchased_chapters))
+        item = {"alt": f"Sahifa {p.page_number}"}
+        if direct is not None:
+            item["url"], srcset = direct.page(p)
+        else:
+            secure_url = request.build_absolute_uri(reverse("manga:page_image", args=[p.id, grant]))
+            item["url"] = secure_url
+            # eni variantlari bo‘lsa — brauzer srcset’dan ekranga mosini tanlaydi (bitta token)
+            srcset = ", ".join(f"{secure_url}?w={r.width} {r.width}w" for r in p.renditions.all())
+        if srcset:
+            item["srcset"] = srcset
+        if p.width and p.height:
+            # intrinsic o‘lcham: rasm kelguncha joy ajratiladi (sahifa sakramaydi)
+            item["w"], item["h"] = p.width, p.height
+        pages_payload.append(item)
+
+    purchased_chapters = sorted(access.purchased)
+    readable_chapter_ids = access.readable_ids(all_chapters)
 
     is_last_chapter = (next_chapter is None)
 